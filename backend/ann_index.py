@@ -0,0 +1,208 @@
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.neighbors import NearestNeighbors
+
+
+def normalize_rows(X):
+    """L2-normalize the rows of X as float32; zero rows stay zero."""
+    X = np.asarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """Approximate cosine nearest neighbors with an inverted-file index.
+
+    The vectors are clustered with spherical k-means into n_lists lists. A
+    query only scans the n_probe lists whose centroids are closest to it, so
+    raising n_probe trades latency for recall (n_probe == n_lists is exact).
+    kneighbors() mirrors sklearn's NearestNeighbors with metric='cosine', so
+    the index can stand in for the brute-force model.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def fit(self, X):
+        vectors = normalize_rows(X)
+        n = len(vectors)
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.random_state)
+
+        # Train the centroids on a sample, then assign every vector
+        sample = vectors[rng.choice(n, size=min(n, 64 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assign = self._assign(sample, centroids)
+            members = sparse.csr_matrix(
+                (np.ones(len(sample), dtype=np.float32), (assign, np.arange(len(sample)))),
+                shape=(n_lists, len(sample))
+            )
+            sums = np.asarray(members @ sample)
+            empty = np.bincount(assign, minlength=n_lists) == 0
+            sums[empty] = sample[rng.choice(len(sample), size=empty.sum())]
+            centroids = normalize_rows(sums)
+
+        assign = self._assign(vectors, centroids)
+        order = np.argsort(assign, kind='stable')
+        self.centroids = centroids
+        self.list_offsets = np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64)
+        self.ids = order.astype(np.int64)
+        self.vectors = vectors[order]
+        return self
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk=65536):
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            assign[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+        return assign
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True, n_probe=None):
+        """Return (distances, indices) of the approximate nearest neighbors."""
+        queries = normalize_rows(np.atleast_2d(X))
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        k = min(n_neighbors, len(self.ids))
+
+        list_sizes = np.diff(self.list_offsets)
+        probe_order = np.argsort(-(queries @ self.centroids.T), axis=1)
+        distances = np.empty((len(queries), k))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        for q, query in enumerate(queries):
+            # Probe more lists if the nearest ones hold fewer than k vectors
+            n_lists = n_probe
+            while list_sizes[probe_order[q, :n_lists]].sum() < k:
+                n_lists += 1
+            rows = np.concatenate([
+                np.arange(self.list_offsets[l], self.list_offsets[l + 1])
+                for l in probe_order[q, :n_lists]
+            ])
+            sims = self.vectors[rows] @ query
+            top = np.argpartition(-sims, k - 1)[:k] if len(sims) > k else np.arange(len(sims))
+            top = top[np.argsort(-sims[top], kind='stable')]
+            distances[q] = 1.0 - sims[top]
+            indices[q] = self.ids[rows[top]]
+
+        return (distances, indices) if return_distance else indices
+
+    def remapped(self, remap, new_ids, new_vectors):
+        """A copy with ids renumbered through remap and new vectors added.
+
+        remap maps every current id to its new id, or to -1 to drop it.
+        New vectors join the list of their closest centroid; the centroids
+        themselves are kept, so no clustering is redone.
+        """
+        keep = remap[self.ids] >= 0
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))[keep]
+        vectors = normalize_rows(new_vectors) if len(new_ids) else self.vectors[:0]
+        lists = np.concatenate((lists, self._assign(vectors, self.centroids)))
+        order = np.argsort(lists, kind='stable')
+
+        index = IVFIndex(n_lists=len(self.centroids), n_probe=self.n_probe,
+                         n_iter=self.n_iter, random_state=self.random_state)
+        index.centroids = self.centroids
+        index.list_offsets = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1)).astype(np.int64)
+        index.ids = np.concatenate((remap[self.ids][keep], np.asarray(new_ids, dtype=np.int64)))[order]
+        index.vectors = np.concatenate((self.vectors[keep], vectors.astype(self.vectors.dtype)))[order]
+        return index
+
+    def arrays(self):
+        """The fitted index as arrays, e.g. for sharing between processes."""
+        return {'centroids': self.centroids, 'list_offsets': self.list_offsets,
+                'ids': self.ids, 'vectors': self.vectors}
+
+    @classmethod
+    def from_arrays(cls, arrays, n_probe=8):
+        """An index over arrays from arrays(), without fitting anything."""
+        index = cls(n_lists=len(arrays['centroids']), n_probe=n_probe)
+        index.centroids = arrays['centroids']
+        index.list_offsets = arrays['list_offsets']
+        index.ids = arrays['ids']
+        index.vectors = arrays['vectors']
+        return index
+
+    def save(self, path):
+        np.savez(path, n_probe=self.n_probe, **self.arrays())
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls.from_arrays(data, n_probe=int(data['n_probe']))
+
+    @property
+    def nbytes(self):
+        return self.centroids.nbytes + self.list_offsets.nbytes + self.ids.nbytes + self.vectors.nbytes
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _recall(X, queries, expected_distances, found, k):
+    """Fraction of found neighbors that are as close as the exact k-th neighbor.
+
+    Items with identical latent vectors tie, so a neighbor counts as a hit
+    when its exact distance is no larger than the k-th exact distance.
+    """
+    vectors = normalize_rows(X)
+    found_distances = 1.0 - np.einsum('qd,qkd->qk', vectors[queries], vectors[found])
+    threshold = expected_distances[:, -1:] + 1e-6
+    return float(np.mean(found_distances <= threshold))
+
+
+def recall_at_k(index, X, queries, k=5):
+    """Recall@k of the index against exact cosine kNN, for the given query rows."""
+    exact = NearestNeighbors(n_neighbors=k, metric='cosine').fit(X)
+    expected_distances, _ = exact.kneighbors(X[queries], n_neighbors=k)
+    found = index.kneighbors(X[queries], n_neighbors=k, return_distance=False)
+    return _recall(X, queries, expected_distances, found, k)
+
+
+def recall_report(X, n_lists=None, probes=(1, 2, 4, 8, 16, 32), k=5, n_queries=500, random_state=42):
+    """Recall@k and per-query latency of an IVF index over X for several n_probe values."""
+    rng = np.random.default_rng(random_state)
+    queries = rng.choice(len(X), size=min(n_queries, len(X)), replace=False)
+    exact = NearestNeighbors(n_neighbors=k, metric='cosine').fit(X)
+    start = time.perf_counter()
+    expected_distances, _ = exact.kneighbors(X[queries], n_neighbors=k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    index = IVFIndex(n_lists=n_lists, random_state=random_state).fit(X)
+    rows = []
+    for n_probe in probes:
+        start = time.perf_counter()
+        found = index.kneighbors(X[queries], n_neighbors=k, return_distance=False, n_probe=n_probe)
+        elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = _recall(X, queries, expected_distances, found, k)
+        rows.append({'n_probe': n_probe, 'recall': recall, 'ms_per_query': elapsed})
+    return {'n_lists': len(index.centroids), 'exact_ms_per_query': exact_ms, 'probes': rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report IVF recall@k against exact kNN for a domain's catalog.")
+    parser.add_argument('--domain', default='movie', choices=['book', 'anime', 'movie'])
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--save', help="write the fitted index (n_probe from --probe) to this .npz path")
+    parser.add_argument('--probe', type=int, default=8)
+    args = parser.parse_args()
+
+    import app as recommender
+    df = recommender.get_dataset(args.domain)
+    latent_matrix, _ = recommender.build_model(df, args.domain, knn_backend='exact')
+
+    report = recall_report(latent_matrix, n_lists=args.lists, k=args.k)
+    print(f"{args.domain}: {len(latent_matrix)} items, {report['n_lists']} lists, "
+          f"exact {report['exact_ms_per_query']:.3f} ms/query")
+    for row in report['probes']:
+        print(f"  n_probe={row['n_probe']:<3} recall@{args.k}={row['recall']:.3f} {row['ms_per_query']:.3f} ms/query")
+
+    if args.save:
+        IVFIndex(n_lists=args.lists, n_probe=args.probe).fit(latent_matrix).save(args.save)
+        print(f"Saved index to {args.save}")
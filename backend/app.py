@@ -1,18 +1,195 @@
 import pandas as pd
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import NearestNeighbors
+from sklearn.base import clone
 from scipy.linalg import svd
+from scipy import sparse
+from sklearn.utils.extmath import randomized_svd
+from model_cache import ModelCache, estimate_nbytes
+from result_cache import ResultCache
+from pagination import CursorExpired, InvalidCursor, decode_cursor, encode_cursor
+from genre_index import GenreIndex
+from title_index import TitleIndex, OverlayTitleIndex, normalize_title
+from ann_index import IVFIndex
+from sharded_knn import ShardedKNN, shutdown_pools
+from global_model import GlobalLatentModel
+from catalog import CatalogVersion, compact_catalog, frame_nbytes
+from serializer import format_recommendations, json_response, encode_json, entity_tag, etag_matches
+from metrics import Metrics, start_request_timings, server_timing
+from executor import RecommendationExecutor, ExecutorBusy, ExecutorTimeout
+from registry import DatasetRegistry, DatasetUnavailable
+from snapshots import load_snapshot
+from neighbor_table import load_neighbor_table
+from popularity import PopularityCube
+from catalog_updates import ANIME_CSV_COLUMNS, CatalogLog, LatentProjection, apply_rows, merge_rows, split_genres
+from shared_arrays import SharedStore, frame_fingerprint, share_catalog, store_key
+from ingest_imdb import ingest_title_basics
 import os
+import contextlib
+import functools
+import hmac
+import itertools
+import threading
+import time
 import warnings
+import weakref
 warnings.filterwarnings('ignore')
 
 app = FastAPI()
 
+# Cache of fitted models keyed by (domain, mood, era, genre, dataset version)
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get('MODEL_CACHE_MAX_ENTRIES', 64))
+MODEL_CACHE_MAX_BYTES = int(os.environ.get('MODEL_CACHE_MAX_MB', 512)) * 1024 * 1024
+model_cache = ModelCache(max_entries=MODEL_CACHE_MAX_ENTRIES, max_bytes=MODEL_CACHE_MAX_BYTES)
+
+# Cache of encoded recommendation responses keyed by (domain, normalized
+# titles, mood, era, genre, data version); identical requests in flight at
+# the same time share one computation. RESULT_MAX_AGE is the max-age sent
+# in Cache-Control; after it clients revalidate GET /recommendations/{domain}
+# responses with their ETag (POST responses are private and never 304)
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 4096))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 300))
+RESULT_MAX_AGE = int(os.environ.get('RESULT_MAX_AGE', 60))
+result_cache = ResultCache(max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL)
+
+# SVD settings: 'full', 'truncated' (randomized, sparse input) or 'auto'
+SVD_MODE = os.environ.get('SVD_MODE', 'auto')
+SVD_TRUNCATED_MIN_ROWS = int(os.environ.get('SVD_TRUNCATED_MIN_ROWS', 5000))
+SVD_COMPONENTS = int(os.environ.get('SVD_COMPONENTS', 50))
+SVD_OVERSAMPLING = int(os.environ.get('SVD_OVERSAMPLING', 50))
+SVD_POWER_ITERATIONS = int(os.environ.get('SVD_POWER_ITERATIONS', 7))
+SVD_RANDOM_STATE = int(os.environ.get('SVD_RANDOM_STATE', 42))
+
+# Nearest neighbor backend: 'exact', 'ivf' (approximate), 'sharded' or 'auto'
+KNN_BACKEND = os.environ.get('KNN_BACKEND', 'exact')
+ANN_MIN_ROWS = int(os.environ.get('ANN_MIN_ROWS', 50000))
+ANN_LISTS = int(os.environ.get('ANN_LISTS', 0)) or None
+ANN_PROBE = int(os.environ.get('ANN_PROBE', 8))
+# 'sharded' answers exact queries of models with KNN_SHARD_MIN_ROWS rows or
+# more from KNN_SHARDS worker processes (default: one per CPU), each scanning
+# a slice of the latent vectors written under KNN_SHARD_DIR (default: the
+# temp directory; /dev/shm keeps them in memory). A query the workers do not
+# answer within KNN_SHARD_TIMEOUT seconds is scanned in the calling process
+KNN_SHARDS = int(os.environ.get('KNN_SHARDS', 0)) or None
+KNN_SHARD_MIN_ROWS = int(os.environ.get('KNN_SHARD_MIN_ROWS', 50000))
+KNN_SHARD_DIR = os.environ.get('KNN_SHARD_DIR', '') or None
+KNN_SHARD_TIMEOUT = float(os.environ.get('KNN_SHARD_TIMEOUT', 10))
+
+# 'per_filter' fits a model on every filtered subset, 'global' factorizes each
+# catalog once and applies the filters as a mask over its latent vectors
+MODEL_MODE = os.environ.get('MODEL_MODE', 'per_filter')
+
+# Where CPU-bound recommendation work runs: 'thread', 'process' or 'inline'
+RECOMMENDER_EXECUTOR = os.environ.get('RECOMMENDER_EXECUTOR', 'thread')
+RECOMMENDER_WORKERS = int(os.environ.get('RECOMMENDER_WORKERS', 0)) or None
+RECOMMENDER_MAX_PENDING = int(os.environ.get('RECOMMENDER_MAX_PENDING', 32))
+RECOMMENDER_TIMEOUT = float(os.environ.get('RECOMMENDER_TIMEOUT', 30))
+RECOMMENDER_MAX_BATCH = int(os.environ.get('RECOMMENDER_MAX_BATCH', 1000))
+
+# Results per page when a request sets no limit, and how deep a query is
+# ranked; pages and cursors slice that ranking, which is computed once per
+# query and catalog version and kept in the ranking cache. NDJSON streams
+# are sent RECOMMENDATIONS_STREAM_CHUNK results at a time
+RECOMMENDATIONS_LIMIT = int(os.environ.get('RECOMMENDATIONS_LIMIT', 5))
+RECOMMENDATIONS_MAX_RESULTS = int(os.environ.get('RECOMMENDATIONS_MAX_RESULTS', 200))
+RECOMMENDATIONS_STREAM_CHUNK = int(os.environ.get('RECOMMENDATIONS_STREAM_CHUNK', 20))
+RANKING_CACHE_MAX_ENTRIES = int(os.environ.get('RANKING_CACHE_MAX_ENTRIES', 1024))
+
+# Domains served by this worker, and when their catalogs are loaded: 'background'
+# (after startup, without blocking it), 'lazy' (on first request) or 'eager'
+RECOMMENDER_DOMAINS = [d.strip() for d in os.environ.get('RECOMMENDER_DOMAINS', 'book,anime,movie').split(',') if d.strip()]
+DATASET_PRELOAD = os.environ.get('DATASET_PRELOAD', 'background')
+# Filter combinations pre-built once a domain is loaded, as ';'-separated
+# 'mood:era:genre' entries where an empty part means no filter
+WARMUP_FILTERS = [
+    tuple(part or None for part in (entry.split(':') + ['', ''])[:3])
+    for entry in os.environ.get('WARMUP_FILTERS', '::').split(';') if entry
+]
+
+# 'compact' stores catalogs with categorical strings and narrow numerics and
+# keeps latent matrices as float32; 'default' keeps pandas' default dtypes
+CATALOG_MODE = os.environ.get('CATALOG_MODE', 'default')
+
+# Per-stage latency histograms served at /metrics; SERVER_TIMING=1 also
+# returns each request's stage timings in a Server-Timing header
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+metrics = Metrics(enabled=METRICS_ENABLED)
+
+# Columnar snapshots written by snapshots.py; an empty value disables them
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'snapshots'))
+
+# Neighbor tables precomputed by neighbor_table.py answer single-title
+# requests without a model; an empty value disables them
+NEIGHBOR_DIR = os.environ.get('NEIGHBOR_DIR', os.path.join(os.path.dirname(__file__), 'neighbors'))
+
+# Titles no catalog title contains are matched up to typos: the catalog
+# title closest to one, scoring at least FUZZY_THRESHOLD (1 - edits / title
+# length), is used. A lookup gives up after FUZZY_BUDGET_MS with the best
+# match found so far; FUZZY_TITLES=0 disables it
+FUZZY_TITLES = os.environ.get('FUZZY_TITLES', '1') == '1'
+FUZZY_THRESHOLD = float(os.environ.get('FUZZY_THRESHOLD', 0.8))
+FUZZY_BUDGET_MS = float(os.environ.get('FUZZY_BUDGET_MS', 5))
+
+# Rows of a raw IMDb title.basics.tsv kept when it is ingested at startup, as
+# a uniform sample; 0 keeps every row
+MOVIE_SAMPLE_SIZE = int(os.environ.get('MOVIE_SAMPLE_SIZE', 100000))
+
+# Rows kept per (mood, era, genre) cell of the popularity cube, which serves
+# the popular items of a request's filters when none of its titles match
+POPULAR_DEPTH = int(os.environ.get('POPULAR_DEPTH', RECOMMENDATIONS_MAX_RESULTS))
+
+# Items upserted or removed through /catalog are folded into the fitted
+# latent spaces; the catalog is refactorized in the background once the
+# changed share of it (see CatalogLog.drift) reaches REFIT_DRIFT
+REFIT_DRIFT = float(os.environ.get('REFIT_DRIFT', 0.1))
+
+# Endpoints that change what is served need ADMIN_TOKEN, sent as
+# 'Authorization: Bearer <token>'; without one configured they are refused.
+# The /catalog endpoints are also off unless CATALOG_UPDATES=1
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+CATALOG_UPDATES = os.environ.get('CATALOG_UPDATES', '0') == '1'
+
+# Directory through which worker processes share read-only arrays as
+# memory-mapped files: numeric catalog columns, genre bitmasks, title index
+# arrays and fitted latent matrices (e.g. a directory under /dev/shm); the
+# first worker to need them builds them. An empty value disables sharing
+SHARED_DIR = os.environ.get('SHARED_DIR', '')
+
+# Fitted models (latent matrices, IVF lists and the fold-in projection) are
+# stored in MODEL_DIR keyed by a hash of the catalog and the model settings,
+# so a restarted server maps them instead of refitting; point it at a cache
+# directory to enable it. Artifacts of replaced catalog contents are removed
+# and refitted in the background, and beyond MODEL_STORE_MAX_ENTRIES models
+# or MODEL_STORE_MAX_MB the least recently used ones are removed. Without a
+# MODEL_DIR, workers share models through SHARED_DIR (with the same limits)
+MODEL_DIR = os.environ.get('MODEL_DIR', '')
+MODEL_STORE_MAX_ENTRIES = int(os.environ.get('MODEL_STORE_MAX_ENTRIES', 256))
+MODEL_STORE_MAX_BYTES = int(os.environ.get('MODEL_STORE_MAX_MB', 2048)) * 1024 * 1024
+store_limits = {'max_entries': MODEL_STORE_MAX_ENTRIES, 'max_bytes': MODEL_STORE_MAX_BYTES,
+                'evictable': lambda tags: 'model' in tags}
+shared_store = SharedStore(SHARED_DIR, **store_limits) if SHARED_DIR else None
+model_store = SharedStore(MODEL_DIR, **store_limits) if MODEL_DIR else shared_store
+
+# Ranked results of recent queries, see ranked_items()
+ranking_cache = ResultCache(max_entries=RANKING_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL)
+
+# Every (re)load of a dataset gets a new version so stale models are never reused
+_dataset_version_counter = itertools.count(1)
+# The CatalogVersion serving each domain, replaced as a whole on every change
+app.catalogs = {}
+# Replaced versions still used by running requests; they drop out once freed
+app.retired_catalogs = weakref.WeakSet()
+# State of the last reload of each domain, see schedule_reload()
+app.reloads = {}
+_reload_lock = threading.Lock()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -172,102 +349,517 @@ movie_genre_mapping = {
     'family': 'Family'
 }
 
+def init_worker():
+    """Prepare a process pool worker; catalogs it did not inherit load on first use."""
+    registry.reset_after_fork()
+
+executor = RecommendationExecutor(
+    mode=RECOMMENDER_EXECUTOR, max_workers=RECOMMENDER_WORKERS,
+    max_pending=RECOMMENDER_MAX_PENDING, timeout=RECOMMENDER_TIMEOUT,
+    initializer=init_worker
+)
+
+def build_catalog(domain, df, genre_index=None, source='sample'):
+    """Build a new version of a domain's catalog and its indexes, without installing it.
+
+    source records where the data came from ('snapshot', 'csv', 'raw' or
+    'sample'); a snapshot passes its pre-parsed genre_index along.
+    """
+    if CATALOG_MODE == 'compact':
+        df = compact_catalog(df)
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    # Keys stored models and shared arrays to the catalog contents
+    fingerprint = frame_fingerprint(df) if shared_store is not None or model_store is not None else None
+    if shared_store is not None:
+        # Workers loading the same data map one copy of its arrays
+        df, genre_index, title_index = share_catalog(
+            shared_store, store_key(domain, 'catalog', fingerprint), df, genre_col, genre_index,
+            {'domain': domain, 'fingerprint': fingerprint, 'kind': 'catalog'}
+        )
+    else:
+        # Parse the genre strings once so filters become bitwise operations
+        if genre_index is None:
+            genre_index = GenreIndex.from_series(df[genre_col])
+        title_index = TitleIndex(df['title'])
+    return CatalogVersion(
+        domain, df, next(_dataset_version_counter), source, genre_index, title_index,
+        neighbor_table=load_neighbor_table(NEIGHBOR_DIR, domain, df, latent_params()),
+        log=CatalogLog(len(df), genre_index.vocabulary), fingerprint=fingerprint,
+        popularity=build_popularity(domain, df, genre_index)
+    )
+
+def install_catalog(catalog):
+    """Make catalog the version serving its domain.
+
+    The swap is a single assignment: requests that already took the old
+    version finish on it, and it is freed once the last of them is done.
+    """
+    domain = catalog.domain
+    old = app.catalogs.get(domain)
+    app.catalogs[domain] = catalog
+    setattr(app, f"{domain}_df", catalog.df)
+    registry.mark_ready(domain)
+    if old is not None and old.version != catalog.version:
+        app.retired_catalogs.add(old)
+        # Models fitted on older versions can never be hit again
+        model_cache.invalidate(lambda key: key[0] == domain and key[-1] < catalog.version)
+    # Responses are keyed by data version, which also changes with every update
+    result_cache.invalidate(lambda key: key[0] == domain and key[-1] != catalog.data_version)
+    ranking_cache.invalidate(lambda key: key[0] == domain and key[-1] != catalog.data_version)
+    if catalog.fingerprint is not None and catalog.seq == 0:
+        prune_artifacts(catalog)
+    return catalog
+
+def prune_artifacts(catalog):
+    """Remove stored models and arrays of other contents of catalog's domain and refit those models."""
+    stale = lambda tags: tags.get('domain') == catalog.domain and tags.get('fingerprint') != catalog.fingerprint
+    models = [tags['model'] for tags in model_store.prune(stale) if 'model' in tags] if model_store else []
+    if shared_store is not None and shared_store is not model_store:
+        shared_store.prune(stale)
+    # Only the models this mode serves are refitted
+    models = [parts for parts in models if (parts == ['global']) == (MODEL_MODE == 'global')]
+    if models:
+        threading.Thread(target=refit_artifacts, args=(catalog, models),
+                         name=f"artifacts-{catalog.domain}", daemon=True).start()
+
+def refit_artifacts(catalog, models):
+    """Fit and store the listed models of catalog while it is being served."""
+    start = time.perf_counter()
+    for parts in models:
+        if not is_current(catalog):
+            return
+        try:
+            if parts == ['global']:
+                get_global_model(catalog)
+            else:
+                get_model(catalog, *parts)
+        except Exception as e:
+            print(f"Error refitting {catalog.domain} model {parts}: {e}")
+    print(f"Refitted {len(models)} stored {catalog.domain} models in {time.perf_counter() - start:.1f}s")
+
+def set_dataset(domain, df, genre_index=None, source='sample'):
+    """Install a dataset for a domain as a new version."""
+    return install_catalog(build_catalog(domain, df, genre_index, source))
+
+def is_current(catalog):
+    """Whether catalog is its domain's installed version (or a newer one being warmed up)."""
+    current = app.catalogs.get(catalog.domain)
+    return current is None or catalog.version >= current.version
+
 # Load the datasets
-@app.on_event("startup")
-async def startup_db_client():
+def load_book_dataset():
+    # Set base path for data files
+    base_path = os.path.join(os.path.dirname(__file__), '')
+    
+    # Load Book Dataset
+    book_processed_path = os.path.join(base_path, 'book_processed.csv')
+    book_df, book_genres = load_snapshot(SNAPSHOT_DIR, 'book', book_processed_path)
+    if book_df is not None:
+        catalog = build_catalog('book', book_df, book_genres, source='snapshot')
+        print(f"Loaded book dataset with {len(catalog)} records from snapshot")
+    elif os.path.exists(book_processed_path):
+        catalog = build_catalog('book', pd.read_csv(book_processed_path), source='csv')
+        print(f"Loaded book dataset with {len(catalog)} records")
+    else:
+        print(f"Book dataset not found at {book_processed_path}")
+        # Create a small sample dataset if the real data can't be loaded
+        catalog = build_catalog('book', pd.DataFrame({
+            'item_id': ['1', '2', '3', '4', '5'],
+            'title': ['To Kill a Mockingbird', '1984', 'The Great Gatsby', 'Pride and Prejudice', 'The Catcher in the Rye'],
+            'author': ['Harper Lee', 'George Orwell', 'F. Scott Fitzgerald', 'Jane Austen', 'J.D. Salinger'],
+            'genres': ['Fiction,Classics', 'Fiction,Science Fiction,Classics', 'Fiction,Classics', 'Fiction,Classics,Romance', 'Fiction,Classics'],
+            'avg_rating': [4.3, 4.2, 3.9, 4.3, 3.8],
+            'num_votes': [4000, 3500, 3200, 2800, 2500],
+            'domain': ['book', 'book', 'book', 'book', 'book'],
+            'img': ['https://images-na.ssl-images-amazon.com/images/I/81f7o6uZjFL.jpg', 
+                    'https://images-na.ssl-images-amazon.com/images/I/71kxa1-0mfL.jpg',
+                    'https://images-na.ssl-images-amazon.com/images/I/71FTb9X6wsL.jpg', 
+                    'https://images-na.ssl-images-amazon.com/images/I/71Q1tPupKjL.jpg', 
+                    'https://images-na.ssl-images-amazon.com/images/I/91HPG31dTwL.jpg']
+        }))
+    return catalog
+
+def load_anime_dataset():
+    # Set base path for data files
+    base_path = os.path.join(os.path.dirname(__file__), '')
+    
+    # Load Anime Dataset
+    anime_processed_path = os.path.join(base_path, 'anime_processed.csv')
+    anime_df, anime_genres = load_snapshot(SNAPSHOT_DIR, 'anime', anime_processed_path)
+    if anime_df is not None:
+        # Snapshots hold the already preprocessed frame
+        catalog = build_catalog('anime', anime_df, anime_genres, source='snapshot')
+        print(f"Loaded anime dataset with {len(catalog)} records from snapshot")
+    elif os.path.exists(anime_processed_path):
+        anime_df = pd.read_csv(anime_processed_path)
+        # Preprocess fields specifically for anime
+        anime_df['genre'] = anime_df['genre'].fillna('Unknown')
+        anime_df['avg_rating'] = anime_df['avg_rating'].fillna(0)
+        anime_df['num_votes'] = anime_df['scored_by'].fillna(0)
+        anime_df['item_id'] = anime_df['anime_id']
+        anime_df['author'] = anime_df['studio']
+        catalog = build_catalog('anime', anime_df, source='csv')
+        print(f"Loaded anime dataset with {len(catalog)} records")
+    else:
+        print(f"Anime dataset not found at {anime_processed_path}")
+        # Create a small sample dataset if the real data can't be loaded
+        catalog = build_catalog('anime', pd.DataFrame({
+            'item_id': ['1', '2', '3', '4', '5'],
+            'anime_id': ['1', '2', '3', '4', '5'],
+            'title': ['Death Note', 'Full Metal Alchemist', 'Attack on Titan', 'One Punch Man', 'My Hero Academia'],
+            'studio': ['Madhouse', 'Bones', 'Wit Studio', 'Madhouse', 'Bones'],
+            'genre': ['Mystery,Psychological,Thriller', 'Action,Adventure,Fantasy', 'Action,Drama,Fantasy', 'Action,Comedy,Sci-Fi', 'Action,Comedy,School'],
+            'avg_rating': [8.6, 9.0, 8.5, 8.7, 8.2],
+            'scored_by': [1500000, 1400000, 1300000, 1200000, 1100000],
+            'num_votes': [1500000, 1400000, 1300000, 1200000, 1100000],
+            'image_url': ['https://cdn.myanimelist.net/images/anime/9/9453.jpg',
+                         'https://cdn.myanimelist.net/images/anime/10/75815.jpg',
+                         'https://cdn.myanimelist.net/images/anime/10/47347.jpg',
+                         'https://cdn.myanimelist.net/images/anime/12/76049.jpg',
+                         'https://cdn.myanimelist.net/images/anime/10/78745.jpg'],
+            'aired_from_year': [2006, 2009, 2013, 2015, 2016],
+            'domain': ['anime', 'anime', 'anime', 'anime', 'anime']
+        }))
+    return catalog
+
+def load_movie_dataset():
     try:
         # Set base path for data files
         base_path = os.path.join(os.path.dirname(__file__), '')
         
-        # Load Book Dataset
-        book_processed_path = os.path.join(base_path, 'book_processed.csv')
-        if os.path.exists(book_processed_path):
-            app.book_df = pd.read_csv(book_processed_path)
-            print(f"Loaded book dataset with {len(app.book_df)} records")
-        else:
-            print(f"Book dataset not found at {book_processed_path}")
-            # Create a small sample dataset if the real data can't be loaded
-            app.book_df = pd.DataFrame({
-                'item_id': ['1', '2', '3', '4', '5'],
-                'title': ['To Kill a Mockingbird', '1984', 'The Great Gatsby', 'Pride and Prejudice', 'The Catcher in the Rye'],
-                'author': ['Harper Lee', 'George Orwell', 'F. Scott Fitzgerald', 'Jane Austen', 'J.D. Salinger'],
-                'genres': ['Fiction,Classics', 'Fiction,Science Fiction,Classics', 'Fiction,Classics', 'Fiction,Classics,Romance', 'Fiction,Classics'],
-                'avg_rating': [4.3, 4.2, 3.9, 4.3, 3.8],
-                'num_votes': [4000, 3500, 3200, 2800, 2500],
-                'domain': ['book', 'book', 'book', 'book', 'book'],
-                'img': ['https://images-na.ssl-images-amazon.com/images/I/81f7o6uZjFL.jpg', 
-                        'https://images-na.ssl-images-amazon.com/images/I/71kxa1-0mfL.jpg',
-                        'https://images-na.ssl-images-amazon.com/images/I/71FTb9X6wsL.jpg', 
-                        'https://images-na.ssl-images-amazon.com/images/I/71Q1tPupKjL.jpg', 
-                        'https://images-na.ssl-images-amazon.com/images/I/91HPG31dTwL.jpg']
-            })
-        
-        # Load Anime Dataset
-        anime_processed_path = os.path.join(base_path, 'anime_processed.csv')
-        if os.path.exists(anime_processed_path):
-            app.anime_df = pd.read_csv(anime_processed_path)
-            # Preprocess fields specifically for anime
-            app.anime_df['genre'] = app.anime_df['genre'].fillna('Unknown')
-            app.anime_df['avg_rating'] = app.anime_df['avg_rating'].fillna(0)
-            app.anime_df['num_votes'] = app.anime_df['scored_by'].fillna(0)
-            app.anime_df['item_id'] = app.anime_df['anime_id']
-            app.anime_df['author'] = app.anime_df['studio']
-            print(f"Loaded anime dataset with {len(app.anime_df)} records")
-        else:
-            print(f"Anime dataset not found at {anime_processed_path}")
-            # Create a small sample dataset if the real data can't be loaded
-            app.anime_df = pd.DataFrame({
-                'item_id': ['1', '2', '3', '4', '5'],
-                'anime_id': ['1', '2', '3', '4', '5'],
-                'title': ['Death Note', 'Full Metal Alchemist', 'Attack on Titan', 'One Punch Man', 'My Hero Academia'],
-                'studio': ['Madhouse', 'Bones', 'Wit Studio', 'Madhouse', 'Bones'],
-                'genre': ['Mystery,Psychological,Thriller', 'Action,Adventure,Fantasy', 'Action,Drama,Fantasy', 'Action,Comedy,Sci-Fi', 'Action,Comedy,School'],
-                'avg_rating': [8.6, 9.0, 8.5, 8.7, 8.2],
-                'scored_by': [1500000, 1400000, 1300000, 1200000, 1100000],
-                'image_url': ['https://cdn.myanimelist.net/images/anime/9/9453.jpg',
-                             'https://cdn.myanimelist.net/images/anime/10/75815.jpg',
-                             'https://cdn.myanimelist.net/images/anime/10/47347.jpg',
-                             'https://cdn.myanimelist.net/images/anime/12/76049.jpg',
-                             'https://cdn.myanimelist.net/images/anime/10/78745.jpg'],
-                'aired_from_year': [2006, 2009, 2013, 2015, 2016],
-                'domain': ['anime', 'anime', 'anime', 'anime', 'anime']
-            })
-        
-        # Load Movie Dataset
+        # Path to the original and processed movie data
+        movie_raw_path = os.path.join(base_path, 'title.basics.tsv')
         movie_processed_path = os.path.join(base_path, 'movie_processed.csv')
-        if os.path.exists(movie_processed_path):
-            app.movie_df = pd.read_csv(movie_processed_path)
-            print(f"Loaded movie dataset with {len(app.movie_df)} records")
+        
+        movie_df, movie_genres = load_snapshot(SNAPSHOT_DIR, 'movie', movie_processed_path)
+        if movie_df is not None:
+            catalog = build_catalog('movie', movie_df, movie_genres, source='snapshot')
+            print(f"Loaded movie dataset with {len(catalog)} records from snapshot")
+        elif os.path.exists(movie_processed_path):
+            # Load preprocessed data if available
+            catalog = build_catalog('movie', pd.read_csv(movie_processed_path), source='csv')
+            print(f"Loaded movie dataset with {len(catalog)} records")
+        elif os.path.exists(movie_raw_path):
+            print(f"Processing raw movie/TV dataset from {movie_raw_path}...")
+            # Process raw data if the processed file doesn't exist; running
+            # ingest_imdb.py ahead of time keeps this out of server startup
+            stats = ingest_title_basics(movie_raw_path, movie_processed_path, sample_size=MOVIE_SAMPLE_SIZE)
+            print(f"Ingested {stats['rows_read']} raw rows in {stats['seconds']:.1f}s")
+            catalog = build_catalog('movie', pd.read_csv(movie_processed_path), source='raw')
+            
+            print(f"Processed and loaded movie dataset with {len(catalog)} records")
         else:
-            print(f"Movie dataset not found at {movie_processed_path}")
+            print(f"Movie dataset not found at {movie_raw_path}")
             # Create a small sample dataset if the real data can't be loaded
-            app.movie_df = pd.DataFrame({
+            catalog = build_catalog('movie', pd.DataFrame({
                 'item_id': ['tt0111161', 'tt0068646', 'tt0071562', 'tt0468569', 'tt0050083'],
                 'title': ['The Shawshank Redemption', 'The Godfather', 'The Godfather: Part II', 'The Dark Knight', '12 Angry Men'],
+                'titleType': ['movie', 'movie', 'movie', 'movie', 'movie'],
                 'author': ['Director', 'Director', 'Director', 'Director', 'Director'],
                 'genre': ['Drama', 'Crime,Drama', 'Crime,Drama', 'Action,Crime,Drama', 'Crime,Drama'],
                 'year': [1994, 1972, 1974, 2008, 1957],
                 'avg_rating': [9.3, 9.2, 9.0, 9.0, 8.9],
                 'num_votes': [2400000, 1700000, 1200000, 2500000, 700000],
                 'domain': ['movie', 'movie', 'movie', 'movie', 'movie'],
-                'img': ['https://via.placeholder.com/150x225?text=Movie+Poster'] * 5
-            })
+                'img': ['https://m.media-amazon.com/images/M/MV5BMDFkYTc0MGEtZmNhMC00ZDIzLWFmNTEtODM1ZmRlYWMwMWFmXkEyXkFqcGdeQXVyMTMxODk2OTU@._V1_SX300.jpg', 
+                       'https://m.media-amazon.com/images/M/MV5BM2MyNjYxNmUtYTAwNi00MTYxLWJmNWYtYzZlODY3ZTk3OTFlXkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg',
+                       'https://m.media-amazon.com/images/M/MV5BMWMwMGQzZTItY2JlNC00OWZiLWIyMDctNDk2ZDQ2YjRjMWQ0XkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg',
+                       'https://m.media-amazon.com/images/M/MV5BMTMxNTMwODM0NF5BMl5BanBnXkFtZTcwODAyMTk2Mw@@._V1_SX300.jpg',
+                       'https://m.media-amazon.com/images/M/MV5BMWU4N2FjNzYtNTVkNC00NzQ0LTg0MjAtYTJlMjFhNGUxZDFmXkEyXkFqcGdeQXVyNjc1NTYyMjg@._V1_SX300.jpg']
+            }))
 
     except Exception as e:
-        print(f"Error loading datasets: {e}")
+        print(f"Error loading movie dataset: {e}")
         # Create placeholder data if an error occurs
-        app.movie_df = pd.DataFrame({
+        catalog = build_catalog('movie', pd.DataFrame({
             'item_id': ['tt0111161', 'tt0068646'],
             'title': ['The Shawshank Redemption', 'The Godfather'],
+            'titleType': ['movie', 'movie'],
             'author': ['Director', 'Director'],
             'genre': ['Drama', 'Crime,Drama'],
             'year': [1994, 1972],
             'avg_rating': [9.3, 9.2],
             'num_votes': [2400000, 1700000],
             'domain': ['movie', 'movie'],
-            'img': ['https://via.placeholder.com/150x225?text=Movie+Poster'] * 2
-        })
+            'img': ['https://m.media-amazon.com/images/M/MV5BMDFkYTc0MGEtZmNhMC00ZDIzLWFmNTEtODM1ZmRlYWMwMWFmXkEyXkFqcGdeQXVyMTMxODk2OTU@._V1_SX300.jpg',
+                   'https://m.media-amazon.com/images/M/MV5BM2MyNjYxNmUtYTAwNi00MTYxLWJmNWYtYzZlODY3ZTk3OTFlXkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg']
+        }))
+    return catalog
+
+def warm_up_models(domain, catalog=None):
+    """Pre-build the WARMUP_FILTERS models of a freshly loaded domain.
+
+    catalog is the version to warm up, by default the installed one; a
+    reload warms its new version before installing it.
+    """
+    if catalog is None:
+        catalog = app.catalogs[domain]
+    if MODEL_MODE == 'global':
+        get_global_model(catalog)
+        return
+    for mood, era, genre in WARMUP_FILTERS:
+        get_model(catalog, mood, era, genre)
+
+DATASET_LOADERS = {
+    'book': load_book_dataset,
+    'anime': load_anime_dataset,
+    'movie': load_movie_dataset,
+}
+
+def load_dataset(domain):
+    """Load a domain's dataset and install it."""
+    install_catalog(DATASET_LOADERS[domain]())
+
+registry = DatasetRegistry({
+    domain: functools.partial(load_dataset, domain) for domain in DATASET_LOADERS
+}, warm_up=warm_up_models)
+
+def get_catalog(domain):
+    """A domain's current CatalogVersion, loading it first if needed."""
+    registry.ensure(domain)
+    return app.catalogs[domain]
+
+def get_dataset(domain):
+    """A domain's catalog, loading it first if needed."""
+    return get_catalog(domain).df
+
+@app.on_event("startup")
+async def startup_db_client():
+    if DATASET_PRELOAD == 'eager':
+        for domain in RECOMMENDER_DOMAINS:
+            try:
+                registry.ensure(domain)
+            except DatasetUnavailable:
+                continue
+            registry.warm(domain)
+    elif DATASET_PRELOAD == 'background':
+        # Serve requests right away; a request for a domain that is not
+        # loaded yet loads it itself
+        registry.load_in_background(RECOMMENDER_DOMAINS)
+
+@contextlib.contextmanager
+def locked_catalog(domain):
+    """Hold the update lock of a domain's current catalog and yield its CatalogLog."""
+    while True:
+        log = app.catalogs[domain].log
+        with log.lock:
+            # A refit or reload may have installed a new catalog while we waited
+            if app.catalogs[domain].log is log:
+                yield log
+                return
+
+def item_id_values(values, dtype):
+    """values cast to the dtype of a catalog's id column; raises ValueError for ids it cannot hold."""
+    if not pd.api.types.is_integer_dtype(dtype):
+        return values.astype(str)
+    numbers = pd.to_numeric(values, errors='coerce')
+    limits = np.iinfo(dtype)
+    invalid = numbers.isna() | (numbers % 1 != 0) | (numbers < limits.min) | (numbers > limits.max)
+    if invalid.any():
+        raise ValueError(f"Invalid item id {values[invalid].iloc[0]!r}: this catalog's ids are integers")
+    return numbers.astype(dtype)
 
+def catalog_items(domain, df, records):
+    """Item records as rows of the domain's catalog, with derived columns filled in."""
+    frame = pd.DataFrame(list(records))
+    if not len(frame):
+        raise ValueError("No items provided")
+    for column in ('item_id', 'title'):
+        if column not in frame.columns or frame[column].isna().any():
+            raise ValueError("Every item needs an item_id and a title")
+    if domain == "anime":
+        # The anime catalog keeps its CSV columns next to the derived ones
+        for column, source in ANIME_CSV_COLUMNS.items():
+            if column not in frame.columns and source in frame.columns:
+                frame[column] = frame[source]
+            elif source not in frame.columns and column in frame.columns:
+                frame[source] = frame[column]
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    frame[genre_col] = frame[genre_col].fillna('Unknown') if genre_col in frame.columns else 'Unknown'
+    for column in ('avg_rating', 'num_votes'):
+        frame[column] = pd.to_numeric(frame[column], errors='coerce').fillna(0) if column in frame.columns else 0
+    # Ids keep the catalog's dtype, so they match the ids already in it
+    id_columns = [c for c in ('item_id', 'anime_id') if c in df.columns and c in frame.columns]
+    for column in id_columns:
+        frame[column] = item_id_values(frame[column], df[column].dtype)
+    for column in frame.columns:
+        if column not in id_columns and column in df.columns and pd.api.types.is_numeric_dtype(df[column].dtype):
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    if 'domain' in df.columns:
+        frame['domain'] = domain
+    return frame.drop_duplicates('item_id', keep='last').reset_index(drop=True)
+
+def upsert_items(domain, records):
+    """Insert or replace catalog items by item_id without refactorizing anything.
+
+    New items are appended to the catalog and its indexes; models fold the
+    changed rows into their latent spaces the next time they are used.
+    """
+    start = time.perf_counter()
+    get_catalog(domain)
+    with locked_catalog(domain) as log:
+        catalog = app.catalogs[domain]
+        n_rows = len(catalog)
+        frame = catalog_items(domain, catalog.df, records)
+        catalog, rows = upsert_rows(catalog, log, frame)
+        catalog = install_catalog(catalog)
+        summary = {"domain": domain, "upserted": len(rows), "added": int((rows >= n_rows).sum()),
+                   "catalog_seq": catalog.seq, "data_version": catalog.data_version,
+                   "records": len(catalog), "drift": log.drift}
+    summary["refit"] = schedule_refit(domain)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def upsert_rows(catalog, log, frame):
+    """(catalog with the items of frame inserted or replaced, their rows); the caller holds log.lock."""
+    domain, df = catalog.domain, catalog.df
+    item_ids = frame['item_id'].astype(str).tolist()
+    item_rows = log.item_rows(df)
+    rows, next_row = [], len(df)
+    for item_id in item_ids:
+        row = item_rows.get(item_id)
+        if row is None:
+            row, next_row = next_row, next_row + 1
+        rows.append(row)
+    rows = np.array(rows, dtype=np.int64)
+
+    updated = apply_rows(df, rows, frame)
+    active = catalog.active
+    if active is not None:
+        active = np.concatenate((active, np.ones(len(updated) - len(active), dtype=bool)))
+    genre_index = catalog.genre_index.updated(rows, frame[catalog.genre_col], len(updated))
+    popularity = catalog.popularity.updated(
+        popularity_votes(updated), rows, popularity_matcher(updated, genre_index, domain), active
+    )
+    # Log the rows before any request can see the version that changed them
+    seq = log.record(rows, frame[catalog.genre_col])
+    item_rows.update(zip(item_ids, rows.tolist()))
+    return catalog.replace(
+        df=updated, seq=seq, active=active, genre_index=genre_index, popularity=popularity,
+        title_index=OverlayTitleIndex.with_changes(
+            catalog.title_index, rows, frame['title'].tolist(), len(updated)
+        ),
+        # Precomputed neighbors do not know the new vectors
+        neighbor_table=None
+    ), rows
+
+def remove_items(domain, item_ids):
+    """Remove catalog items by item_id; their rows stay as tombstones until the next refit."""
+    start = time.perf_counter()
+    get_catalog(domain)
+    with locked_catalog(domain) as log:
+        catalog = app.catalogs[domain]
+        item_ids = list(dict.fromkeys(str(item_id) for item_id in item_ids))
+        missing = [i for i in item_ids if i not in log.item_rows(catalog.df)]
+        catalog, rows = remove_rows(catalog, log, item_ids)
+        if len(rows):
+            catalog = install_catalog(catalog)
+        summary = {"domain": domain, "removed": len(rows), "missing": missing,
+                   "catalog_seq": catalog.seq, "data_version": catalog.data_version, "drift": log.drift}
+    summary["refit"] = schedule_refit(domain)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def remove_rows(catalog, log, item_ids):
+    """(catalog without the items of item_ids, their rows); the caller holds log.lock."""
+    domain = catalog.domain
+    item_rows = log.item_rows(catalog.df)
+    rows = np.array([item_rows[i] for i in item_ids if i in item_rows], dtype=np.int64)
+    if not len(rows):
+        return catalog, rows
+    active = np.ones(len(catalog), dtype=bool) if catalog.active is None else catalog.active.copy()
+    active[rows] = False
+    seq = log.record(rows)
+    for item_id in item_ids:
+        item_rows.pop(item_id, None)
+    popularity = catalog.popularity.updated(
+        popularity_votes(catalog.df), rows, popularity_matcher(catalog.df, catalog.genre_index, domain), active
+    )
+    return catalog.replace(
+        seq=seq, active=active, popularity=popularity,
+        title_index=OverlayTitleIndex.with_changes(
+            catalog.title_index, rows, [None] * len(rows), len(catalog)
+        )
+    ), rows
+
+def schedule_refit(domain):
+    """Start a background refit of the domain once its drift reaches REFIT_DRIFT."""
+    log = app.catalogs[domain].log
+    with log.lock:
+        if log.refitting or log.drift < REFIT_DRIFT:
+            return False
+        log.refitting = True
+    threading.Thread(target=refit_catalog, args=(domain,), name=f"refit-{domain}", daemon=True).start()
+    return True
+
+def refit_catalog(domain):
+    """Rebuild a domain from its updated catalog: drop removed rows, rebuild indexes and refit.
+
+    The rebuild runs without the update lock, so requests and updates keep
+    being served from the folded-in models meanwhile. Updates made during
+    the rebuild are then applied to the refitted version before it is
+    installed.
+    """
+    start = time.perf_counter()
+    try:
+        with locked_catalog(domain) as log:
+            catalog = app.catalogs[domain]
+        df = catalog.df if catalog.active is None else catalog.df[catalog.active]
+        refitted = build_catalog(domain, df.reset_index(drop=True), source=catalog.source)
+        warm_up_models(domain, refitted)
+        with locked_catalog(domain) as current_log:
+            if current_log is not log:
+                print(f"Dropped the {domain} refit: the catalog was reloaded meanwhile")
+                return
+            refitted = catch_up(refitted, app.catalogs[domain], log.rows_since(catalog.seq))
+            install_catalog(refitted)
+        print(f"Refitted {domain} catalog after {log.seq} updates in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        app.catalogs[domain].log.refitting = False
+        print(f"Error refitting {domain} catalog: {e}")
+
+def catch_up(refitted, current, rows):
+    """refitted with the changes current holds at rows applied, as upserts and removals."""
+    if not len(rows):
+        return refitted
+    live = rows if current.active is None else rows[current.active[rows]]
+    removed = np.setdiff1d(rows, live)
+    # Removals first: an item removed and then added again is live under a new row
+    if len(removed):
+        refitted, _ = remove_rows(refitted, refitted.log, current.df['item_id'].iloc[removed].astype(str).tolist())
+    if len(live):
+        refitted, _ = upsert_rows(refitted, refitted.log, current.df.iloc[live].reset_index(drop=True))
+    return refitted
+
+def schedule_reload(domain):
+    """Start reloading a domain's dataset in the background; False if a reload is already running."""
+    with _reload_lock:
+        if app.reloads.get(domain, {}).get('status') == 'reloading':
+            return False
+        app.reloads[domain] = {'status': 'reloading', 'error': None, 'seconds': None, 'version': None}
+    threading.Thread(target=reload_dataset, args=(domain,), name=f"reload-{domain}", daemon=True).start()
+    return True
+
+def reload_dataset(domain):
+    """Load a domain's dataset again and swap it in once its models are warm.
+
+    The current version keeps serving requests meanwhile. Catalog updates
+    made through /catalog since it was loaded are not carried over; persist
+    them with catalog_updates.py before reloading.
+    """
+    start = time.perf_counter()
+    try:
+        catalog = DATASET_LOADERS[domain]()
+        warm_up_models(domain, catalog)
+        # Updates must not land on the version that is about to be replaced
+        with locked_catalog(domain) if domain in app.catalogs else contextlib.nullcontext():
+            install_catalog(catalog)
+    except Exception as e:
+        print(f"Error reloading {domain} dataset: {e}")
+        app.reloads[domain].update(status='failed', error=str(e), seconds=time.perf_counter() - start)
+        return
+    app.reloads[domain].update(status='ready', seconds=time.perf_counter() - start, version=catalog.version)
+    print(f"Reloaded {domain} dataset as version {catalog.version} in {time.perf_counter() - start:.1f}s")
 
 class RecommendationRequest(BaseModel):
     titles: list
@@ -275,13 +867,25 @@ class RecommendationRequest(BaseModel):
     era: str = None  
     genre: str = None
     domain: str = "book"  # Default to books, can be "anime"
+    limit: int = None  # results per page, RECOMMENDATIONS_LIMIT by default
+    cursor: str = None  # next_cursor of the previous page
+
+
+class BatchRecommendationRequest(BaseModel):
+    requests: list[RecommendationRequest]
+
+
+class CatalogUpsertRequest(BaseModel):
+    items: list[dict]
+
+
+class CatalogRemoveRequest(BaseModel):
+    item_ids: list
 
 
 # Function to Filter Dataset Based on Mood, Era, and Genre
-def filter_dataset(df, mood, era, genre, domain="book"):
-    """Filter the dataset based on user-selected mood, era, and genre."""
-    filtered_df = df.copy()
-    
+def get_target_genres(mood, genre, domain="book"):
+    """Collect the genres selected by the mood and genre filters."""
     # Get appropriate genre mapping and mood-to-genre mapping based on domain
     if domain == "anime":
         genre_map = anime_genre_mapping
@@ -293,7 +897,6 @@ def filter_dataset(df, mood, era, genre, domain="book"):
         genre_map = book_genre_mapping
         mood_to_genres = mood_to_book_genres
     
-    # Step 1: Genre Filtering
     target_genres = []
     if genre and genre in genre_map:
         target_genres.append(genre_map[genre])
@@ -301,14 +904,27 @@ def filter_dataset(df, mood, era, genre, domain="book"):
     if mood and mood in mood_to_genres:
         target_genres.extend(mood_to_genres[mood])
     
-    target_genres = list(set(target_genres))  # Remove duplicates
+    return list(set(target_genres))  # Remove duplicates
+
+def genre_mask(df, genres, domain="book", genre_index=None):
+    """Boolean row mask of items having any of the given genres."""
+    if genre_index is not None and len(genre_index) == len(df):
+        return genre_index.any_mask(genres)
     
+    # No index for this frame, parse the genre strings directly
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    return df[genre_col].apply(
+        lambda x: any(g in str(x).split(',') for g in genres) if pd.notna(x) else False
+    ).to_numpy(dtype=bool)
+
+def match_mask(df, mood, era, genre, domain="book", genre_index=None):
+    """Boolean row mask of the items matching the mood, era and genre filters."""
+    mask = np.ones(len(df), dtype=bool)
+    
+    # Step 1: Genre Filtering
+    target_genres = get_target_genres(mood, genre, domain)
     if target_genres:
-        genre_col = 'genres' if domain == 'book' else 'genre'
-        genre_filter = filtered_df[genre_col].apply(
-            lambda x: any(g in str(x).split(',') for g in target_genres)
-        )
-        filtered_df = filtered_df[genre_filter]
+        mask &= genre_mask(df, target_genres, domain, genre_index)
     
     # Step 2: Era Filtering
     if era and era != 'any':
@@ -316,490 +932,1140 @@ def filter_dataset(df, mood, era, genre, domain="book"):
             year_range = era_to_anime_years[era]
             if year_range:
                 start_year, end_year = year_range
-                filtered_df = filtered_df[(filtered_df['aired_from_year'] >= start_year) & 
-                                        (filtered_df['aired_from_year'] < end_year)]
+                mask &= ((df['aired_from_year'] >= start_year) & 
+                         (df['aired_from_year'] < end_year)).to_numpy(dtype=bool)
         elif domain == "book" and era in era_to_book_genres and era_to_book_genres[era]:
-            era_genres = era_to_book_genres[era]
-            era_filter = filtered_df['genres'].apply(
-                lambda x: any(g in str(x).split(',') for g in era_genres)
-            )
-            filtered_df = filtered_df[era_filter]
+            mask &= genre_mask(df, era_to_book_genres[era], domain, genre_index)
         elif domain == "movie" and era in era_to_movie_years and era_to_movie_years[era]:
             start_year, end_year = era_to_movie_years[era]
-            year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
-            filtered_df = filtered_df[year_filter]
+            mask &= ((df['year'] >= start_year) & (df['year'] < end_year)).to_numpy(dtype=bool)
     
-    # If we filtered too aggressively, return original dataset
-    print(len(filtered_df))
-    if len(filtered_df) < 1:
-        print(f"Warning: Too few {domain}s match filters. Using broader dataset.")
-        return df
+    return mask
+
+def filter_positions(df, mood, era, genre, domain="book", genre_index=None, active=None, popularity=None):
+    """Catalog rows matching the user-selected mood, era, and genre.
+
+    Returns an index array instead of a filtered copy of the catalog.
+    active masks the rows still in the catalog, None meaning all of them;
+    popularity is the catalog's PopularityCube, if it has one.
+    """
+    mask = match_mask(df, mood, era, genre, domain, genre_index)
+    if active is not None:
+        mask &= active
+    positions = np.flatnonzero(mask)
+    
+    # If we filtered too aggressively, return a broader dataset
+    if len(positions) < 1:
+        if domain != "movie":
+            print(f"Warning: Too few {domain}s match filters. Using broader dataset.")
+            return np.arange(len(df)) if active is None else np.flatnonzero(active)
+        print(f"Warning: Too few movies match filters. Using broader dataset.")
+        
+        # Try just using the genre filter if era was specified
+        target_genres = get_target_genres(mood, genre, domain)
+        if era and era != 'any' and target_genres:
+            by_genre = genre_mask(df, target_genres, domain, genre_index)
+            by_genre = np.flatnonzero(by_genre if active is None else by_genre & active)
+            
+            if len(by_genre) >= 10:
+                return by_genre
+        
+        # If still not enough, return most popular items
+        if popularity is not None:
+            rows = popularity.top((None, None, None), 100)
+            if rows is not None:
+                return rows
+        votes = df['num_votes'].reset_index(drop=True)
+        if active is not None:
+            votes = votes[active]
+        return votes.sort_values(ascending=False).head(100).index.to_numpy()
     
-    return filtered_df
+    return positions
+
+# Function to Build the Feature Matrix and its Latent Space
+def fit_latent(filtered_df, domain="book", svd_mode=None, n_components=None,
+               oversampling=None, random_state=None, return_projection=False):
+    """Build the feature matrix of the dataset and return its SVD latent matrix.
+
+    svd_mode is 'full' (dense LAPACK SVD), 'truncated' (randomized SVD of the
+    sparse feature matrix, computing only the top components) or 'auto', which
+    picks 'truncated' once the dataset has at least SVD_TRUNCATED_MIN_ROWS rows
+    and many more features than components are kept. With return_projection
+    the LatentProjection that folds new rows into the space is returned too.
+    """
+    svd_mode = svd_mode or SVD_MODE
+    n_components = n_components or SVD_COMPONENTS
+    oversampling = SVD_OVERSAMPLING if oversampling is None else oversampling
+    random_state = SVD_RANDOM_STATE if random_state is None else random_state
 
-# Function to Build Feature Matrix and Train Model
-def build_model(filtered_df, domain="book"):
-    """Build the feature matrix and train the SVD-KNN model on the filtered dataset."""
     # Determine genre column name based on domain
     genre_col = 'genres' if domain == 'book' else 'genre'
     
     # Feature Engineering
-    tfidf = TfidfVectorizer(tokenizer=lambda x: str(x).split(','), lowercase=True, token_pattern=None)
-    genre_features = tfidf.fit_transform(filtered_df[genre_col].fillna('Unknown'))
-    
-    scaler = StandardScaler()
-    numerical_features = scaler.fit_transform(filtered_df[['avg_rating', 'num_votes']].fillna(0))
+    with metrics.stage('features', rows=len(filtered_df)):
+        tfidf = TfidfVectorizer(tokenizer=split_genres, lowercase=True, token_pattern=None)
+        genre_features = tfidf.fit_transform(filtered_df[genre_col].astype(object).fillna('Unknown'))
+        
+        scaler = StandardScaler()
+        numerical_features = scaler.fit_transform(filtered_df[['avg_rating', 'num_votes']].fillna(0))
     
-    feature_matrix = np.hstack((genre_features.toarray(), numerical_features))
+    n_rows, n_features = genre_features.shape[0], genre_features.shape[1] + numerical_features.shape[1]
+    k = min(n_components, n_features - 1)  # Adjust k if feature matrix is smaller
+    if svd_mode == 'auto':
+        wide = n_features > 2 * k
+        svd_mode = 'truncated' if n_rows >= SVD_TRUNCATED_MIN_ROWS and wide else 'full'
     
-    # Apply SVD
-    U, Sigma, Vt = svd(feature_matrix, full_matrices=False)
-    k = min(50, feature_matrix.shape[1] - 1)  # Adjust k if feature matrix is smaller
-    U_k = U[:, :k]
-    Sigma_k = np.diag(Sigma[:k])
-    latent_matrix = np.dot(U_k, Sigma_k)
+    svd_stage = metrics.stage('svd', rows=n_rows)
+    if svd_mode == 'truncated' and 0 < k < min(n_rows, n_features):
+        # Keep the TF-IDF matrix sparse and only compute the top-k components
+        with svd_stage:
+            feature_matrix = sparse.hstack((genre_features, sparse.csr_matrix(numerical_features))).tocsr()
+            U_k, Sigma_k, Vt_k = randomized_svd(
+                feature_matrix, n_components=k, n_oversamples=oversampling,
+                n_iter=SVD_POWER_ITERATIONS, random_state=random_state
+            )
+            latent_matrix = U_k * Sigma_k
+    else:
+        with svd_stage:
+            feature_matrix = np.hstack((genre_features.toarray(), numerical_features))
+            
+            # Apply SVD
+            U, Sigma, Vt = svd(feature_matrix, full_matrices=False)
+            U_k = U[:, :k]
+            Sigma_k = np.diag(Sigma[:k])
+            latent_matrix = np.dot(U_k, Sigma_k)
+            Vt_k = Vt[:k]
     
-    # Apply KNN
-    knn = NearestNeighbors(n_neighbors=6, metric='cosine')
-    knn.fit(latent_matrix)
+    if CATALOG_MODE == 'compact':
+        latent_matrix = latent_matrix.astype(np.float32)
+    if return_projection:
+        return latent_matrix, LatentProjection(tfidf, scaler, Vt_k, genre_col, latent_matrix.dtype)
+    return latent_matrix
+
+def latent_params():
+    """Settings that shape the unfiltered latent space, stored with neighbor tables."""
+    return {
+        'svd_mode': SVD_MODE,
+        'svd_truncated_min_rows': SVD_TRUNCATED_MIN_ROWS,
+        'svd_components': SVD_COMPONENTS,
+        'svd_oversampling': SVD_OVERSAMPLING,
+        'svd_power_iterations': SVD_POWER_ITERATIONS,
+        'svd_random_state': SVD_RANDOM_STATE,
+        'catalog_mode': CATALOG_MODE,
+    }
+
+# Function to Build Feature Matrix and Train Model
+def build_model(filtered_df, domain="book", knn_backend=None, **svd_options):
+    """Build the feature matrix and train the SVD-KNN model on the filtered dataset.
+
+    svd_options are passed on to fit_latent; with return_projection=True the
+    result is (latent_matrix, knn, projection). knn_backend is 'exact'
+    (brute-force NearestNeighbors), 'ivf' (approximate IVFIndex) or 'auto',
+    which uses 'ivf' from ANN_MIN_ROWS rows upwards.
+    """
+    latent_matrix = fit_latent(filtered_df, domain, **svd_options)
+    if svd_options.get('return_projection'):
+        latent_matrix, projection = latent_matrix
+    knn = fit_knn(latent_matrix, knn_backend)
     
-    return latent_matrix, knn, filtered_df
+    if svd_options.get('return_projection'):
+        return latent_matrix, knn, projection
+    return latent_matrix, knn
 
-# Function to Find Similar Items
-def find_similar_items(titles, full_df, filtered_df, latent_matrix, knn_model, domain="book", n_recommendations=5):
-    """Find similar items based on input titles."""
-    # Find matching items in the filtered dataset
-    item_indices = []
+def fit_knn(latent_matrix, knn_backend=None):
+    """Fit the nearest neighbor model of build_model on a latent matrix."""
+    knn_backend = knn_backend or KNN_BACKEND
+    n_rows = len(latent_matrix)
     
+    # Apply KNN
+    if knn_backend == 'auto':
+        knn_backend = 'ivf' if n_rows >= ANN_MIN_ROWS else 'exact'
+    if knn_backend == 'ivf':
+        knn = IVFIndex(n_lists=ANN_LISTS, n_probe=ANN_PROBE, random_state=SVD_RANDOM_STATE)
+    elif knn_backend == 'sharded' and n_rows >= KNN_SHARD_MIN_ROWS:
+        knn = ShardedKNN(n_shards=KNN_SHARDS, directory=KNN_SHARD_DIR, timeout=KNN_SHARD_TIMEOUT)
+    else:
+        knn = NearestNeighbors(n_neighbors=6, metric='cosine')
+    with metrics.stage('knn_fit', rows=n_rows):
+        knn.fit(latent_matrix)
+    return knn
+
+def shared_model(key, fit, tags=None):
+    """(latent_matrix, knn, projection) from fit(), fitted once for every worker and restart.
+
+    The process that fits the model stores its latent matrix, IVF lists and
+    projection parameters in the model store; every process then uses the
+    mapped copies. A brute-force or sharded knn only references the latent
+    matrix, so it is refitted.
+    """
+    def build():
+        latent_matrix, knn, projection = fit()
+        parts = {'latent': latent_matrix}
+        parts.update({f'projection.{name}': values for name, values in projection.arrays().items()})
+        if isinstance(knn, IVFIndex):
+            parts.update({f'ivf.{name}': values for name, values in knn.arrays().items()})
+        return parts
+
+    entry = model_store.get_or_publish(key, build, tags)
+    ivf = {name[len('ivf.'):]: values for name, values in entry.items() if name.startswith('ivf.')}
+    if ivf:
+        knn = IVFIndex.from_arrays(ivf, n_probe=ANN_PROBE)
+    else:
+        knn = fit_knn(entry['latent'], 'sharded' if KNN_BACKEND == 'sharded' else 'exact')
+    return entry['latent'], knn, stored_projection(entry)
+
+def stored_projection(entry):
+    return LatentProjection.from_arrays({
+        name[len('projection.'):]: values for name, values in entry.items() if name.startswith('projection.')
+    })
+
+def model_key(catalog, *parts):
+    """Model store key of a model fitted on an unmodified catalog, or None."""
+    if model_store is None or catalog.fingerprint is None or catalog.seq:
+        return None
+    return store_key(catalog.domain, 'model', catalog.fingerprint, latent_params(),
+                     KNN_BACKEND, ANN_MIN_ROWS, ANN_LISTS, *parts)
+
+def model_tags(catalog, *parts):
+    """Tags of a stored model, which prune_artifacts reads back."""
+    return {'domain': catalog.domain, 'fingerprint': catalog.fingerprint, 'model': list(parts)}
+
+def normalize_filters(domain, mood, era, genre):
+    """Map mood, era and genre to the values that actually affect filtering.
+
+    Values the filters ignore (missing, unknown or 'any') all become None, so
+    requests that select the same rows share one cache key.
+    """
+    genre_map, mood_to_genres, era_map = filter_maps(domain)
+    mood = mood if mood in mood_to_genres else None
+    era = era if era in era_map and era_map[era] else None
+    genre = genre if genre in genre_map else None
+    return mood, era, genre
+
+def filter_maps(domain):
+    """The (genre, mood and era) mappings that define a domain's filters."""
+    if domain == "anime":
+        return anime_genre_mapping, mood_to_anime_genres, era_to_anime_years
+    elif domain == "movie":
+        return movie_genre_mapping, mood_to_movie_genres, era_to_movie_years
+    return book_genre_mapping, mood_to_book_genres, era_to_book_genres
+
+def filter_cells(domain):
+    """Every distinct normalized (mood, era, genre) combination of a domain."""
+    genre_map, mood_to_genres, era_map = filter_maps(domain)
+    moods = [None] + list(mood_to_genres)
+    eras = [None] + [era for era, values in era_map.items() if values]
+    genres = [None] + list(genre_map)
+    return list(itertools.product(moods, eras, genres))
+
+def popularity_votes(df):
+    """Vote counts ranking a catalog's popular items: num_votes, else scored_by, else zeros."""
+    for column in ('num_votes', 'scored_by'):
+        if column in df.columns:
+            return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+    return np.zeros(len(df))
+
+def popularity_matcher(df, genre_index, domain):
+    """matcher for PopularityCube: match_mask over a subset of the catalog rows."""
+    # Besides the genre index, the filters only read the year columns
+    columns = [df.columns.get_loc(c) for c in ('aired_from_year', 'year') if c in df.columns]
+
+    def matcher(rows):
+        frame = df.iloc[rows, columns]
+        index = genre_index.take(rows)
+        return lambda cell: match_mask(frame, *cell, domain, index)
+    return matcher
+
+def build_popularity(domain, df, genre_index, active=None):
+    """The PopularityCube of a catalog, over every filter cell of its domain."""
+    return PopularityCube.build(popularity_votes(df), filter_cells(domain),
+                                popularity_matcher(df, genre_index, domain), POPULAR_DEPTH, active)
+
+def popular_rows(popularity, domain, mood, era, genre, n_recommendations=5):
+    """The most voted rows for normalized filters from a PopularityCube.
+
+    Filters nothing matches are broadened like filter_rows does. Returns
+    None when the cube does not keep n_recommendations rows for the cell.
+    """
+    cell = (mood, era, genre)
+    if cell in popularity.cells and not len(popularity.cells[cell]):
+        broader = (mood, None, genre)
+        if domain == "movie" and era and (mood or genre) and len(popularity.cells.get(broader, ())) >= 10:
+            cell = broader
+        else:
+            cell = (None, None, None)
+    return popularity.top(cell, n_recommendations)
+
+def model_rows(df, positions, domain="book"):
+    """The columns a model is fitted on, for the catalog rows at positions."""
+    if len(positions) == len(df):
+        return df
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    columns = [df.columns.get_loc(c) for c in (genre_col, 'avg_rating', 'num_votes')]
+    return df.iloc[positions, columns]
+
+def get_model(catalog, mood, era, genre):
+    """Return (latent_matrix, knn, positions) for the filters on a CatalogVersion.
+
+    positions holds the catalog row of every filtered item; the filtered
+    catalog itself is never stored. The model is only fitted on a cache miss;
+    catalog updates made since it was fitted are folded into it.
+    """
+    domain, df = catalog.domain, catalog.df
+    mood, era, genre = normalize_filters(domain, mood, era, genre)
+    key = (domain, mood, era, genre, catalog.version)
+
+    def build():
+        with metrics.stage('filter') as stage:
+            positions = filter_positions(df, mood, era, genre, domain, catalog.genre_index, catalog.active,
+                                         catalog.popularity)
+            stage.rows = len(positions)
+        fit = lambda: build_model(model_rows(df, positions, domain), domain, return_projection=True)
+        shared_key = model_key(catalog, mood, era, genre)
+        if shared_key is None:
+            latent_matrix, knn, projection = fit()
+        else:
+            latent_matrix, knn, projection = shared_model(shared_key, fit, model_tags(catalog, mood, era, genre))
+        return latent_matrix, knn, positions, projection, catalog.seq
+
+    if not is_current(catalog):
+        # A replaced version only serves the requests still running on it
+        return build()[:3]
+    model = model_cache.get_or_build(key, build)
+    if model[4] > catalog.seq:
+        # Already holds updates made after this request took its catalog
+        return build()[:3]
+    if model[4] < catalog.seq:
+        with metrics.stage('fold_in'):
+            model = fold_in_changes(catalog, model, mood, era, genre)
+        if model is None:
+            model_cache.invalidate(lambda cached: cached == key)
+            model = model_cache.get_or_build(key, build)
+        else:
+            model = model_cache.put(key, model)
+    return model[:3]
+
+def fold_in_changes(catalog, model, mood, era, genre):
+    """Fold the catalog rows changed since model was built into it, or return None.
+
+    Changed rows that (still) pass the filters are projected into the
+    model's latent space; rows that left it are dropped. None means the
+    model has to be refitted, which only happens for models of filters that
+    matched nothing and fell back to a broader set of rows.
+    """
+    latent_matrix, knn, positions, projection, applied = model
+    domain, df = catalog.domain, catalog.df
+    rows = catalog.log.rows_since(applied, catalog.seq)
+
+    mask = match_mask(df, mood, era, genre, domain, catalog.genre_index)
+    kept = positions[~np.isin(positions, rows)]
+    if len(kept) and mask[kept].all():
+        members = rows[mask[rows]]
+    elif len(kept) and domain != "movie" and not mask.any():
+        # Fitted on the whole catalog because the filters matched nothing
+        members = rows
+    else:
+        return None
+    if catalog.active is not None:
+        members = members[catalog.active[members]]
+
+    if len(members):
+        member_vectors = projection.transform(df.iloc[members])
+    else:
+        member_vectors = np.zeros((0, latent_matrix.shape[1]), dtype=latent_matrix.dtype)
+    latent_matrix, positions, remap, member_index = merge_rows(
+        latent_matrix, positions, rows, members, member_vectors
+    )
+    if not len(positions):
+        return None
+    if isinstance(knn, IVFIndex):
+        knn = knn.remapped(remap, member_index, member_vectors)
+    elif isinstance(knn, ShardedKNN):
+        knn = ShardedKNN(knn.n_shards, knn.directory, knn.timeout).fit(latent_matrix)
+    else:
+        knn = clone(knn).fit(latent_matrix)
+    return latent_matrix, knn, positions, projection, catalog.seq
+
+def resolve_title(title_index, title, allowed=None):
+    """Row of the first title containing title, else of the closest one up to typos, or None."""
+    row = title_index.first_match(title, allowed)
+    if row is None and FUZZY_TITLES:
+        with metrics.stage('fuzzy_match'):
+            found = title_index.fuzzy_match(title, allowed, FUZZY_THRESHOLD,
+                                            time.perf_counter() + FUZZY_BUDGET_MS / 1000)
+        row = None if found is None else found[0]
+    return row
+
+def title_matcher(full_df, positions, title_index=None):
+    """Return a function mapping an input title to its filtered position, or None.
+
+    positions are the catalog rows of the filtered items, in model order.
+    Titles looked up through the title index may also match up to typos.
+    """
     # Determine title column based on domain
     title_column = 'title'
     
-    for title in titles:
-        title = title.lower().strip()
-        matching_items = filtered_df[filtered_df[title_column].str.lower().str.contains(title, na=False)]
-        if not matching_items.empty:
-            item_indices.append(filtered_df.index.get_loc(matching_items.index[0]))
+    # The title index answers lookups when the filtered rows keep catalog order
+    use_index = (title_index is not None and len(title_index) == len(full_df)
+                 and np.all(positions[1:] > positions[:-1]))
+    allowed = None
+    if use_index and len(positions) < len(full_df):
+        allowed = np.zeros(len(full_df), dtype=bool)
+        allowed[positions] = True
+    titles = None if use_index else full_df[title_column].iloc[positions]
+    
+    def match(title):
+        if use_index:
+            row = resolve_title(title_index, title, allowed)
+            return None if row is None else int(np.searchsorted(positions, row))
+        
+        title = normalize_title(title)
+        hits = np.flatnonzero(titles.str.lower().str.contains(title, na=False, regex=False).to_numpy())
+        return int(hits[0]) if len(hits) else None
+    
+    return match
+
+def select_result_fields(df, rows, domain="book"):
+    """Catalog rows at rows, with the fields shown for the domain."""
+    # Extract appropriate fields based on domain
+    if domain == "anime":
+        fields = ['title', 'author', 'genre', 'avg_rating', 'scored_by', 'image_url']
+    elif domain == "movie":
+        fields = ['title', 'author', 'genre', 'avg_rating', 'num_votes', 'img']
+    else:  # Book
+        fields = ['title', 'author', 'genres', 'avg_rating', 'num_votes', 'img']
+    
+    # Use available fields from the DataFrame
+    available_fields = [f for f in fields if f in df.columns]
+    
+    return df.iloc[rows][available_fields]
+
+def popular_items(df, domain="book", n_recommendations=5, active=None, popularity=None, filters=(None, None, None)):
+    """The most voted items still in the catalog that match the normalized filters.
+
+    Used when no input title matches. They are looked up in the catalog's
+    PopularityCube; only when it keeps too few rows is the catalog sorted.
+    """
+    if popularity is not None:
+        rows = popular_rows(popularity, domain, *filters, n_recommendations)
+        if rows is not None:
+            return df.iloc[rows]
+    mask = filter_rows(df, *filters, domain, active=active) if any(filters) else active
+    if mask is not None:
+        df = df[mask]
+    return df.sort_values('num_votes', ascending=False, kind='stable').head(n_recommendations)
+
+def table_neighbors(catalog, titles, mood, era, genre, n_recommendations=5, depth=None):
+    """Catalog rows recommended from the catalog's neighbor table, or None.
+
+    The table answers single-title requests: unfiltered ones in any model
+    mode, and filtered ones in global mode, where the filter only masks the
+    unfiltered latent space. Filtered local models are fitted on their own
+    rows and are never answered from the table. None means the regular
+    path has to run (no table, several titles, no matching title, or too
+    few listed neighbors pass the filter). Filters must be normalized.
+    With a depth, up to depth listed rows are returned.
+    """
+    table = catalog.neighbor_table
+    title_index = catalog.title_index
+    filtered = any((mood, era, genre))
+    if table is None or title_index is None or len(titles) != 1 or filtered and MODEL_MODE != 'global':
+        return None
+    
+    with metrics.stage('neighbor_table', rows=len(titles)):
+        row = resolve_title(title_index, titles[0])
+        if row is None:
+            return None
+        if filtered:
+            mask = filter_rows(catalog.df, mood, era, genre, catalog.domain, catalog.genre_index, catalog.active,
+                               catalog.popularity)
+        else:
+            mask = catalog.active
+        return table.neighbors(row, n_recommendations, mask, depth)
+
+# Function to Find Similar Items
+def find_similar_items(titles, full_df, positions, latent_matrix, knn_model, domain="book", n_recommendations=5,
+                       title_index=None, active=None, popularity=None, filters=(None, None, None)):
+    """Find similar items based on input titles.
+
+    positions are the catalog rows the model was fitted on; active,
+    popularity and the normalized filters select the popular items
+    returned when no title matches.
+    """
+    # Find matching items in the filtered dataset
+    with metrics.stage('title_match', rows=len(titles)):
+        match = title_matcher(full_df, positions, title_index)
+        item_indices = [idx for idx in map(match, titles) if idx is not None]
     
     if not item_indices:
         # Fallback to popular items if no matches
-        return full_df.sort_values('num_votes', ascending=False).head(n_recommendations)
+        return popular_items(full_df, domain, n_recommendations, active, popularity, filters)
     
     # Aggregate latent features of input items
     aggregated_features = np.mean(latent_matrix[item_indices], axis=0).reshape(1, -1)
     
     # Find nearest neighbors
-    distances, indices = knn_model.kneighbors(aggregated_features, n_neighbors=n_recommendations + len(item_indices))
+    with metrics.stage('knn_query', rows=len(positions)):
+        n_neighbors = min(n_recommendations + len(item_indices), len(positions))
+        distances, indices = knn_model.kneighbors(aggregated_features, n_neighbors=n_neighbors)
     
     # Filter out input items from recommendations
     input_indices_set = set(item_indices)
     similar_indices = [idx for idx in indices[0] if idx not in input_indices_set][:n_recommendations]
     
-    # Extract appropriate fields based on domain
-    if domain == "anime":
-        fields = ['title', 'author', 'genre', 'avg_rating', 'scored_by', 'image_url']
-    elif domain == "movie":
-        fields = ['title', 'author', 'genre', 'avg_rating', 'num_votes', 'img']
-    else:  # Book
-        fields = ['title', 'author', 'genres', 'avg_rating', 'num_votes', 'img']
+    return select_result_fields(full_df, positions[similar_indices], domain)
+
+def filter_rows(df, mood, era, genre, domain="book", genre_index=None, active=None, popularity=None):
+    """Row mask for the filters, falling back like filter_dataset/filter_movie_dataset.
+
+    Returns None when every row is selected; active and popularity are as
+    for filter_positions.
+    """
+    mask = match_mask(df, mood, era, genre, domain, genre_index)
+    if active is not None:
+        mask &= active
+    if mask.all():
+        return None
+    if mask.any():
+        return mask
     
-    # Use available fields from the DataFrame
-    available_fields = [f for f in fields if f in filtered_df.columns]
+    # If we filtered too aggressively, use a broader set of rows
+    if domain != "movie":
+        return active
+    target_genres = get_target_genres(mood, genre, domain)
+    if era and era != 'any' and target_genres:
+        by_genre = genre_mask(df, target_genres, domain, genre_index)
+        if active is not None:
+            by_genre &= active
+        if by_genre.sum() >= 10:
+            return by_genre
+    rows = popularity.top((None, None, None), 100) if popularity is not None else None
+    if rows is None:
+        votes = df['num_votes'].to_numpy()
+        candidates = np.arange(len(df)) if active is None else np.flatnonzero(active)
+        rows = candidates[np.argsort(-votes[candidates], kind='stable')[:100]]
+    mask = np.zeros(len(df), dtype=bool)
+    mask[rows] = True
+    return mask
+
+def get_global_model(catalog):
+    """Return the global latent model of a CatalogVersion, factorizing its full catalog on first use."""
+    domain, df = catalog.domain, catalog.df
+    key = (domain, 'global', catalog.version)
+
+    def build():
+        shared_key = model_key(catalog, 'global')
+        if shared_key is None:
+            return GlobalLatentModel(*fit_latent(df, domain, return_projection=True), catalog.seq)
+
+        def fit():
+            model = GlobalLatentModel(*fit_latent(df, domain, return_projection=True))
+            parts = {f'projection.{name}': values for name, values in model.projection.arrays().items()}
+            return {'vectors': model.vectors, **parts}
+        entry = model_store.get_or_publish(shared_key, fit, model_tags(catalog, 'global'))
+        return GlobalLatentModel.from_vectors(entry['vectors'], stored_projection(entry), catalog.seq)
+
+    if not is_current(catalog):
+        # A replaced version only serves the requests still running on it
+        return build()
+    model = model_cache.get_or_build(key, build)
+    if model.catalog_seq > catalog.seq:
+        # Already holds updates made after this request took its catalog
+        return build()
+    if model.catalog_seq < catalog.seq:
+        # Project the rows changed by catalog updates into the existing space
+        with metrics.stage('fold_in'):
+            rows = catalog.log.rows_since(model.catalog_seq, catalog.seq)
+            model = model_cache.put(key, model.updated(df, rows, catalog.seq))
+    return model
+
+def find_similar_items_global(titles, catalog, mood, era, genre, n_recommendations=5):
+    """Find similar items in the catalog's global latent space, restricted to the filtered rows.
+
+    Input titles are looked up in the whole catalog, so a title outside the
+    filter still steers the recommendations.
+    """
+    domain, df = catalog.domain, catalog.df
+    model = get_global_model(catalog)
+    with metrics.stage('title_match', rows=len(titles)):
+        match = title_matcher(df, np.arange(len(df)), catalog.title_index)
+        item_indices = [idx for idx in map(match, titles) if idx is not None]
     
-    # Map indices back to the filtered DataFrame
-    similar_items = filtered_df.iloc[similar_indices][available_fields]
+    mood, era, genre = normalize_filters(domain, mood, era, genre)
+    if not item_indices:
+        # Fallback to popular items if no matches
+        return popular_items(df, domain, n_recommendations, catalog.active, catalog.popularity, (mood, era, genre))
     
-    return similar_items
+    with metrics.stage('filter') as stage:
+        mask = filter_rows(df, mood, era, genre, domain, catalog.genre_index, catalog.active, catalog.popularity)
+        stage.rows = len(catalog) if mask is None else int(np.count_nonzero(mask))
+    with metrics.stage('top_k', rows=len(df)):
+        rows, _ = model.top_k(model.query_vector(item_indices), n_recommendations, mask, [item_indices])
+    return select_result_fields(df, rows[0], domain)
 
 @app.get("/")
 def read_root():
     return {"message": "Recommendation API is running"}
 
-@app.post("/recommendations/books/")
-async def get_book_recommendations(request: RecommendationRequest):
-    try:
-        # Check if we have titles
-        if not request.titles or len(request.titles) == 0:
-            raise HTTPException(status_code=400, detail="No book titles provided")
-        
-        # Force domain to be "book" regardless of what was sent
-        domain = "book"
-        df = app.book_df
-            
-        # Filter the dataset based on user preferences
-        filtered_df = filter_dataset(df, request.mood, request.era, request.genre, domain)
-        
-        # Build the model
-        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain)
-        
-        # Get recommendations
-        similar_items = find_similar_items(
-            request.titles, 
-            df,
-            filtered_df, 
-            item_latent_matrix, 
-            knn, 
-            domain,
-            n_recommendations=5
+@app.get("/cache/stats")
+def cache_stats():
+    return {"model_cache": model_cache.stats(), "result_cache": result_cache.stats(),
+            "ranking_cache": ranking_cache.stats(), "executor": executor.stats()}
+
+def domain_memory(domain):
+    """Estimated bytes held for a domain: catalog, indexes and cached models."""
+    catalog = app.catalogs.get(domain)
+    if catalog is None:
+        return {'catalog': 0, 'genre_index': 0, 'title_index': 0, 'popularity': 0, 'models': 0}
+    return {
+        'catalog': frame_nbytes(catalog.df),
+        'genre_index': estimate_nbytes(catalog.genre_index),
+        'title_index': estimate_nbytes(catalog.title_index),
+        'popularity': estimate_nbytes(catalog.popularity),
+        'models': model_cache.nbytes(lambda key: key[0] == domain),
+    }
+
+@app.get("/memory")
+def memory_report():
+    domains = {domain: domain_memory(domain) for domain in RECOMMENDER_DOMAINS}
+    # Arrays in the shared store are mapped by every worker but held once
+    shared = sum(shared_store.entries().values()) if shared_store is not None else 0
+    report = {"catalog_mode": CATALOG_MODE, "domains": domains, "shared_bytes": shared}
+    if model_store is not None and model_store is not shared_store:
+        # Stored models on disk, mapped like shared arrays
+        report["model_store_bytes"] = sum(model_store.entries().values())
+    return report
+
+def dataset_status(domain):
+    """Registry status of a domain plus details of its loaded catalog."""
+    status = registry.status(domain)
+    if status['status'] == 'ready':
+        catalog = app.catalogs[domain]
+        status.update(
+            records=len(catalog),
+            source=catalog.source,
+            version=catalog.version,
+            data_version=catalog.data_version,
+            catalog_seq=catalog.seq,
+            drift=catalog.log.drift,
+            # Replaced versions that running requests still hold on to
+            draining=sorted(old.version for old in list(app.retired_catalogs) if old.domain == domain)
         )
-        
-        # Convert results to a list of dictionaries
-        recommendations = []
-        for _, item in similar_items.iterrows():
-            try:
-                rec_item = {
-                    'id': item.get('item_id', ''),
-                    'title': item.get('title', 'Unknown Title'),
-                    'author': item.get('author', 'Unknown Creator'),
-                    'rating': float(item.get('avg_rating', 0)),
-                    'image': item.get('img', "https://via.placeholder.com/150x225?text=No+Cover"),
-                    'year': int(item.get('year', 0)) if 'year' in item and pd.notna(item['year']) else None
-                }
-                
-                # Ensure the image URL is valid
-                if rec_item['image'] in ['Unknown', '', None]:
-                    rec_item['image'] = "https://via.placeholder.com/150x225?text=No+Cover"
-                    
-                recommendations.append(rec_item)
-            except Exception as e:
-                print(f"Error processing book: {e}")
-                continue
-        
-        return {"recommendations": recommendations, "domain": domain}
-    
+    if domain in app.reloads:
+        status['reload'] = dict(app.reloads[domain])
+    # A lazy worker can serve a domain it has not loaded yet
+    status['ready'] = status['status'] == 'ready' or (
+        DATASET_PRELOAD == 'lazy' and status['status'] == 'not_loaded'
+    )
+    return status
+
+@app.get("/ready")
+def readiness():
+    domains = {domain: dataset_status(domain) for domain in RECOMMENDER_DOMAINS}
+    ready = all(status['ready'] for status in domains.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "domains": domains})
+
+@app.get("/ready/{domain}")
+def domain_readiness(domain: str):
+    require_domain(domain)
+    status = dataset_status(domain)
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
+def component_metrics():
+    """Gauges and counters of the model cache, the executor and the dataset registry."""
+    cache = model_cache.stats()
+    results = result_cache.stats()
+    pool = executor.stats()
+    return [
+        ('recommender_model_cache_hits_total', 'counter', 'Model cache hits.', [({}, cache['hits'])]),
+        ('recommender_model_cache_misses_total', 'counter', 'Model cache misses.', [({}, cache['misses'])]),
+        ('recommender_model_cache_evictions_total', 'counter', 'Models evicted from the cache.',
+         [({}, cache['evictions'])]),
+        ('recommender_model_cache_entries', 'gauge', 'Models held in the cache.', [({}, cache['entries'])]),
+        ('recommender_model_cache_bytes', 'gauge', 'Estimated bytes held by cached models.', [({}, cache['bytes'])]),
+        ('recommender_result_cache_hits_total', 'counter', 'Responses served from the result cache.',
+         [({}, results['hits'])]),
+        ('recommender_result_cache_misses_total', 'counter', 'Result cache misses.', [({}, results['misses'])]),
+        ('recommender_result_cache_coalesced_total', 'counter',
+         'Requests that waited for an identical request in flight.', [({}, results['coalesced'])]),
+        ('recommender_result_cache_entries', 'gauge', 'Responses held in the result cache.',
+         [({}, results['entries'])]),
+        ('recommender_executor_in_flight', 'gauge', 'Recommendation jobs running or queued.',
+         [({'mode': pool['mode']}, pool['in_flight'])]),
+        ('recommender_executor_rejected_total', 'counter', 'Jobs rejected because the queue was full.',
+         [({'mode': pool['mode']}, pool['rejected'])]),
+        ('recommender_executor_timed_out_total', 'counter', 'Jobs that exceeded the timeout.',
+         [({'mode': pool['mode']}, pool['timed_out'])]),
+        ('recommender_dataset_ready', 'gauge', 'Whether a domain can serve requests.',
+         [({'domain': domain}, int(dataset_status(domain)['ready'])) for domain in RECOMMENDER_DOMAINS]),
+    ]
+
+metrics.add_collector(component_metrics)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+if SERVER_TIMING:
+    @app.middleware("http")
+    async def add_server_timing(request, call_next):
+        """Report the stage timings of each request in a Server-Timing header."""
+        timings = start_request_timings()
+        response = await call_next(request)
+        if timings:
+            response.headers['Server-Timing'] = server_timing(timings)
+        return response
+
+def require_domain(domain):
+    if domain not in RECOMMENDER_DOMAINS:
+        raise HTTPException(status_code=404, detail=f"The {domain} domain is not served here")
+
+def require_admin(authorization: str = Header(None)):
+    """Dependency of the admin endpoints: the request must carry ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+def require_catalog_updates(_=Depends(require_admin)):
+    if not CATALOG_UPDATES:
+        raise HTTPException(status_code=403, detail="Catalog updates are disabled; set CATALOG_UPDATES=1")
+
+def filter_label(domain, mood, era, genre):
+    """Metric label for a request's filters, e.g. 'light/-/fantasy'."""
+    mood, era, genre = normalize_filters(domain, mood, era, genre)
+    return '/'.join(value or '-' for value in (mood, era, genre))
+
+async def dispatch(label, fn, *args, cache_key=None, if_none_match=None, method='POST'):
+    """Run a recommendation function on the executor, encode its result and map failures to HTTP errors.
+
+    With a cache_key the encoded result is shared through the result cache
+    and sent with ETag and Cache-Control headers; when a GET request's
+    if_none_match lists its ETag the response is an empty 304 instead.
+    """
+    with http_errors(label), metrics.labels(label, ''):
+        if cache_key is not None:
+            entry = await result_cache.get_or_compute(cache_key, lambda: encoded_result(fn, *args))
+            return cached_response(entry, if_none_match, method)
+        with metrics.stage('request'):
+            result = await executor.run(fn, *args)
+        with metrics.stage('encode'):
+            # Report the catalog version a single recommendation was computed from
+            headers = {'X-Data-Version': result['data_version']} if 'data_version' in result else None
+            return json_response(result, headers)
+
+@contextlib.contextmanager
+def http_errors(label):
+    """Map failures of recommendation work to HTTP errors."""
+    try:
+        yield
+    except HTTPException:
+        raise
+    except CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ExecutorTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except DatasetUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        print(f"Error in book recommendation endpoint: {e}")
+        print(f"Error in {label} recommendation endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/recommendations/anime/")
-async def get_anime_recommendations(request: RecommendationRequest):
+async def encoded_result(fn, *args):
+    """Run fn on the executor; return its encoded result as (body, etag, data_version)."""
+    with metrics.stage('request'):
+        result = await executor.run(fn, *args)
+    with metrics.stage('encode'):
+        body = encode_json(result)
+    return body, entity_tag(body), result.get('data_version')
+
+def cached_response(entry, if_none_match=None, method='GET'):
+    """The response for a result cache entry, or a 304 if a GET client already holds it."""
+    body, etag, data_version = entry
+    # Only GET and HEAD responses can be revalidated or stored by shared caches
+    safe = method in ('GET', 'HEAD')
+    headers = {'ETag': etag, 'Cache-Control': f"{'public' if safe else 'private'}, max-age={RESULT_MAX_AGE}"}
+    if data_version is not None:
+        headers['X-Data-Version'] = data_version
+    if safe and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def result_key(domain, request):
+    """Result cache key of a recommendation request, or None if it cannot be cached yet.
+
+    Titles are normalized the way title lookups compare them and sorted,
+    since their order does not change the recommendations.
+    """
+    if RECOMMENDER_EXECUTOR == 'process':
+        # Worker processes never change their catalogs (updates and reloads need threads)
+        version = 'worker'
+    else:
+        catalog = app.catalogs.get(domain)
+        if catalog is None:
+            return None
+        version = catalog.data_version
+    return query_key(domain, request) + (page_limit(request), request.cursor, version)
+
+def query_key(domain, request):
+    """A request's domain, titles and filters, normalized.
+
+    Titles are normalized the way title lookups compare them and sorted,
+    since their order does not change the recommendations.
+    """
+    titles = tuple(sorted(normalize_title(title) for title in request.titles))
+    return (domain, titles) + normalize_filters(domain, request.mood, request.era, request.genre)
+
+def page_limit(request):
+    """Results per page of a request; raises ValueError for limits outside 1..RECOMMENDATIONS_MAX_RESULTS."""
+    limit = RECOMMENDATIONS_LIMIT if request.limit is None else request.limit
+    if not 1 <= limit <= RECOMMENDATIONS_MAX_RESULTS:
+        raise ValueError(f"limit must be between 1 and {RECOMMENDATIONS_MAX_RESULTS}")
+    return limit
+
+async def dispatch_recommend(domain, request, http_request):
+    """Serve a single recommendation request through the result cache, or as an NDJSON stream."""
     try:
-        # Check if we have titles
-        if not request.titles or len(request.titles) == 0:
-            raise HTTPException(status_code=400, detail="No anime titles provided")
-        
-        # Force domain to be "anime" regardless of what was sent
-        domain = "anime"
-        df = app.anime_df
-            
-        # Filter the dataset based on user preferences
-        filtered_df = filter_dataset(df, request.mood, request.era, request.genre, domain)
-        
-        # Build the model
-        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain)
-        
-        # Get recommendations
-        similar_items = find_similar_items(
-            request.titles, 
-            df,
-            filtered_df, 
-            item_latent_matrix, 
-            knn, 
-            domain,
-            n_recommendations=5
-        )
-        
-        # Convert results to a list of dictionaries
-        recommendations = []
-        for _, item in similar_items.iterrows():
+        page_limit(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if 'application/x-ndjson' in http_request.headers.get('accept', ''):
+        return await stream_recommendations(domain, request)
+    return await dispatch(domain, recommend, request, domain, cache_key=result_key(domain, request),
+                          if_none_match=http_request.headers.get('if-none-match'), method=http_request.method)
+
+async def stream_recommendations(domain, request):
+    """Send a request's recommendations as NDJSON, one line per item.
+
+    The ranking is computed before the response starts, so errors still
+    get their status code; the items then follow a chunk at a time, each
+    chunk being a page of the cached ranking. A final {"next_cursor": ...}
+    line follows when there are more results.
+    """
+    limit = page_limit(request)
+    chunk = lambda sent, cursor: request.model_copy(
+        update={'limit': min(limit - sent, RECOMMENDATIONS_STREAM_CHUNK), 'cursor': cursor})
+    with http_errors(domain), metrics.labels(domain, ''):
+        with metrics.stage('request'):
+            page = await executor.run(recommend, chunk(0, request.cursor), domain)
+
+    async def lines():
+        nonlocal page
+        sent = 0
+        while True:
+            with metrics.stage('encode'):
+                yield b''.join(encode_json(item) + b'\n' for item in page['recommendations'])
+            sent += len(page['recommendations'])
+            if page['next_cursor'] is None or sent >= limit or not page['recommendations']:
+                break
             try:
-                rec_item = {
-                    'id': item.get('item_id', ''),
-                    'title': item.get('title', 'Unknown Title'),
-                    'author': item.get('author', 'Unknown Creator'), 
-                    'rating': float(item.get('avg_rating', 0)),
-                    'image': item.get('image_url', "https://via.placeholder.com/150x225?text=No+Cover"),
-                    'year': int(item.get('aired_from_year', 0)) if 'aired_from_year' in item else None,
-                    'genre': item.get('genre', '')
-                }
-                
-                # Ensure the image URL is valid
-                if rec_item['image'] in ['Unknown', '', None]:
-                    rec_item['image'] = "https://via.placeholder.com/150x225?text=No+Cover"
-                    
-                recommendations.append(rec_item)
+                page = await executor.run(recommend, chunk(sent, page['next_cursor']), domain)
             except Exception as e:
-                print(f"Error processing anime: {e}")
-                continue
-        
-        return {"recommendations": recommendations, "domain": domain}
-    
-    except Exception as e:
-        print(f"Error in anime recommendation endpoint: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+                # The status line is long gone; end the stream early
+                print(f"Error streaming {domain} recommendations: {e}")
+                return
+        if page['next_cursor'] is not None:
+            yield encode_json({'next_cursor': page['next_cursor']}) + b'\n'
 
-@app.post("/recommendations/movies/")
-async def get_movie_recommendations(request: RecommendationRequest):
-    try:
-        # Check if we have titles
-        if not request.titles or len(request.titles) == 0:
-            raise HTTPException(status_code=400, detail="No movie titles provided")
-        
-        # Force domain to be "movie" regardless of what was sent
-        domain = "movie"
-        df = app.movie_df
-            
-        # Filter the dataset based on user preferences
-        filtered_df = filter_movie_dataset(df, request.mood, request.era, request.genre)
-        
-        # Build the model
-        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain)
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={'X-Data-Version': page['data_version']})
+
+def ranked_items(catalog, request, needed):
+    """The ranked results of a request as (frame, complete), best first.
+
+    A query is ranked RECOMMENDATIONS_MAX_RESULTS deep once per catalog
+    version and pages are slices of the frame, so paging costs one model
+    evaluation. A single title answered from the neighbor table is only
+    ranked as deep as the table lists neighbors (complete is then False),
+    and a page past those ranks it again with the model. needed is the
+    number of results the current page reaches down to.
+    """
+    domain, df = catalog.domain, catalog.df
+    mood, era, genre = normalize_filters(domain, request.mood, request.era, request.genre)
+    key = query_key(domain, request) + (catalog.data_version,)
+    ranked = ranking_cache.get(key)
+    if ranked is not None and (ranked[1] or len(ranked[0]) >= needed):
+        return ranked
+    
+    depth = RECOMMENDATIONS_MAX_RESULTS
+    # Single titles are looked up in the precomputed neighbor table when possible
+    rows = table_neighbors(catalog, request.titles, mood, era, genre, needed, depth)
+    if rows is not None:
+        table = catalog.neighbor_table
+        ranked = select_result_fields(df, rows, domain), table.complete or len(rows) >= depth
+    elif MODEL_MODE == 'global':
+        ranked = find_similar_items_global(
+            request.titles, catalog, mood, era, genre, n_recommendations=depth
+        ), True
+    else:
+        # Filter the dataset and build the model, reusing a cached fit when possible
+        item_latent_matrix, knn, positions = get_model(catalog, mood, era, genre)
         
         # Get recommendations
         similar_items = find_similar_items(
             request.titles, 
             df,
-            filtered_df, 
+            positions, 
             item_latent_matrix, 
             knn, 
             domain,
-            n_recommendations=5
+            n_recommendations=depth,
+            title_index=catalog.title_index,
+            active=catalog.active,
+            popularity=catalog.popularity,
+            filters=(mood, era, genre)
         )
+        ranked = similar_items, True
+    return ranking_cache.put(key, ranked)
+
+def recommend(request, domain):
+    """Compute a page of recommendations for one domain; runs on the recommendation executor."""
+    # Everything below uses this one version, even if a reload swaps in another meanwhile
+    catalog = get_catalog(domain)
+    query = query_key(domain, request)
+    offset = decode_cursor(request.cursor, catalog.data_version, query) if request.cursor else 0
+    limit = page_limit(request)
+    
+    with metrics.labels(domain, filter_label(domain, request.mood, request.era, request.genre)):
+        ranked, complete = ranked_items(catalog, request, offset + limit)
+        page = ranked.iloc[offset:offset + limit]
         
         # Convert results to a list of dictionaries
-        recommendations = []
-        for _, item in similar_items.iterrows():
-            try:
-                rec_item = {
-                    'id': item.get('item_id', ''),
-                    'title': item.get('title', 'Unknown Title'),
-                    'type': item.get('titleType', 'movie') if 'titleType' in item else 'movie',
-                    'rating': float(item.get('avg_rating', 0)),
-                    'image': item.get('img', "https://via.placeholder.com/150x225?text=Movie+Poster"),
-                    'year': int(item.get('year', 0)) if 'year' in item and pd.notna(item['year']) else None,
-                    'genre': item.get('genre', '')
-                }
-                
-                recommendations.append(rec_item)
-            except Exception as e:
-                print(f"Error processing movie/show: {e}")
-                continue
-        
-        return {"recommendations": recommendations, "domain": domain}
+        with metrics.stage('format', rows=len(page)):
+            recommendations = format_recommendations(page, domain)
     
-    except Exception as e:
-        print(f"Error in movie recommendation endpoint: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    end = offset + limit
+    more = end < RECOMMENDATIONS_MAX_RESULTS and (end < len(ranked) or not complete and end == len(ranked))
+    next_cursor = encode_cursor(end, catalog.data_version, query) if more else None
+    return {"recommendations": recommendations, "domain": domain, "data_version": catalog.data_version,
+            "next_cursor": next_cursor}
+
+@app.post("/recommendations/books/")
+async def get_book_recommendations(request: RecommendationRequest, http_request: Request):
+    # Check if we have titles
+    if not request.titles or len(request.titles) == 0:
+        raise HTTPException(status_code=400, detail="No book titles provided")
+    
+    # Force domain to be "book" regardless of what was sent
+    require_domain("book")
+    return await dispatch_recommend("book", request, http_request)
+
+@app.post("/recommendations/anime/")
+async def get_anime_recommendations(request: RecommendationRequest, http_request: Request):
+    # Check if we have titles
+    if not request.titles or len(request.titles) == 0:
+        raise HTTPException(status_code=400, detail="No anime titles provided")
+    
+    # Force domain to be "anime" regardless of what was sent
+    require_domain("anime")
+    return await dispatch_recommend("anime", request, http_request)
+
+@app.post("/recommendations/movies/")
+async def get_movie_recommendations(request: RecommendationRequest, http_request: Request):
+    # Check if we have titles
+    if not request.titles or len(request.titles) == 0:
+        raise HTTPException(status_code=400, detail="No movie titles provided")
+    
+    # Force domain to be "movie" regardless of what was sent
+    require_domain("movie")
+    return await dispatch_recommend("movie", request, http_request)
 
 # You can keep the generic endpoint or remove it if you only want the specific ones
 # If you want to keep it, make sure it calls the appropriate specific function based on domain:
 
 @app.post("/recommendations/")
-async def get_recommendations(request: RecommendationRequest):
+async def get_recommendations(request: RecommendationRequest, http_request: Request):
     if request.domain == "anime":
-        return await get_anime_recommendations(request)
+        return await get_anime_recommendations(request, http_request)
     elif request.domain == "movie":
-        return await get_movie_recommendations(request)
+        return await get_movie_recommendations(request, http_request)
     else:
-        return await get_book_recommendations(request)
+        return await get_book_recommendations(request, http_request)
 
-def filter_movie_dataset(df, mood, era, genre):
-    """Filter the movie dataset based on user-selected mood, era, and genre."""
-    filtered_df = df.copy()
-    
-    # Step 1: Genre Filtering
-    target_genres = []
-    if genre and genre in movie_genre_mapping:
-        target_genres.append(movie_genre_mapping[genre])
-    
-    if mood and mood in mood_to_movie_genres:
-        target_genres.extend(mood_to_movie_genres[mood])
-    
-    target_genres = list(set(target_genres))  # Remove duplicates
-    
-    if target_genres:
-        genre_filter = filtered_df['genre'].apply(
-            lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-        )
-        filtered_df = filtered_df[genre_filter]
+@app.get("/recommendations/{domain}")
+async def get_recommendations_query(domain: str, http_request: Request, title: list[str] = Query(None),
+                                    mood: str = None, era: str = None, genre: str = None,
+                                    limit: int = None, cursor: str = None):
+    """GET form of a recommendation request, e.g. ?title=Dune&title=Akira&mood=dark.
+
+    Its responses can be stored by shared caches and revalidated with
+    If-None-Match, which POST responses cannot.
+    """
+    require_domain(domain)
+    if not title:
+        raise HTTPException(status_code=400, detail="No titles provided")
+    fields = {'mood': mood, 'era': era, 'genre': genre, 'limit': limit, 'cursor': cursor}
+    request = RecommendationRequest(titles=title, domain=domain,
+                                    **{name: value for name, value in fields.items() if value is not None})
+    return await dispatch_recommend(domain, request, http_request)
+
+def request_domain(request):
+    """Domain a generic request is routed to."""
+    return request.domain if request.domain in ("anime", "movie") else "book"
+
+def recommend_batch(batch):
+    """Answer many recommendation requests at once; runs on the recommendation executor.
+
+    Requests are grouped by domain and filters so each group builds (or
+    reuses) one model and queries the neighbor index with a single matrix
+    of aggregated title vectors. Results keep the input order, and a failing
+    request only produces an error entry for itself. Each request gets the
+    first page of its results; batches do not take cursors.
+    """
+    results = [None] * len(batch.requests)
+    limits = [None] * len(batch.requests)
     
-    # Step 2: Era Filtering
-    if era and era != 'any':
-        if era in era_to_movie_years and era_to_movie_years[era]:
-            start_year, end_year = era_to_movie_years[era]
-            year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
-            filtered_df = filtered_df[year_filter]
+    # Group requests that share a model
+    groups = {}
+    for i, request in enumerate(batch.requests):
+        domain = request_domain(request)
+        if not request.titles:
+            results[i] = {"error": f"No {domain} titles provided", "status": 400, "domain": domain}
+            continue
+        if domain not in RECOMMENDER_DOMAINS:
+            results[i] = {"error": f"The {domain} domain is not served here", "status": 404, "domain": domain}
+            continue
+        try:
+            if request.cursor:
+                raise ValueError("Batch requests do not take cursors")
+            limits[i] = page_limit(request)
+        except ValueError as e:
+            results[i] = {"error": str(e), "status": 400, "domain": domain}
+            continue
+        key = (domain,) + normalize_filters(domain, request.mood, request.era, request.genre)
+        groups.setdefault(key, []).append(i)
     
-    # If we filtered too aggressively, return a broader dataset
-    print(len(filtered_df))
-    if len(filtered_df) < 1:
-        print(f"Warning: Too few movies match filters. Using broader dataset.")
-        
-        # Try just using the genre filter if era was specified
-        if era and era != 'any' and target_genres:
-            filtered_by_genre = df.copy()
-            genre_filter = filtered_by_genre['genre'].apply(
-                lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-            )
-            filtered_by_genre = filtered_by_genre[genre_filter]
+    for (domain, mood, era, genre), members in groups.items():
+        with metrics.labels(domain, '/'.join(value or '-' for value in (mood, era, genre))):
+            try:
+                catalog = get_catalog(domain)
+                df = catalog.df
+                served = {"domain": domain, "data_version": catalog.data_version}
+                
+                # Single titles are answered from the neighbor table when possible
+                pending = []
+                for i in members:
+                    rows = table_neighbors(catalog, batch.requests[i].titles, mood, era, genre, limits[i])
+                    if rows is None:
+                        pending.append(i)
+                        continue
+                    similar_items = select_result_fields(df, rows, domain)
+                    results[i] = {"recommendations": format_recommendations(similar_items, domain), **served}
+                if not pending:
+                    continue
+                members = pending
+                n_recommendations = max(limits[i] for i in members)
+                
+                if MODEL_MODE == 'global':
+                    # Titles are looked up in the whole catalog, the filter only masks results
+                    model = get_global_model(catalog)
+                    positions = np.arange(len(df))
+                else:
+                    latent_matrix, knn, positions = get_model(catalog, mood, era, genre)
+                match = title_matcher(df, positions, catalog.title_index)
+                
+                # Aggregate the latent vectors of each request's matched titles
+                queries, query_inputs = [], []
+                popular = None
+                for i in members:
+                    with metrics.stage('title_match', rows=len(batch.requests[i].titles)):
+                        item_indices = [idx for idx in map(match, batch.requests[i].titles) if idx is not None]
+                    if not item_indices:
+                        # Fallback to popular items if no matches
+                        if popular is None:
+                            popular = format_recommendations(popular_items(
+                                df, domain, n_recommendations, catalog.active, catalog.popularity, (mood, era, genre)
+                            ), domain)
+                        results[i] = {"recommendations": popular[:limits[i]], **served}
+                        continue
+                    queries.append(i)
+                    query_inputs.append(item_indices)
+                
+                if not queries:
+                    continue
+                
+                if MODEL_MODE == 'global':
+                    with metrics.stage('filter') as stage:
+                        mask = filter_rows(df, mood, era, genre, domain, catalog.genre_index, catalog.active,
+                                           catalog.popularity)
+                        stage.rows = len(catalog) if mask is None else int(np.count_nonzero(mask))
+                    query_vectors = np.vstack([model.query_vector(idx) for idx in query_inputs])
+                    with metrics.stage('top_k', rows=len(df)):
+                        indices, _ = model.top_k(query_vectors, n_recommendations, mask, query_inputs)
+                else:
+                    aggregated_features = np.vstack([np.mean(latent_matrix[idx], axis=0) for idx in query_inputs])
+                    n_neighbors = min(n_recommendations + max(len(idx) for idx in query_inputs), len(positions))
+                    with metrics.stage('knn_query', rows=len(positions)):
+                        distances, indices = knn.kneighbors(aggregated_features, n_neighbors=n_neighbors)
+                
+                for i, item_indices, neighbors in zip(queries, query_inputs, indices):
+                    # Filter out input items from recommendations
+                    input_indices_set = set(item_indices)
+                    similar_indices = [idx for idx in neighbors if idx not in input_indices_set][:limits[i]]
+                    similar_items = select_result_fields(df, positions[similar_indices], domain)
+                    with metrics.stage('format', rows=len(similar_items)):
+                        results[i] = {"recommendations": format_recommendations(similar_items, domain), **served}
             
-            if len(filtered_by_genre) >= 10:
-                return filtered_by_genre
+            except Exception as e:
+                print(f"Error in batch recommendation group {(domain, mood, era, genre)}: {e}")
+                status = 503 if isinstance(e, DatasetUnavailable) else 500
+                for i in members:
+                    if results[i] is None:
+                        results[i] = {"error": str(e), "status": status, "domain": domain}
         
-        # If still not enough, return most popular items
-        return df.sort_values('num_votes', ascending=False).head(100)
+    return {"results": results}
+
+@app.post("/recommendations/batch/")
+async def get_batch_recommendations(batch: BatchRecommendationRequest):
+    if len(batch.requests) > RECOMMENDER_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {RECOMMENDER_MAX_BATCH} requests per batch")
     
-    return filtered_df
+    return await dispatch("batch", recommend_batch, batch)
 
-@app.on_event("startup")
-async def startup_movie_db():
+def update_catalog(fn, domain, *args):
+    """Apply a catalog update in this process and map failures to HTTP errors."""
+    require_domain(domain)
+    if RECOMMENDER_EXECUTOR == 'process':
+        # Worker processes hold their own copies of the catalog
+        raise HTTPException(status_code=409, detail="Catalog updates need RECOMMENDER_EXECUTOR=thread")
     try:
-        # Set base path for data files
-        base_path = os.path.join(os.path.dirname(__file__), '')
-        
-        # Path to the original and processed movie data
-        movie_raw_path = os.path.join(base_path, 'title.basics.tsv')
-        movie_processed_path = os.path.join(base_path, 'movie_processed.csv')
-        
-        if os.path.exists(movie_processed_path):
-            # Load preprocessed data if available
-            app.movie_df = pd.read_csv(movie_processed_path)
-            print(f"Loaded movie dataset with {len(app.movie_df)} records")
-        elif os.path.exists(movie_raw_path):
-            print(f"Processing raw movie/TV dataset from {movie_raw_path}...")
-            # Process raw data if the processed file doesn't exist
-            # Read only necessary columns to reduce memory usage
-            cols_to_use = ['tconst', 'titleType', 'primaryTitle', 'startYear', 'genres', 'isAdult']
-            
-            # Read the TSV file in chunks to manage memory usage
-            chunks = []
-            for chunk in pd.read_csv(movie_raw_path, sep='\t', usecols=cols_to_use, 
-                                    chunksize=100000, low_memory=False):
-                # Filter out non-movies/TV shows and adult content
-                filtered_chunk = chunk[(chunk['titleType'].isin(['movie', 'tvSeries', 'tvMiniSeries'])) & 
-                                      (chunk['isAdult'] == 0)]
-                chunks.append(filtered_chunk)
-            
-            # Combine all chunks
-            movie_df = pd.concat(chunks, ignore_index=True)
-            
-            # Rename columns
-            movie_df = movie_df.rename(columns={
-                'tconst': 'item_id',
-                'primaryTitle': 'title',
-                'startYear': 'year',
-                'genres': 'genre'
-            })
-            
-            # Clean up the year field
-            movie_df['year'] = pd.to_numeric(movie_df['year'], errors='coerce')
-            movie_df = movie_df.dropna(subset=['year', 'genre'])
-            movie_df = movie_df[movie_df['year'] != '\\N']
-            movie_df['year'] = movie_df['year'].astype(float).astype('Int64')
-            
-            # Replace "\N" with NaN in genre
-            movie_df['genre'] = movie_df['genre'].replace("\\N", np.nan)
-            movie_df = movie_df.dropna(subset=['genre'])
-            
-            # Add placeholder ratings since title.basics doesn't have ratings
-            movie_df['avg_rating'] = 7.0  # Placeholder rating
-            movie_df['num_votes'] = 1000  # Placeholder votes
-            
-            # Generate placeholder image URLs
-            movie_df['img'] = movie_df['item_id'].apply(
-                lambda x: f"https://m.media-amazon.com/images/M/{x[2:]}._V1_SX300.jpg"
-            )
-            
-            # Add domain and creator placeholder
-            movie_df['domain'] = 'movie'
-            movie_df['author'] = movie_df['titleType'].apply(lambda x: 'Director' if x == 'movie' else 'Creator')
-            
-            # Select final columns and save processed file
-            movie_df = movie_df[['item_id', 'title', 'titleType', 'author', 'genre', 'year', 
-                               'avg_rating', 'num_votes', 'domain', 'img']]
-            
-            # Save sampled data for faster loading next time
-            if len(movie_df) > 100000:
-                # If dataset is very large, sample it
-                movie_df = movie_df.sample(n=100000, random_state=42)
-            
-            movie_df.to_csv(movie_processed_path, index=False)
-            app.movie_df = movie_df
-            
-            print(f"Processed and loaded movie dataset with {len(app.movie_df)} records")
-        else:
-            print(f"Movie dataset not found at {movie_raw_path}")
-            # Create a small sample dataset if the real data can't be loaded
-            app.movie_df = pd.DataFrame({
-                'item_id': ['tt0111161', 'tt0068646', 'tt0071562', 'tt0468569', 'tt0050083'],
-                'title': ['The Shawshank Redemption', 'The Godfather', 'The Godfather: Part II', 'The Dark Knight', '12 Angry Men'],
-                'titleType': ['movie', 'movie', 'movie', 'movie', 'movie'],
-                'author': ['Director', 'Director', 'Director', 'Director', 'Director'],
-                'genre': ['Drama', 'Crime,Drama', 'Crime,Drama', 'Action,Crime,Drama', 'Crime,Drama'],
-                'year': [1994, 1972, 1974, 2008, 1957],
-                'avg_rating': [9.3, 9.2, 9.0, 9.0, 8.9],
-                'num_votes': [2400000, 1700000, 1200000, 2500000, 700000],
-                'domain': ['movie', 'movie', 'movie', 'movie', 'movie'],
-                'img': ['https://m.media-amazon.com/images/M/MV5BMDFkYTc0MGEtZmNhMC00ZDIzLWFmNTEtODM1ZmRlYWMwMWFmXkEyXkFqcGdeQXVyMTMxODk2OTU@._V1_SX300.jpg', 
-                       'https://m.media-amazon.com/images/M/MV5BM2MyNjYxNmUtYTAwNi00MTYxLWJmNWYtYzZlODY3ZTk3OTFlXkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg',
-                       'https://m.media-amazon.com/images/M/MV5BMWMwMGQzZTItY2JlNC00OWZiLWIyMDctNDk2ZDQ2YjRjMWQ0XkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg',
-                       'https://m.media-amazon.com/images/M/MV5BMTMxNTMwODM0NF5BMl5BanBnXkFtZTcwODAyMTk2Mw@@._V1_SX300.jpg',
-                       'https://m.media-amazon.com/images/M/MV5BMWU4N2FjNzYtNTVkNC00NzQ0LTg0MjAtYTJlMjFhNGUxZDFmXkEyXkFqcGdeQXVyNjc1NTYyMjg@._V1_SX300.jpg']
-            })
+        return fn(domain, *args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DatasetUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    except Exception as e:
-        print(f"Error loading movie dataset: {e}")
-        # Create placeholder data if an error occurs
-        app.movie_df = pd.DataFrame({
-            'item_id': ['tt0111161', 'tt0068646'],
-            'title': ['The Shawshank Redemption', 'The Godfather'],
-            'titleType': ['movie', 'movie'],
-            'author': ['Director', 'Director'],
-            'genre': ['Drama', 'Crime,Drama'],
-            'year': [1994, 1972],
-            'avg_rating': [9.3, 9.2],
-            'num_votes': [2400000, 1700000],
-            'domain': ['movie', 'movie'],
-            'img': ['https://m.media-amazon.com/images/M/MV5BMDFkYTc0MGEtZmNhMC00ZDIzLWFmNTEtODM1ZmRlYWMwMWFmXkEyXkFqcGdeQXVyMTMxODk2OTU@._V1_SX300.jpg',
-                   'https://m.media-amazon.com/images/M/MV5BM2MyNjYxNmUtYTAwNi00MTYxLWJmNWYtYzZlODY3ZTk3OTFlXkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg']
-        })
+@app.post("/catalog/{domain}/items", dependencies=[Depends(require_catalog_updates)])
+def upsert_catalog_items(domain: str, request: CatalogUpsertRequest):
+    return update_catalog(upsert_items, domain, request.items)
 
-def filter_movie_dataset(df, mood, era, genre):
-    """Filter the movie dataset based on user-selected mood, era, and genre."""
-    filtered_df = df.copy()
-    
-    # Step 1: Genre Filtering
-    target_genres = []
-    if genre and genre in movie_genre_mapping:
-        target_genres.append(movie_genre_mapping[genre])
-    
-    if mood and mood in mood_to_movie_genres:
-        target_genres.extend(mood_to_movie_genres[mood])
-    
-    target_genres = list(set(target_genres))  # Remove duplicates
-    
-    if target_genres:
-        genre_filter = filtered_df['genre'].apply(
-            lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-        )
-        filtered_df = filtered_df[genre_filter]
-    
-    # Step 2: Era Filtering
-    if era and era != 'any':
-        if era in era_to_movie_years and era_to_movie_years[era]:
-            start_year, end_year = era_to_movie_years[era]
-            year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
-            filtered_df = filtered_df[year_filter]
-    
-    # If we filtered too aggressively, return a broader dataset
-    print(len(filtered_df))
-    if len(filtered_df) < 1:
-        print(f"Warning: Too few movies match filters. Using broader dataset.")
-        
-        # Try just using the genre filter if era was specified
-        if era and era != 'any' and target_genres:
-            filtered_by_genre = df.copy()
-            genre_filter = filtered_by_genre['genre'].apply(
-                lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-            )
-            filtered_by_genre = filtered_by_genre[genre_filter]
-            
-            if len(filtered_by_genre) >= 10:
-                return filtered_by_genre
-        
-        # If still not enough, return most popular items
-        return df.sort_values('num_votes', ascending=False).head(100)
-    
-    return filtered_df
+@app.post("/catalog/{domain}/items/remove", dependencies=[Depends(require_catalog_updates)])
+def remove_catalog_items(domain: str, request: CatalogRemoveRequest):
+    return update_catalog(remove_items, domain, request.item_ids)
+
+@app.post("/admin/reload/{domain}", status_code=202, dependencies=[Depends(require_admin)])
+def reload_domain(domain: str):
+    """Reload a domain's dataset in the background; poll /ready/{domain} for its progress."""
+    require_domain(domain)
+    if RECOMMENDER_EXECUTOR == 'process':
+        # Worker processes hold their own copies of the catalog
+        raise HTTPException(status_code=409, detail="Reloads need RECOMMENDER_EXECUTOR=thread")
+    if not schedule_reload(domain):
+        raise HTTPException(status_code=409, detail=f"A reload of {domain} is already running")
+    current = app.catalogs.get(domain)
+    return {"domain": domain, "started": True,
+            "serving": current.data_version if current is not None else None, **app.reloads[domain]}
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    executor.shutdown()
+    shutdown_pools()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,221 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from synthetic import make_catalog
+
+# Datasets are installed by the benchmark, nothing should load them on startup
+os.environ.setdefault('DATASET_PRELOAD', 'lazy')
+
+FILTERS = [
+    ('unfiltered', None, None, None),
+    ('mood', 'light', None, None),
+    ('mood_era_genre', 'escape', 'modern', 'fantasy'),
+]
+CONFIG_KEYS = ['SVD_MODE', 'KNN_BACKEND', 'MODEL_MODE', 'CATALOG_MODE', 'RECOMMENDER_EXECUTOR']
+
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'repeat': len(samples),
+        'min_ms': float(samples.min()),
+        'median_ms': float(np.median(samples)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'mean_ms': float(samples.mean()),
+    }
+
+
+def timed(fn, repeat=1, setup=None):
+    """Call fn repeat times, after setup() if given; return (last result, per-call timing summary)."""
+    samples = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = fn()
+            samples.append(time.perf_counter() - start)
+    return result, summarize(samples)
+
+
+def stage_benchmarks(recommender, domain, df, repeat, rng):
+    """Time every stage of a recommendation separately, outside the web app."""
+    results = []
+
+    def record(stage, timing, **extra):
+        results.append({'stage': stage, **extra, **timing})
+
+    catalog, timing = timed(lambda: recommender.set_dataset(domain, df))
+    record('load_indexes', timing)
+    df = catalog.df
+    genre_index = catalog.genre_index
+    title_index = catalog.title_index
+
+    titles = df['title'].iloc[rng.choice(len(df), size=min(50, len(df)), replace=False)].tolist()
+    _, timing = timed(lambda: [title_index.first_match(t) for t in titles])
+    record('title_match', timing, lookups=len(titles))
+
+    for name, mood, era, genre in FILTERS:
+        mood, era, genre = recommender.normalize_filters(domain, mood, era, genre)
+        positions, timing = timed(
+            lambda: recommender.filter_positions(df, mood, era, genre, domain, genre_index), repeat)
+        record('filter', timing, filter=name, selected=len(positions))
+
+        rows = recommender.model_rows(df, positions, domain)
+        (latent, knn), timing = timed(lambda: recommender.build_model(rows, domain))
+        record('fit', timing, filter=name, selected=len(positions))
+
+        _, timing = timed(lambda: recommender.get_model(catalog, mood, era, genre))
+        _, timing = timed(lambda: recommender.get_model(catalog, mood, era, genre), repeat)
+        record('cached_model', timing, filter=name)
+
+        similar, timing = timed(lambda: recommender.find_similar_items(
+            titles[:3], df, positions, latent, knn, domain, title_index=title_index), repeat)
+        record('query', timing, filter=name)
+
+        _, timing = timed(lambda: recommender.format_recommendations(similar, domain), repeat)
+        record('format', timing, filter=name)
+
+    model, timing = timed(lambda: recommender.GlobalLatentModel(recommender.fit_latent(df, domain)))
+    record('global_fit', timing)
+    query = model.query_vector([0])
+    for name, mood, era, genre in FILTERS:
+        mood, era, genre = recommender.normalize_filters(domain, mood, era, genre)
+        mask = recommender.filter_rows(df, mood, era, genre, domain, genre_index)
+        _, timing = timed(lambda: model.top_k(query, 5, mask, [[0]]), repeat)
+        record('global_query', timing, filter=name)
+    return results
+
+
+def endpoint_benchmarks(recommender, domain, df, repeat, rng):
+    """Time requests end to end through the ASGI app."""
+    from fastapi.testclient import TestClient
+
+    path = {'book': '/recommendations/books/', 'anime': '/recommendations/anime/',
+            'movie': '/recommendations/movies/'}[domain]
+    titles = df['title'].iloc[rng.choice(len(df), size=min(200, len(df)), replace=False)].tolist()
+    results = []
+
+    def clear_caches():
+        recommender.result_cache.invalidate()
+        recommender.ranking_cache.invalidate()
+
+    with TestClient(recommender.app) as client:
+        recommender.set_dataset(domain, df)
+        for name, mood, era, genre in FILTERS:
+            body = {'titles': titles[:2], 'mood': mood, 'era': era, 'genre': genre}
+            body = {k: v for k, v in body.items() if v is not None}
+
+            def post():
+                response = client.post(path, json=body)
+                response.raise_for_status()
+                return response
+
+            _, timing = timed(post)
+            results.append({'stage': 'request_cold', 'filter': name, **timing})
+            # Warm models, but every repeat computes its response again
+            _, timing = timed(post, repeat, setup=clear_caches)
+            results.append({'stage': 'request_warm', 'filter': name, **timing})
+            _, timing = timed(post, repeat)
+            results.append({'stage': 'request_cached', 'filter': name, **timing})
+
+        batch = {'requests': [{'titles': [t], 'domain': domain} for t in titles[:100]]}
+        _, timing = timed(lambda: client.post('/recommendations/batch/', json=batch).raise_for_status(),
+                          max(1, repeat // 5), setup=clear_caches)
+        results.append({'stage': 'batch_100', **timing})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(domains, sizes, repeat=20, seed=0, endpoints=True):
+    import app as recommender
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'config': {key: getattr(recommender, key) for key in CONFIG_KEYS},
+        },
+        'results': [],
+    }
+    for domain in domains:
+        for n_rows in sizes:
+            rng = np.random.default_rng(seed)
+            df, timing = timed(lambda: make_catalog(domain, n_rows, seed))
+            print(f"{domain} {n_rows}: generated in {timing['min_ms'] / 1000:.1f}s", file=sys.stderr)
+            rows = stage_benchmarks(recommender, domain, df, repeat, rng)
+            if endpoints:
+                recommender.model_cache.invalidate()
+                rows += endpoint_benchmarks(recommender, domain, df, repeat, rng)
+            for row in rows:
+                report['results'].append({'domain': domain, 'rows': n_rows, **row})
+            recommender.model_cache.invalidate()
+    return report
+
+
+def result_key(row):
+    return (row['domain'], row['rows'], row['stage'], row.get('filter'))
+
+
+def compare(baseline, current, threshold=1.2):
+    """Rows whose median got more than threshold times slower than the baseline."""
+    before = {result_key(row): row for row in baseline['results']}
+    regressions = []
+    for row in current['results']:
+        old = before.get(result_key(row))
+        if old is None or old['median_ms'] <= 0:
+            continue
+        ratio = row['median_ms'] / old['median_ms']
+        print(f"{' '.join(str(k) for k in result_key(row) if k is not None):<50} "
+              f"{old['median_ms']:10.3f} -> {row['median_ms']:10.3f} ms  x{ratio:.2f}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(row)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation stages on synthetic catalogs.")
+    parser.add_argument('--domain', action='append', choices=['book', 'anime', 'movie'],
+                        help="domain to benchmark (repeatable, default: all)")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="comma-separated catalog sizes")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-endpoints', action='store_true', help="skip the end-to-end requests")
+    parser.add_argument('--out', help="write the JSON report to this path (default: stdout)")
+    parser.add_argument('--compare', help="baseline JSON report to compare medians against")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = run(args.domain or ['book', 'anime', 'movie'], sizes, args.repeat, args.seed,
+                 endpoints=not args.no_endpoints)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stages slower than x{args.threshold}", file=sys.stderr)
+            sys.exit(1)
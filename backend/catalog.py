@@ -0,0 +1,116 @@
+import argparse
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+def frame_nbytes(df):
+    """Memory held by a DataFrame, including the strings it references."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def compact_catalog(df, keep_object=('title', 'item_id', 'img', 'image_url'), max_category_ratio=0.5):
+    """Return a copy of df with memory-saving dtypes wherever values survive unchanged.
+
+    Integer columns become int32 and float columns float32 only when every
+    value round-trips exactly, so whole years and vote counts shrink while a
+    rating like 4.3 keeps its float64. Repetitive string columns (genres,
+    authors, domain) become categoricals; the mostly unique ones listed in
+    keep_object stay plain strings.
+    """
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        kind = series.dtype.kind
+        if kind in 'iu' and len(series):
+            if np.iinfo(np.int32).min <= series.min() and series.max() <= np.iinfo(np.int32).max:
+                series = series.astype(np.int32)
+        elif kind == 'f':
+            values = series.to_numpy()
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow.astype(values.dtype), values, equal_nan=True):
+                series = pd.Series(narrow, index=series.index, name=name)
+        elif name not in keep_object and not isinstance(series.dtype, pd.CategoricalDtype):
+            if series.nunique(dropna=True) <= max_category_ratio * len(series):
+                series = series.astype('category')
+        columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+class CatalogVersion:
+    """A domain's catalog together with everything built over it.
+
+    Requests take the domain's current CatalogVersion once and use only it,
+    so swapping in a reloaded catalog never mixes old rows with new indexes;
+    requests still running on the old version finish on it, and it is freed
+    with its last reference. version numbers every load of the domain, seq
+    the catalog updates applied to it since (see CatalogLog).
+    """
+
+    def __init__(self, domain, df, version, source, genre_index, title_index,
+                 neighbor_table=None, log=None, active=None, seq=0, fingerprint=None, popularity=None):
+        self.domain = domain
+        self.df = df
+        self.version = version
+        self.source = source
+        self.genre_index = genre_index
+        self.title_index = title_index
+        self.neighbor_table = neighbor_table
+        self.log = log
+        self.active = active  # rows still in the catalog, None when nothing was removed
+        self.seq = seq
+        # Content hash keying the arrays shared with other workers, None when not shared
+        self.fingerprint = fingerprint
+        self.popularity = popularity  # PopularityCube answering requests without a matching title
+
+    def replace(self, **changes):
+        """Copy of this version with some parts replaced, for catalog updates."""
+        catalog = copy.copy(self)
+        catalog.__dict__.update(changes)
+        return catalog
+
+    @property
+    def data_version(self):
+        """Identifies the data a response was computed from, e.g. '3.0'."""
+        return f"{self.version}.{self.seq}"
+
+    @property
+    def genre_col(self):
+        return 'genres' if self.domain == 'book' else 'genre'
+
+    def __len__(self):
+        return len(self.df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report per-domain memory of the default and compact catalog modes.")
+    parser.add_argument('--domain', action='append', choices=['book', 'anime', 'movie'],
+                        help="domain to report (repeatable, default: all)")
+    parser.add_argument('--mood', default='light', help="mood of the filtered model to build")
+    args = parser.parse_args()
+
+    import app as recommender
+
+    def measure(domain):
+        catalog = recommender.get_catalog(domain)
+        df = catalog.df
+        models = [recommender.get_model(catalog, mood, None, None) for mood in (None, args.mood)]
+        report = recommender.domain_memory(domain)
+        # What a filtered copy of the catalog per model used to cost
+        report['filtered'] = sum(
+            recommender.frame_nbytes(df.iloc[positions]) for _, _, positions in models if len(positions) < len(df)
+        )
+        return report
+
+    for domain in args.domain or ['book', 'anime', 'movie']:
+        recommender.CATALOG_MODE = 'default'
+        before = measure(domain)
+        recommender.CATALOG_MODE = 'compact'
+        catalog = recommender.get_catalog(domain)
+        recommender.set_dataset(domain, catalog.df, catalog.genre_index, source=catalog.source)
+        after = measure(domain)
+        after['filtered'] = 0
+        print(f"{domain}:")
+        for part in before:
+            print(f"  {part:<12} {before[part] / 2**20:9.1f} MB -> {after[part] / 2**20:9.1f} MB")
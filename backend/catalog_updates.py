@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import StandardScaler
+
+# In-app anime columns and the processed CSV columns they are derived from
+ANIME_CSV_COLUMNS = {'item_id': 'anime_id', 'num_votes': 'scored_by', 'author': 'studio'}
+
+
+def split_genres(value):
+    """Genre tokens of a comma-separated genre string (the TF-IDF tokenizer).
+
+    A module-level function rather than a lambda, so fitted projections pickle.
+    """
+    return str(value).split(',')
+
+
+class LatentProjection:
+    """Projects catalog rows into a fitted SVD latent space (fold-in).
+
+    The latent vector of a row is its feature vector (TF-IDF genres plus
+    scaled rating and votes, as fitted) times the kept right singular
+    vectors, which reproduces U_k * Sigma_k for the rows the space was
+    fitted on and places new rows in the same space without refitting.
+    """
+
+    def __init__(self, tfidf, scaler, components, genre_col, dtype=np.float64):
+        self.tfidf = tfidf
+        self.scaler = scaler
+        self.components = components  # shape (k, n_features)
+        self.genre_col = genre_col
+        self.dtype = dtype
+
+    def transform(self, frame):
+        genre_features = self.tfidf.transform(frame[self.genre_col].astype(object).fillna('Unknown'))
+        numerical_features = self.scaler.transform(frame[['avg_rating', 'num_votes']].fillna(0))
+        features = sparse.hstack((genre_features, sparse.csr_matrix(numerical_features))).tocsr()
+        return np.asarray(features @ self.components.T).astype(self.dtype, copy=False)
+
+    def arrays(self):
+        """The fitted parameters as arrays, so a stored projection does not pickle sklearn objects."""
+        vocabulary = self.tfidf.vocabulary_
+        return {
+            'vocabulary': np.array(sorted(vocabulary, key=vocabulary.get), dtype=str),
+            'idf': self.tfidf.idf_,
+            'mean': self.scaler.mean_,
+            'scale': self.scaler.scale_,
+            'components': self.components,
+            'genre_col': self.genre_col,
+            'dtype': np.dtype(self.dtype).str,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """A projection over parameters from arrays(), e.g. memory-mapped ones."""
+        vocabulary = {str(token): i for i, token in enumerate(arrays['vocabulary'])}
+        tfidf = TfidfVectorizer(tokenizer=split_genres, lowercase=True, token_pattern=None, vocabulary=vocabulary)
+        tfidf.idf_ = np.asarray(arrays['idf'])
+        scaler = StandardScaler()
+        scaler.mean_ = np.asarray(arrays['mean'])
+        scaler.scale_ = np.asarray(arrays['scale'])
+        scaler.var_ = scaler.scale_ ** 2
+        scaler.n_features_in_ = len(scaler.mean_)
+        scaler.feature_names_in_ = np.array(['avg_rating', 'num_votes'], dtype=object)
+        return cls(tfidf, scaler, arrays['components'], arrays['genre_col'], np.dtype(arrays['dtype']))
+
+    @property
+    def nbytes(self):
+        return self.components.nbytes
+
+
+class CatalogLog:
+    """Changes made to a domain's catalog since its latent space was last fitted.
+
+    Every upsert or removal gets a sequence number and records the catalog
+    rows it touched, so a model built at an older sequence number can fold
+    in exactly the rows that changed since. drift is the share of the
+    fitted catalog that changed; items bringing genres the fit has never
+    seen count twice, because fold-in cannot represent those genres.
+    """
+
+    def __init__(self, fitted_rows, vocabulary):
+        self.fitted_rows = fitted_rows
+        self.vocabulary = {str(g).lower() for g in vocabulary}
+        self.lock = threading.Lock()  # serializes updates of the domain
+        self.seq = 0
+        self.changes = []  # (seq, rows)
+        self.changed = 0
+        self.unseen = 0
+        self.refitting = False
+        self._item_rows = None
+
+    def item_rows(self, df):
+        """Map from item id to catalog row, built on first use."""
+        if self._item_rows is None:
+            ids = df['item_id'].astype(str).tolist()
+            self._item_rows = {}
+            for row, item_id in enumerate(ids):
+                self._item_rows.setdefault(item_id, row)
+        return self._item_rows
+
+    def record(self, rows, genres=None):
+        """Log a change to rows and return its sequence number."""
+        seq = self.seq + 1
+        self.changes.append((seq, np.asarray(rows, dtype=np.int64)))
+        self.changed += len(rows)
+        if genres is not None:
+            tokens = pd.Series(np.asarray(genres, dtype=object)).dropna().astype(str).str.lower().str.split(',')
+            self.unseen += int(tokens.map(lambda t: not self.vocabulary.issuperset(t)).sum())
+        self.seq = seq
+        return seq
+
+    def rows_since(self, since, until=None):
+        """Sorted catalog rows changed after sequence number since (up to until)."""
+        until = self.seq if until is None else until
+        rows = [rows for seq, rows in self.changes if since < seq <= until]
+        return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+
+    @property
+    def drift(self):
+        return (self.changed + self.unseen) / max(self.fitted_rows, 1)
+
+
+def apply_rows(df, rows, frame):
+    """Copy of df with the rows of frame written at rows; rows past the end are appended.
+
+    Categorical columns gain the new categories, and a column whose dtype
+    cannot hold the new values is widened.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    appended = rows >= len(df)
+    order = np.argsort(rows[appended], kind='stable')
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        values = frame[name] if name in frame.columns else pd.Series([None] * len(frame), dtype=object)
+        values = values.reset_index(drop=True)
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            new = pd.Index(values.dropna().unique()).difference(series.cat.categories)
+            if len(new):
+                series = series.cat.add_categories(new)
+            values = pd.Series(pd.Categorical(values, categories=series.cat.categories))
+        else:
+            try:
+                values = values.astype(series.dtype)
+            except (TypeError, ValueError):
+                # Missing values in an integer column need floats, anything else objects
+                try:
+                    if not pd.api.types.is_numeric_dtype(series.dtype):
+                        raise TypeError
+                    values = values.astype(np.float64)
+                    series = series.astype(np.float64)
+                except (TypeError, ValueError):
+                    values = values.astype(object)
+                    series = series.astype(object)
+        if appended.any():
+            tail = values[appended].iloc[order]
+            series = pd.concat([series, tail], ignore_index=True)
+        else:
+            series = series.copy()
+        if (~appended).any():
+            series.iloc[rows[~appended]] = values[~appended].to_numpy()
+        columns[name] = series.reset_index(drop=True)
+    return pd.DataFrame(columns)
+
+
+def merge_rows(latent_matrix, positions, rows, members, member_vectors):
+    """Fold changed catalog rows into a model fitted on the sorted positions.
+
+    rows are the changed catalog rows, members those of them that belong to
+    the model now and member_vectors their projected latent vectors.
+    Returns (latent_matrix, positions, remap, member_index): remap maps each
+    old model index to its new one, or -1 when its row changed, and
+    member_index gives the model index of every member.
+    """
+    stale = np.isin(positions, rows)
+    new_positions = np.union1d(positions[~stale], members)
+    remap = np.full(len(positions), -1, dtype=np.int64)
+    remap[~stale] = np.searchsorted(new_positions, positions[~stale])
+    member_index = np.searchsorted(new_positions, members)
+
+    merged = np.empty((len(new_positions), latent_matrix.shape[1]), dtype=latent_matrix.dtype)
+    merged[remap[~stale]] = latent_matrix[~stale]
+    merged[member_index] = member_vectors
+    return merged, new_positions, remap, member_index
+
+
+def read_records(path):
+    """Item records from a JSON list or a JSON-lines file."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def update_csv(path, domain, records=(), remove=()):
+    """Upsert records into and remove item ids from a processed CSV, in place.
+
+    A record replaces the whole row of its item, like an upsert through the
+    API. Records may use the in-app column names; anime ones are mapped to
+    the CSV columns they are derived from. Returns (upserted, removed).
+    """
+    df = pd.read_csv(path)
+    key = 'anime_id' if domain == 'anime' else 'item_id'
+    dtypes = df.dtypes
+    frame = pd.DataFrame(list(records))
+    if domain == 'anime':
+        for column, source in ANIME_CSV_COLUMNS.items():
+            if column in frame.columns:
+                frame[source] = frame[source].fillna(frame[column]) if source in frame.columns else frame[column]
+    if len(frame) and (key not in frame.columns or frame[key].isna().any()):
+        raise ValueError(f"Every record needs an {key}")
+    frame = frame.reindex(columns=df.columns)
+
+    ids = df[key].astype(str)
+    first_rows = pd.Series(np.arange(len(df)), index=ids)
+    first_rows = first_rows[~first_rows.index.duplicated()]
+    if len(frame):
+        # Existing items are replaced where they are, new ones appended
+        frame = frame.drop_duplicates(key, keep='last').reset_index(drop=True)
+        frame_ids = frame[key].astype(str)
+        existing = frame_ids.isin(first_rows.index).to_numpy()
+        rows = first_rows.reindex(frame_ids[existing]).to_numpy()
+        for name in frame.columns:
+            df[name] = df[name].astype(object)
+            df.iloc[rows, df.columns.get_loc(name)] = frame.loc[existing, name].to_numpy()
+        df = pd.concat([df, frame[~existing]], ignore_index=True)
+
+    removed = df[key].astype(str).isin([str(item_id) for item_id in remove])
+    df = df[~removed.to_numpy()]
+    for name, dtype in dtypes.items():
+        # Keep the column types the loaders expect where the new values allow it
+        try:
+            df[name] = df[name].astype(dtype)
+        except (TypeError, ValueError):
+            pass
+
+    tmp = path + '.tmp'
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return len(frame), int(removed.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upsert or remove items in a domain's processed CSV.")
+    parser.add_argument('--domain', required=True, choices=['book', 'anime', 'movie'])
+    parser.add_argument('--upsert', help="JSON or JSON-lines file of item records")
+    parser.add_argument('--remove', action='append', default=[], help="item id to remove (repeatable)")
+    parser.add_argument('--csv', help="processed CSV to update (default: <domain>_processed.csv next to the app)")
+    args = parser.parse_args()
+
+    path = args.csv or os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{args.domain}_processed.csv")
+    records = read_records(args.upsert) if args.upsert else []
+    upserted, removed = update_csv(path, args.domain, records, args.remove)
+    print(f"Upserted {upserted} and removed {removed} {args.domain} items in {path}")
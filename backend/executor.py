@@ -0,0 +1,115 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    """Raised when too many recommendation jobs are already queued."""
+
+
+class ExecutorTimeout(Exception):
+    """Raised when a recommendation job does not finish within the timeout."""
+
+
+class RecommendationExecutor:
+    """Runs CPU-bound recommendation work off the asyncio event loop.
+
+    mode is 'thread' (a thread pool, sharing the loaded catalogs and model
+    cache), 'process' (a process pool, each worker holding its own catalogs)
+    or 'inline' (run on the event loop, as before). At most max_workers jobs
+    run at once and at most max_pending more may wait; further submissions
+    are rejected with ExecutorBusy instead of piling up.
+    """
+
+    def __init__(self, mode='thread', max_workers=None, max_pending=32, timeout=30.0,
+                 initializer=None, initargs=()):
+        if mode not in ('thread', 'process', 'inline'):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.mode == 'process':
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        initializer=self.initializer, initargs=self.initargs
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='recommender'
+                    )
+            return self._pool
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn, *args, timeout=None):
+        """Run fn(*args) in the pool and return its result.
+
+        On timeout or cancellation a job that has not started yet is
+        cancelled; a job that is already running keeps its slot until it
+        finishes, so the pool can never be oversubscribed.
+        """
+        if self.mode == 'inline':
+            return fn(*args)
+
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusy("Too many recommendation requests in progress")
+            self.in_flight += 1
+
+        try:
+            if self.mode == 'thread':
+                # Carry request-scoped context variables into the worker thread
+                context = contextvars.copy_context()
+                future = self._get_pool().submit(context.run, fn, *args)
+            else:
+                future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise ExecutorTimeout(f"Recommendation took longer than {timeout}s")
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
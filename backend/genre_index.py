@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+class GenreIndex:
+    """Multi-hot genre index over a catalog, stored as packed bitmasks.
+
+    Each row's comma-separated genre string is parsed once into bits over the
+    catalog's genre vocabulary. words[w] holds bits 64*w .. 64*w+63 of every
+    row, so a filter only touches the words its query genres live in.
+    """
+
+    WORD_BITS = 64
+
+    def __init__(self, vocabulary, words):
+        self.vocabulary = list(vocabulary)
+        self.genre_to_bit = {g: i for i, g in enumerate(self.vocabulary)}
+        self.words = words  # shape (n_words, n_rows), dtype uint64
+
+    @classmethod
+    def from_series(cls, values):
+        """Parse comma-separated genre strings; missing values have no genres."""
+        values = pd.Series(np.asarray(values, dtype=object))
+        n_rows = len(values)
+
+        tokens = values[values.notna()].astype(str).str.split(',').explode()
+        codes, vocabulary = pd.factorize(tokens)
+        rows = tokens.index.to_numpy()
+
+        n_words = max(1, -(-len(vocabulary) // cls.WORD_BITS))
+        words = np.zeros((n_words, n_rows), dtype=np.uint64)
+        bits = np.left_shift(np.uint64(1), (codes % cls.WORD_BITS).astype(np.uint64))
+        np.bitwise_or.at(words, (codes // cls.WORD_BITS, rows), bits)
+        return cls(vocabulary, words)
+
+    def updated(self, rows, values, n_rows):
+        """A copy covering n_rows rows, with rows re-parsed from values.
+
+        Rows past the current end are appended; genres the vocabulary does
+        not know yet get new bits.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        values = pd.Series(np.asarray(values, dtype=object))
+        tokens = values[values.notna()].astype(str).str.split(',').explode()
+        vocabulary = self.vocabulary + [g for g in dict.fromkeys(tokens) if g not in self.genre_to_bit]
+
+        n_words = max(1, -(-len(vocabulary) // self.WORD_BITS))
+        words = np.zeros((n_words, n_rows), dtype=np.uint64)
+        words[:self.words.shape[0], :len(self)] = self.words
+        words[:, rows] = 0
+
+        index = GenreIndex(vocabulary, words)
+        codes = np.array([index.genre_to_bit[g] for g in tokens], dtype=np.int64)
+        bits = np.left_shift(np.uint64(1), (codes % self.WORD_BITS).astype(np.uint64))
+        np.bitwise_or.at(words, (codes // self.WORD_BITS, rows[tokens.index.to_numpy()]), bits)
+        return index
+
+    def take(self, rows):
+        """The index of the catalog rows at rows, in that order."""
+        return GenreIndex(self.vocabulary, self.words[:, rows])
+
+    def query(self, genres):
+        """Return the packed query bitmask for genres, ignoring unknown ones."""
+        query = np.zeros(self.words.shape[0], dtype=np.uint64)
+        for genre in genres:
+            bit = self.genre_to_bit.get(genre)
+            if bit is not None:
+                query[bit // self.WORD_BITS] |= np.uint64(1) << np.uint64(bit % self.WORD_BITS)
+        return query
+
+    def any_mask(self, genres):
+        """Boolean row mask of items having at least one of genres."""
+        query = self.query(genres)
+        mask = np.zeros(len(self), dtype=bool)
+        for w in np.flatnonzero(query):
+            mask |= (self.words[w] & query[w]) != 0
+        return mask
+
+    def all_mask(self, genres):
+        """Boolean row mask of items having every one of genres."""
+        genres = list(genres)
+        query = self.query(genres)
+        if any(g not in self.genre_to_bit for g in genres):
+            return np.zeros(len(self), dtype=bool)
+        mask = np.ones(len(self), dtype=bool)
+        for w in np.flatnonzero(query):
+            mask &= (self.words[w] & query[w]) == query[w]
+        return mask
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def __len__(self):
+        return self.words.shape[1]
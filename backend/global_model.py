@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class GlobalLatentModel:
+    """A domain's whole catalog factorized once, for filter-as-mask search.
+
+    vectors holds one L2-normalized float32 latent vector per catalog row.
+    A filtered query scores only the rows selected by the filter's mask with
+    one matrix product and picks the top k with argpartition, so changing
+    mood, era or genre never refits anything.
+    """
+
+    QUERY_CHUNK = 64  # queries scored together, bounds the score matrix size
+
+    def __init__(self, latent_matrix, projection=None, catalog_seq=0):
+        vectors = np.asarray(latent_matrix, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.maximum(norms, 1e-12)
+        # Folds changed catalog rows into the space, see updated()
+        self.projection = projection
+        self.catalog_seq = catalog_seq
+
+    @classmethod
+    def from_vectors(cls, vectors, projection=None, catalog_seq=0):
+        """A model over already normalized vectors, e.g. memory-mapped ones."""
+        model = cls(vectors[:0], projection, catalog_seq)
+        model.vectors = vectors
+        return model
+
+    def updated(self, df, rows, catalog_seq):
+        """A copy covering every row of df, with the vectors of rows projected anew."""
+        vectors = np.zeros((len(df), self.vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+        model = GlobalLatentModel.from_vectors(vectors, self.projection, catalog_seq)
+        if len(rows):
+            update = np.asarray(self.projection.transform(df.iloc[rows]), dtype=np.float32)
+            norms = np.linalg.norm(update, axis=1, keepdims=True)
+            vectors[rows] = update / np.maximum(norms, 1e-12)
+        return model
+
+    def query_vector(self, rows):
+        """Normalized mean of the vectors of rows."""
+        query = self.vectors[rows].mean(axis=0)
+        return query / max(float(np.linalg.norm(query)), 1e-12)
+
+    def top_k(self, queries, k, mask=None, exclude=None):
+        """Top-k rows by cosine similarity for each query vector.
+
+        mask restricts the candidate rows; exclude is, per query, a list of
+        rows never to return (typically the query's own input items).
+        Returns (rows, scores), each with one list per query, best first.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        exclude = exclude or [()] * len(queries)
+
+        # Gathering the candidate rows only pays off for selective filters
+        candidates = None
+        if mask is not None and np.count_nonzero(mask) <= len(self.vectors) // 2:
+            candidates = np.flatnonzero(mask)
+            mask = None
+        vectors = self.vectors if candidates is None else self.vectors[candidates]
+
+        all_rows, all_scores = [], []
+        for start in range(0, len(queries), self.QUERY_CHUNK):
+            scores = queries[start:start + self.QUERY_CHUNK] @ vectors.T
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            for offset, row_scores in enumerate(scores):
+                skip = np.asarray(exclude[start + offset], dtype=np.int64)
+                if candidates is not None and len(skip):
+                    # Map catalog rows to their positions among the candidates
+                    pos = np.minimum(np.searchsorted(candidates, skip), max(len(candidates) - 1, 0))
+                    skip = pos[candidates[pos] == skip] if len(candidates) else skip[:0]
+                row_scores[skip] = -np.inf
+
+                k_valid = min(k, int(np.isfinite(row_scores).sum()))
+                if k_valid < len(row_scores):
+                    top = np.argpartition(-row_scores, k_valid)[:k_valid]
+                else:
+                    top = np.arange(len(row_scores))
+                top = top[np.argsort(-row_scores[top], kind='stable')][:k_valid]
+                all_scores.append(row_scores[top])
+                all_rows.append(top if candidates is None else candidates[top])
+        return all_rows, all_scores
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes
+
+    def __len__(self):
+        return len(self.vectors)
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+RAW_COLUMNS = ['tconst', 'titleType', 'primaryTitle', 'startYear', 'genres', 'isAdult']
+# Everything is read as text; year and isAdult are parsed explicitly because
+# a few malformed IMDb rows carry non-numeric values in those columns
+RAW_DTYPES = {column: 'string' for column in RAW_COLUMNS}
+TITLE_TYPES = ['movie', 'tvSeries', 'tvMiniSeries']
+OUTPUT_COLUMNS = ['item_id', 'title', 'titleType', 'author', 'genre', 'year',
+                  'avg_rating', 'num_votes', 'domain', 'img']
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def transform_chunk(chunk):
+    """Turn one raw title.basics chunk into processed movie rows."""
+    keep = chunk['titleType'].isin(TITLE_TYPES) & (chunk['isAdult'] == '0')
+    chunk = chunk[keep.fillna(False).to_numpy()]
+
+    year = pd.to_numeric(chunk['startYear'], errors='coerce')
+    valid = (year.notna() & chunk['genres'].notna()).to_numpy()
+    chunk, year = chunk[valid], year[valid]
+
+    item_id = chunk['tconst'].astype(object)
+    title_type = chunk['titleType'].astype(object)
+    return pd.DataFrame({
+        'item_id': item_id,
+        'title': chunk['primaryTitle'].astype(object),
+        'titleType': title_type,
+        'author': np.where(title_type == 'movie', 'Director', 'Creator'),
+        'genre': chunk['genres'].astype(object),
+        'year': year.astype('Int64'),
+        # title.basics has no ratings, so these are placeholders
+        'avg_rating': 7.0,
+        'num_votes': 1000,
+        'domain': 'movie',
+        'img': 'https://m.media-amazon.com/images/M/' + item_id.str[2:] + '._V1_SX300.jpg',
+    }, columns=OUTPUT_COLUMNS)
+
+
+def ingest_title_basics(raw_path, out_path, sample_size=100000, chunksize=100000, random_state=42):
+    """Stream title.basics.tsv into the processed movie CSV.
+
+    The TSV is read chunk by chunk with explicit dtypes. When sample_size is
+    set, a uniform sample is kept by giving every row a random key and
+    retaining the sample_size smallest keys (reservoir sampling), so memory
+    is bounded by sample_size + chunksize rows whatever the input size. The
+    sample is written in input order once the input is exhausted; without a
+    sample_size every chunk is appended to the output as soon as it is
+    processed. The output is written to a temporary file and moved into
+    place at the end. Returns a dict of statistics including peak memory.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(random_state)
+    tmp_path = out_path + '.tmp'
+    reader = pd.read_csv(
+        raw_path, sep='\t', usecols=RAW_COLUMNS, dtype=RAW_DTYPES,
+        na_values=['\\N'], keep_default_na=False, quoting=csv.QUOTE_NONE,
+        chunksize=chunksize
+    )
+
+    rows_read = rows_kept = 0
+    reservoir = None
+    wrote_header = False
+    for chunk in reader:
+        rows_read += len(chunk)
+        processed = transform_chunk(chunk)
+        rows_kept += len(processed)
+        if not sample_size:
+            processed.to_csv(tmp_path, mode='a' if wrote_header else 'w',
+                             header=not wrote_header, index=False)
+            wrote_header = True
+            continue
+
+        # Keep the rows with the sample_size smallest random keys seen so far
+        processed['_key'] = rng.random(len(processed))
+        processed['_order'] = np.arange(rows_kept - len(processed), rows_kept)
+        reservoir = processed if reservoir is None else pd.concat([reservoir, processed], ignore_index=True)
+        if len(reservoir) > sample_size:
+            reservoir = reservoir.nsmallest(sample_size, '_key')
+
+    if sample_size:
+        if reservoir is None:
+            reservoir = pd.DataFrame(columns=OUTPUT_COLUMNS)
+        else:
+            reservoir = reservoir.sort_values('_order')[OUTPUT_COLUMNS]
+        for offset in range(0, max(len(reservoir), 1), chunksize):
+            reservoir.iloc[offset:offset + chunksize].to_csv(
+                tmp_path, mode='a' if offset else 'w', header=not offset, index=False
+            )
+    elif not wrote_header:
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(tmp_path, index=False)
+
+    os.replace(tmp_path, out_path)
+    return {
+        'rows_read': rows_read,
+        'rows_eligible': rows_kept,
+        'rows_written': min(rows_kept, sample_size) if sample_size else rows_kept,
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Convert IMDb title.basics.tsv into movie_processed.csv.")
+    parser.add_argument('--raw', default=os.path.join(base_path, 'title.basics.tsv'))
+    parser.add_argument('--out', default=os.path.join(base_path, 'movie_processed.csv'))
+    parser.add_argument('--sample', type=int, default=100000, help="rows to keep, 0 keeps every row")
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    stats = ingest_title_basics(args.raw, args.out, sample_size=args.sample,
+                                chunksize=args.chunksize, random_state=args.seed)
+    print(f"Read {stats['rows_read']} rows, {stats['rows_eligible']} eligible, "
+          f"wrote {stats['rows_written']} to {args.out} in {stats['seconds']:.1f}s")
+    if stats['peak_rss_mb'] is not None:
+        print(f"Peak memory: {stats['peak_rss_mb']:.0f} MB")
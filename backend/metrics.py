@@ -0,0 +1,148 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in seconds and in rows
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+# Labels of the request being served and the stage timings it collected
+_labels = contextvars.ContextVar('metric_labels', default=('', ''))
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """A thread-safe Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name, help, buckets, label_names):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_values):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = format_labels(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(pairs):
+    """Label pairs formatted for a Prometheus sample."""
+    return ','.join(f'{name}="{escape(value)}"' for name, value in pairs)
+
+
+class Metrics:
+    """Per-stage latency and row-count histograms for the recommendation hot path.
+
+    Stages are labeled with the domain and filter of the request being served
+    (see labels()). Gauges and counters owned by other components are read
+    from the collectors at scrape time, so they cost nothing per request.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stage_seconds = Histogram(
+            'recommender_stage_seconds', 'Time spent in each recommendation stage.',
+            LATENCY_BUCKETS, ('stage', 'domain', 'filter'))
+        self.stage_rows = Histogram(
+            'recommender_stage_rows', 'Rows processed by each recommendation stage.',
+            ROW_BUCKETS, ('stage', 'domain', 'filter'))
+        self.collectors = []
+
+    @contextlib.contextmanager
+    def labels(self, domain, filter_label):
+        """Label the stages recorded inside the block with domain and filter."""
+        token = _labels.set((domain, filter_label))
+        try:
+            yield
+        finally:
+            _labels.reset(token)
+
+    def observe(self, stage, seconds, rows=None):
+        if not self.enabled:
+            return
+        domain, filter_label = _labels.get()
+        self.stage_seconds.observe(seconds, (stage, domain, filter_label))
+        if rows is not None:
+            self.stage_rows.observe(rows, (stage, domain, filter_label))
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    def stage(self, name, rows=None):
+        """Time a with-block as stage name; set .rows on it to record a row count."""
+        return StageTimer(self, name, rows)
+
+    def add_collector(self, collect):
+        """Register a function returning (name, type, help, [(labels, value)]) tuples."""
+        self.collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = self.stage_seconds.render() + self.stage_rows.render()
+        for collect in self.collectors:
+            for name, kind, help, samples in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    label_text = format_labels(labels.items())
+                    lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    __slots__ = ('metrics', 'name', 'rows', 'start')
+
+    def __init__(self, metrics, name, rows=None):
+        self.metrics = metrics
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.rows)
+        return False
+
+
+def start_request_timings():
+    """Collect the stage timings of the current request; returns the list they go into."""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+
+def server_timing(timings):
+    """Format collected timings as a Server-Timing header value (durations in ms)."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+
+
+def estimate_nbytes(value):
+    """Roughly estimate the memory held by a cached value."""
+    if value is None:
+        return 0
+    if hasattr(value, 'nbytes'):  # numpy arrays and our own indexes
+        return int(value.nbytes)
+    if hasattr(value, 'memory_usage'):  # pandas DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_nbytes(v) for v in value)
+    if hasattr(value, '_fit_X'):  # fitted sklearn NearestNeighbors
+        return estimate_nbytes(value._fit_X)
+    return 0
+
+
+class ModelCache:
+    """Bounded, thread-safe LRU cache for fitted recommendation models.
+
+    Entries are evicted least-recently-used first whenever either the number
+    of entries or their estimated total size exceeds the configured limits.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Store value under key and evict old entries if over the limits."""
+        if nbytes is None:
+            nbytes = estimate_nbytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            # Never keep a single entry that on its own exceeds the byte budget
+            if self.max_bytes and nbytes > self.max_bytes:
+                return value
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            self._evict()
+        return value
+
+    def get_or_build(self, key, builder):
+        """Return the cached value for key, building it once on a miss.
+
+        Concurrent callers that miss on the same key wait for a single build
+        instead of each fitting their own copy of the model.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # Another thread may have finished the build while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+            try:
+                return self.put(key, builder())
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only those whose key matches predicate."""
+        with self._lock:
+            for key in list(self._entries):
+                if predicate is None or predicate(key):
+                    self.total_bytes -= self._entries.pop(key)[1]
+
+    def nbytes(self, predicate=None):
+        """Estimated size of every entry, or only of those whose key matches predicate."""
+        with self._lock:
+            return sum(nbytes for key, (_, nbytes) in self._entries.items()
+                       if predicate is None or predicate(key))
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.total_bytes -= nbytes
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss counters and current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+TABLE_FORMAT = 1
+
+
+def catalog_fingerprint(df, domain):
+    """Hash of the columns the unfiltered latent space is built from, in catalog order."""
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    digest = hashlib.sha1()
+    for name in ('item_id', genre_col, 'avg_rating', 'num_votes'):
+        if name not in df.columns:
+            continue
+        series = df[name]
+        # Compact catalogs hold narrower dtypes and categoricals of the same values
+        if pd.api.types.is_numeric_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(np.float64)
+        else:
+            series = series.astype(object)
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def top_neighbors(latent_matrix, n_neighbors=50, block_size=2 ** 24):
+    """Top n_neighbors rows by cosine similarity for every row of latent_matrix.
+
+    Returns (ids, scores): int32 neighbor rows and float16 similarities, one
+    row per item, best first and never containing the item itself. Rows are
+    scored in blocks of about block_size similarities at a time.
+    """
+    latent_matrix = np.asarray(latent_matrix)
+    n_rows = len(latent_matrix)
+    n_neighbors = max(0, min(n_neighbors, n_rows - 1))
+    norms = np.linalg.norm(latent_matrix, axis=1, keepdims=True)
+    vectors = latent_matrix / np.maximum(norms, 1e-12)
+
+    ids = np.empty((n_rows, n_neighbors), dtype=np.int32)
+    scores = np.empty((n_rows, n_neighbors), dtype=np.float16)
+    if n_neighbors == 0:
+        return ids, scores
+    step = max(1, block_size // n_rows)
+    for start in range(0, n_rows, step):
+        stop = min(start + step, n_rows)
+        block = vectors[start:stop] @ vectors.T
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        if n_neighbors < n_rows - 1:
+            # Partitioning for the largest scores avoids negating the whole block
+            top = np.argpartition(block, n_rows - n_neighbors, axis=1)[:, -n_neighbors:]
+        else:
+            top = np.argsort(-block, axis=1, kind='stable')[:, :n_neighbors]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        ids[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return ids, scores
+
+
+class NeighborTable:
+    """Precomputed nearest neighbors of every catalog item in the unfiltered latent space."""
+
+    def __init__(self, ids, scores):
+        self.ids = ids
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def complete(self):
+        """Whether every other item is listed as a neighbor."""
+        return self.ids.shape[1] >= len(self.ids) - 1
+
+    def neighbors(self, row, k, mask=None, depth=None):
+        """The k nearest catalog rows of row, restricted to mask.
+
+        Returns None when fewer than k listed neighbors pass the mask and the
+        table does not list every item, so the answer could be incomplete.
+        With a depth, up to depth rows are returned once k of them pass.
+        """
+        ids = np.asarray(self.ids[row], dtype=np.int64)
+        if mask is not None:
+            ids = ids[mask[ids]]
+        if len(ids) < k and not self.complete:
+            return None
+        return ids[:max(k, depth or k)]
+
+
+def write_neighbor_table(directory, domain, ids, scores, fingerprint, params=None):
+    """Write a domain's neighbor table under directory/domain."""
+    target = os.path.join(directory, domain)
+    tmp = target + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    np.save(os.path.join(tmp, 'ids.npy'), ids)
+    np.save(os.path.join(tmp, 'scores.npy'), scores)
+    meta = {
+        'format': TABLE_FORMAT,
+        'domain': domain,
+        'rows': len(ids),
+        'neighbors': int(ids.shape[1]),
+        'catalog': fingerprint,
+        'params': params or {},
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def load_neighbor_table(directory, domain, df, params=None):
+    """Memory-map a domain's neighbor table, or return None.
+
+    Returns None when there is no table, or when it was computed for other
+    catalog contents or other latent space settings than df and params.
+    """
+    if not directory:
+        return None
+    target = os.path.join(directory, domain)
+    meta_path = os.path.join(target, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != TABLE_FORMAT or meta.get('rows') != len(df):
+            return None
+        if meta.get('params') != (params or {}) or meta.get('catalog') != catalog_fingerprint(df, domain):
+            print(f"Neighbor table for {domain} does not match the loaded catalog, ignoring it")
+            return None
+        ids = np.load(os.path.join(target, 'ids.npy'), mmap_mode='r')
+        scores = np.load(os.path.join(target, 'scores.npy'), mmap_mode='r')
+        return NeighborTable(ids, scores)
+    except Exception as e:
+        print(f"Error loading {domain} neighbor table from {target}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the nearest neighbors of every catalog item.")
+    parser.add_argument('--domain', action='append', choices=['book', 'anime', 'movie'],
+                        help="domain to compute (repeatable, default: all)")
+    parser.add_argument('--neighbors', type=int, default=50, help="neighbors stored per item")
+    parser.add_argument('--out', help="table directory (default: NEIGHBOR_DIR of the app)")
+    args = parser.parse_args()
+
+    # Only the dataset loaders are needed: keep the app from opening the model
+    # store, which would prune it and refit its models in the background
+    os.environ['MODEL_DIR'] = os.environ['SHARED_DIR'] = ''
+    os.environ['DATASET_PRELOAD'] = 'lazy'
+    import app as recommender
+    out = args.out or recommender.NEIGHBOR_DIR
+
+    for domain in args.domain or ['book', 'anime', 'movie']:
+        catalog = recommender.get_catalog(domain)
+        df = catalog.df
+        if catalog.source == 'sample':
+            print(f"Skipping {domain}: no dataset was found")
+            continue
+        start = time.perf_counter()
+        ids, scores = top_neighbors(recommender.fit_latent(df, domain), args.neighbors)
+        path = write_neighbor_table(out, domain, ids, scores, catalog_fingerprint(df, domain),
+                                    recommender.latent_params())
+        print(f"Wrote {domain} neighbor table for {len(df)} records to {path} "
+              f"in {time.perf_counter() - start:.1f}s")
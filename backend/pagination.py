@@ -0,0 +1,38 @@
+import base64
+import binascii
+import hashlib
+import json
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not issued for the request it came with."""
+
+
+class CursorExpired(InvalidCursor):
+    """Raised for a cursor issued for a catalog version that is no longer served."""
+
+
+def query_digest(query):
+    """Short hash of a normalized query, tying cursors to the query they page through."""
+    return hashlib.sha1(json.dumps(query, default=str).encode()).hexdigest()[:12]
+
+
+def encode_cursor(offset, data_version, query):
+    """An opaque cursor for the results of query from offset on."""
+    payload = json.dumps([offset, data_version, query_digest(query)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, data_version, query):
+    """The offset a cursor points at; raises InvalidCursor or CursorExpired."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        offset, version, digest = json.loads(payload)
+        offset = int(offset)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if digest != query_digest(query) or offset < 0:
+        raise InvalidCursor("The cursor was issued for another query")
+    if version != data_version:
+        raise CursorExpired("The catalog changed since the cursor was issued; start over without a cursor")
+    return offset
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def ranked_rows(votes, rows=None):
+    """rows (default: every row) ordered by votes, most voted first; ties keep row order."""
+    rows = np.arange(len(votes)) if rows is None else np.asarray(rows, dtype=np.int64)
+    return rows[np.lexsort((rows, -votes[rows]))]
+
+
+class PopularityCube:
+    """The most voted active catalog rows of every filter cell, best first.
+
+    Requests whose titles match nothing are answered with the popular items
+    of their filters, so every (mood, era, genre) cell keeps its top depth
+    rows; a cell listing fewer rows holds every row matching it.
+
+    Cells are evaluated through matcher(rows), which returns a function
+    mapping a cell to the boolean mask of the catalog rows (an index array)
+    matching it. Each cell first scans the head most voted rows and only
+    looks at the rest of the catalog when the head holds too few matches.
+    """
+
+    def __init__(self, cells, depth):
+        self.cells = cells  # (mood, era, genre) -> catalog rows, best first
+        self.depth = depth
+
+    @classmethod
+    def build(cls, votes, cell_keys, matcher, depth=100, active=None, head=4096):
+        order = ranked_rows(votes, None if active is None else np.flatnonzero(active))
+        scan = CellScan(order, matcher, head)
+        return cls({cell: scan.top(cell, depth) for cell in cell_keys}, depth)
+
+    def top(self, cell, n):
+        """The n most voted rows of cell, or None when it does not keep that many."""
+        rows = self.cells.get(cell)
+        if rows is None or (n > len(rows) and len(rows) == self.depth):
+            return None
+        return rows[:n]
+
+    def updated(self, votes, rows, matcher, active=None):
+        """A copy after rows changed, were added or were removed.
+
+        votes, matcher and active describe the updated catalog. Changed rows
+        are dropped from every cell and merged back in where they still
+        match; only a cell that lost one of its listed rows and cannot tell
+        what follows its remaining ones is scanned again.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        live = rows if active is None else rows[active[rows]]
+        match = matcher(live)
+        scan = None
+        cells = {}
+        for cell, top in self.cells.items():
+            kept = top[~np.isin(top, rows)]
+            merged = ranked_rows(votes, np.concatenate((kept, live[match(cell)])))
+            if len(top) == self.depth:
+                # Unlisted rows rank below every kept one, but maybe above a merged row
+                certain = int(np.flatnonzero(merged == kept[-1])[0]) + 1 if len(kept) else 0
+                if certain < self.depth:
+                    if scan is None:
+                        order = ranked_rows(votes, None if active is None else np.flatnonzero(active))
+                        scan = CellScan(order, matcher)
+                    merged = scan.top(cell, self.depth)
+            cells[cell] = merged[:self.depth]
+        return PopularityCube(cells, self.depth)
+
+    @property
+    def nbytes(self):
+        return sum(rows.nbytes for rows in self.cells.values())
+
+    def __len__(self):
+        return len(self.cells)
+
+
+class CellScan:
+    """Finds the top rows of cells in a popularity order, evaluating its head and rest once each."""
+
+    def __init__(self, order, matcher, head=4096):
+        self.order = order
+        self.matcher = matcher
+        self.head = head
+        self._segments = []
+
+    def segment(self, i):
+        while len(self._segments) <= i:
+            rows = self.order[:self.head] if not self._segments else self.order[self.head:]
+            self._segments.append((rows, self.matcher(rows)))
+        return self._segments[i]
+
+    def top(self, cell, depth):
+        rows, match = self.segment(0)
+        top = rows[match(cell)]
+        if len(top) < depth and len(self.order) > self.head:
+            rows, match = self.segment(1)
+            top = np.concatenate((top, rows[match(cell)]))
+        return top[:depth]
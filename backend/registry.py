@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+class DatasetUnavailable(Exception):
+    """Raised when a domain's catalog cannot be loaded."""
+
+
+class DatasetRegistry:
+    """Loads each domain's catalog on first use or in a background thread.
+
+    loaders maps a domain to a function that loads and installs its catalog.
+    warm_up, if given, is called with the domain after a successful load to
+    pre-build models; the domain already serves requests while it runs.
+    Every domain is 'not_loaded', 'loading', 'ready' or 'failed'.
+    """
+
+    def __init__(self, loaders, warm_up=None):
+        self.loaders = loaders
+        self.warm_up = warm_up
+        self._lock = threading.Lock()
+        self._load_locks = {domain: threading.Lock() for domain in loaders}
+        self._states = {domain: self._initial_state() for domain in loaders}
+
+    @staticmethod
+    def _initial_state():
+        return {'status': 'not_loaded', 'error': None, 'load_seconds': None,
+                'warm': False, 'warm_seconds': None}
+
+    def _update(self, domain, **changes):
+        with self._lock:
+            self._states[domain].update(changes)
+
+    def ensure(self, domain):
+        """Load domain if it is not loaded yet, blocking until it is.
+
+        Concurrent callers wait for a single load. A failed load is retried
+        by the next caller; this one gets DatasetUnavailable.
+        """
+        if self._states[domain]['status'] == 'ready':
+            return
+        with self._load_locks[domain]:
+            if self._states[domain]['status'] == 'ready':
+                return
+            self._update(domain, status='loading', error=None)
+            start = time.perf_counter()
+            try:
+                self.loaders[domain]()
+            except Exception as e:
+                print(f"Error loading {domain} dataset: {e}")
+                self._update(domain, status='failed', error=str(e))
+                raise DatasetUnavailable(f"The {domain} dataset could not be loaded: {e}")
+            self._update(domain, status='ready', load_seconds=time.perf_counter() - start)
+        print(f"{domain} dataset ready in {self._states[domain]['load_seconds']:.2f}s")
+
+    def warm(self, domain):
+        """Run the warm-up for an already loaded domain."""
+        if self.warm_up is None:
+            return
+        start = time.perf_counter()
+        try:
+            self.warm_up(domain)
+        except Exception as e:
+            print(f"Error warming up {domain} models: {e}")
+            return
+        self._update(domain, warm=True, warm_seconds=time.perf_counter() - start)
+
+    def load_in_background(self, domains):
+        """Load and warm up domains one after another in a daemon thread."""
+        def run():
+            for domain in domains:
+                try:
+                    self.ensure(domain)
+                except DatasetUnavailable:
+                    continue
+                self.warm(domain)
+
+        thread = threading.Thread(target=run, name='dataset-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def reset_after_fork(self):
+        """Forget loads that were in progress when a worker process forked.
+
+        Their threads do not exist in the child, so the domains go back to
+        'not_loaded' and are loaded again on first use.
+        """
+        self._lock = threading.Lock()
+        self._load_locks = {domain: threading.Lock() for domain in self.loaders}
+        for domain, state in self._states.items():
+            if state['status'] != 'ready':
+                self._states[domain] = self._initial_state()
+
+    def mark_ready(self, domain):
+        """Record that a catalog was installed for domain outside of ensure()."""
+        self._update(domain, status='ready', error=None)
+
+    def is_ready(self, domain):
+        return self._states[domain]['status'] == 'ready'
+
+    def status(self, domain):
+        with self._lock:
+            return dict(self._states[domain])
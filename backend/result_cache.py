@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Bounded, thread-safe cache of computed responses with a time to live.
+
+    Entries expire ttl seconds after they were stored, and beyond
+    max_entries the least recently used ones are evicted. Concurrent misses
+    on the same key share a single computation: the first caller starts it
+    as a task and every caller awaits that task, so a caller going away
+    does not cancel it for the others. Failed computations are not cached.
+    """
+
+    def __init__(self, max_entries=4096, ttl=300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires)
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> task computing it, only touched on the event loop
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is not cached or has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store value under key for ttl seconds and evict old entries if over the limit."""
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return value
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, self.clock() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    async def get_or_compute(self, key, compute):
+        """Return the cached value for key, awaiting compute() once on a miss.
+
+        Callers that miss while the same key is being computed wait for
+        that computation instead of starting their own.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        return self.put(key, await compute())
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only those whose key matches predicate."""
+        with self._lock:
+            for key in list(self._entries):
+                if predicate is None or predicate(key):
+                    del self._entries[key]
+
+    def stats(self):
+        """Return hit/miss counters and current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'in_flight': len(self._pending),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
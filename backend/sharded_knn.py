@@ -0,0 +1,162 @@
+import heapq
+import itertools
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from ann_index import normalize_rows
+
+_pools = {}  # workers -> ProcessPoolExecutor shared by every index
+_pools_lock = threading.Lock()
+_mapped = OrderedDict()  # in pool workers: path -> mapped vectors, most recent last
+MAPPED_FILES = 8
+
+
+def shard_pool(workers):
+    """The process pool with workers processes that answers shard queries."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+            # Shut down at exit before multiprocessing closes the pool's queues
+            # (priority 10) and joins its workers, also in the worker processes
+            # of another pool, which would otherwise wait on them forever
+            util.Finalize(pool, pool.shutdown, kwargs={'wait': True, 'cancel_futures': True}, exitpriority=20)
+        return pool
+
+
+def discard_pool(workers, pool):
+    """Stop using a pool whose workers died; the next shard_pool() starts a new one."""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _vectors(path):
+    vectors = _mapped.pop(path, None)
+    if vectors is None:
+        # Unmap the files of replaced indexes, whose disk space the mappings hold
+        for stale in [p for p in _mapped if not os.path.exists(p)]:
+            del _mapped[stale]
+        vectors = np.load(path, mmap_mode='r')
+    _mapped[path] = vectors
+    while len(_mapped) > MAPPED_FILES:
+        _mapped.popitem(last=False)
+    return vectors
+
+
+def query_shard(path, start, stop, queries, k):
+    """(similarities, rows) of the top k rows start:stop of the vectors at path for each query, best first."""
+    vectors = _vectors(path)[start:stop]
+    sims = queries @ vectors.T
+    k = min(k, stop - start)
+    if k < sims.shape[1]:
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind='stable')
+    return np.take_along_axis(top_sims, order, axis=1), np.take_along_axis(top, order, axis=1) + start
+
+
+class ShardedKNN:
+    """Exact cosine nearest neighbors scattered over a pool of worker processes.
+
+    fit() writes the L2-normalized vectors to a file under directory and
+    splits its rows into n_shards contiguous shards. A query is sent to
+    every shard; each worker maps the file, scans only its shard's rows and
+    returns its own top k, and the per-shard lists are merged with a heap.
+    Workers only touch the pages of the shards they scan. kneighbors()
+    mirrors sklearn's NearestNeighbors with metric='cosine', so the index
+    can stand in for the brute-force model. A query the shards do not answer
+    within timeout seconds, or one hitting a broken pool, is answered by a
+    NearestNeighbors model over the whole file in the calling process.
+    """
+
+    def __init__(self, n_shards=None, directory=None, timeout=None):
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.directory = directory or tempfile.gettempdir()
+        self.timeout = timeout
+
+    def fit(self, X):
+        vectors = normalize_rows(X)
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"knn-shards-{uuid.uuid4().hex}.npy")
+        np.save(self.path, vectors)
+        self.file_bytes = os.path.getsize(self.path)
+        # The file lives as long as the index (or its process), so replacing
+        # a model deletes its file; workers unmap it when they map another
+        util.Finalize(self, _remove, args=(self.path,), exitpriority=0)
+        n_rows = len(vectors)
+        n_shards = max(1, min(self.n_shards, n_rows))
+        self.bounds = np.linspace(0, n_rows, n_shards + 1).astype(np.int64)
+        return self
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True):
+        """Return (distances, indices) of the nearest neighbors of every row of X."""
+        queries = normalize_rows(np.atleast_2d(X))
+        k = min(n_neighbors, len(self))
+        pool = shard_pool(self.n_shards)
+        futures = []
+        try:
+            futures = [pool.submit(query_shard, self.path, int(start), int(stop), queries, k)
+                       for start, stop in zip(self.bounds[:-1], self.bounds[1:]) if stop > start]
+            deadline = None if self.timeout is None else time.monotonic() + self.timeout
+            shards = [future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                      for future in futures]
+        except (BrokenProcessPool, TimeoutError) as exc:
+            for future in futures:
+                future.cancel()
+            if isinstance(exc, BrokenProcessPool):
+                discard_pool(self.n_shards, pool)
+            print(f"Sharded kNN query failed ({type(exc).__name__}); scanning unsharded")
+            return self.unsharded(queries, k, return_distance)
+
+        distances = np.empty((len(queries), k))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        for q in range(len(queries)):
+            # Each shard's list is sorted, so the heap merge yields the global order
+            merged = heapq.merge(*(zip(-sims[q], rows[q]) for sims, rows in shards))
+            for i, (negative_sim, row) in enumerate(itertools.islice(merged, k)):
+                distances[q, i] = 1.0 + negative_sim
+                indices[q, i] = row
+        return (distances, indices) if return_distance else indices
+
+    def unsharded(self, queries, k, return_distance=True):
+        """kneighbors() of normalized queries without the pool."""
+        knn = NearestNeighbors(metric='cosine', algorithm='brute').fit(_vectors(self.path))
+        return knn.kneighbors(queries, n_neighbors=k, return_distance=return_distance)
+
+    @property
+    def nbytes(self):
+        # The vectors live in the shard file, mapped by the pool workers;
+        # count it so the model cache budget covers the file
+        return self.file_bytes
+
+    def __len__(self):
+        return int(self.bounds[-1])
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
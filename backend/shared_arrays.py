@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from genre_index import GenreIndex
+from title_index import TitleIndex
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; concurrent publishers then just duplicate work
+    fcntl = None
+
+STORE_FORMAT = 3
+
+
+def frame_fingerprint(df):
+    """Hash of every column of df, its name, dtype and values in row order."""
+    digest = hashlib.sha1()
+    for name in df.columns:
+        series = df[name]
+        digest.update(f"{name}:{series.dtype}".encode())
+        digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def store_key(*parts):
+    """Key of an entry built from parts, which must identify its contents."""
+    name = str(parts[0])
+    return f"{name}-{hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:24]}"
+
+
+class SharedStore:
+    """Read-only arrays shared by worker processes through memory-mapped files.
+
+    The first process that needs an entry builds it and publishes it under
+    directory/<key>; every other process maps the published files instead
+    of building its own copy, and the OS keeps one copy of their pages for
+    all of them. An entry is a dict of numpy arrays (without objects), bytes
+    (mapped as a read-only mmap) and small JSON values. Nothing is unpickled,
+    so loading an entry cannot run code from the directory; its contents
+    are still trusted as published.
+    Entries persist across restarts; tags published with an entry let stale
+    ones be pruned. Beyond max_entries entries or max_bytes, the least
+    recently loaded entries whose tags match evictable are removed.
+    """
+
+    def __init__(self, directory, max_entries=None, max_bytes=None, evictable=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictable = evictable or (lambda tags: True)
+        os.makedirs(directory, exist_ok=True)
+
+    def get_or_publish(self, key, build, tags=None):
+        """The entry under key, calling build() and publishing its result if there is none."""
+        entry = self.load(key)
+        if entry is not None:
+            return entry
+        with self._lock(key):
+            # Another worker may have published it while we waited
+            entry = self.load(key)
+            if entry is None:
+                self.publish(key, build(), tags)
+                entry = self.load(key)
+        return entry
+
+    def publish(self, key, parts, tags=None):
+        target = os.path.join(self.directory, key)
+        tmp = f"{target}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        kinds = {}
+        for name, value in parts.items():
+            path = os.path.join(tmp, name)
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                kinds[name] = 'array'
+                np.save(path + '.npy', np.ascontiguousarray(value))
+            elif isinstance(value, (bytes, bytearray, mmap.mmap)):
+                kinds[name] = 'bytes'
+                with open(path + '.bin', 'wb') as f:
+                    f.write(value)
+            else:
+                kinds[name] = 'json'
+                with open(path + '.json', 'w', encoding='utf-8') as f:
+                    json.dump(value, f)
+        # meta.json marks a complete entry, so it is written last
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'format': STORE_FORMAT, 'parts': kinds, 'tags': tags or {}}, f)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        self.trim(keep=key)
+        return target
+
+    def load(self, key):
+        """Map the entry published under key, or return None."""
+        target = os.path.join(self.directory, key)
+        meta_path = os.path.join(target, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('format') != STORE_FORMAT:
+                return None
+            entry = {}
+            for name, kind in meta['parts'].items():
+                path = os.path.join(target, name)
+                if kind == 'array':
+                    entry[name] = np.load(path + '.npy', mmap_mode='r')
+                elif kind == 'bytes':
+                    entry[name] = map_bytes(path + '.bin')
+                else:
+                    with open(path + '.json', encoding='utf-8') as f:
+                        entry[name] = json.load(f)
+            # Marks the entry as recently used for trim()
+            os.utime(meta_path)
+            return entry
+        except Exception as e:
+            print(f"Error loading shared entry {key} from {target}: {e}")
+            return None
+
+    def _lock(self, key):
+        return FileLock(os.path.join(self.directory, key + '.lock'))
+
+    def entries(self):
+        """Published entries with their size in bytes."""
+        sizes = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(os.path.join(path, 'meta.json')):
+                sizes[name] = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        return sizes
+
+    def _meta(self, name):
+        try:
+            with open(os.path.join(self.directory, name, 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, name):
+        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        if os.path.exists(os.path.join(self.directory, name + '.lock')):
+            os.remove(os.path.join(self.directory, name + '.lock'))
+
+    def prune(self, predicate):
+        """Remove the entries whose tags match predicate (and those of other formats); returns their tags.
+
+        Processes that mapped a removed entry keep their mapping.
+        """
+        removed = []
+        for name in self.entries():
+            meta = self._meta(name)
+            if meta is None:
+                continue
+            tags = meta.get('tags', {})
+            if meta.get('format') != STORE_FORMAT or predicate(tags):
+                self._remove(name)
+                removed.append(tags)
+        return removed
+
+    def trim(self, keep=None):
+        """Remove the least recently loaded evictable entries beyond the limits, except keep."""
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        candidates = []
+        for name, size in self.entries().items():
+            meta = self._meta(name)
+            if meta is None or not self.evictable(meta.get('tags', {})):
+                continue
+            try:
+                used = os.path.getmtime(os.path.join(self.directory, name, 'meta.json'))
+            except OSError:
+                continue
+            candidates.append((used, name, size))
+        candidates.sort()
+        count, total = len(candidates), sum(size for _, _, size in candidates)
+        for used, name, size in candidates:
+            if ((self.max_entries is None or count <= self.max_entries)
+                    and (self.max_bytes is None or total <= self.max_bytes)):
+                break
+            if name == keep:
+                continue
+            self._remove(name)
+            count -= 1
+            total -= size
+
+
+class FileLock:
+    """An exclusive flock on a lock file, held for the duration of a with-block.
+
+    The file is removed before the lock is released, so none are left
+    behind. A process that was waiting on the removed file still gets its
+    lock and finds the entry published; at worst two processes build the
+    same entry, which publishing tolerates.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        return False
+
+
+def map_bytes(path):
+    """A read-only mmap of a file; empty files cannot be mapped and give b''."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def shared_column(series):
+    """The array to share for a column, or None for columns that stay private.
+
+    Numeric columns are shared as they are and categoricals as their codes;
+    strings are Python objects every process holds itself.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return np.asarray(series.array.codes)
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf':
+        return series.to_numpy()
+    return None
+
+
+def share_catalog(store, key, df, genre_col, genre_index=None, tags=None):
+    """Return (df, genre_index, title_index) for a catalog, backed by shared arrays.
+
+    The numeric and categorical columns of df, the genre bitmasks and the
+    title index arrays are mapped from the store entry under key; the first
+    worker to load the catalog builds and publishes them.
+    """
+    def build():
+        index = genre_index if genre_index is not None else GenreIndex.from_series(df[genre_col])
+        parts = {'genre.words': index.words, 'genre.vocabulary': list(index.vocabulary)}
+        for name, values in TitleIndex(df['title']).arrays().items():
+            parts[f'title.{name}'] = values
+        for name in df.columns:
+            values = shared_column(df[name])
+            if values is not None:
+                parts[f'column.{name}'] = values
+        return parts
+
+    entry = store.get_or_publish(key, build, tags)
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        values = entry.get(f'column.{name}')
+        if values is None:
+            columns[name] = series
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            columns[name] = pd.Categorical.from_codes(values, dtype=series.dtype, validate=False)
+        else:
+            columns[name] = values
+    shared_df = pd.DataFrame(columns, index=df.index, copy=False)
+    genre_index = GenreIndex(entry['genre.vocabulary'], entry['genre.words'])
+    title_index = TitleIndex.from_arrays({
+        name[len('title.'):]: value for name, value in entry.items() if name.startswith('title.')
+    })
+    return shared_df, genre_index, title_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or clear the entries of a shared array store.")
+    parser.add_argument('directory', help="store directory (SHARED_DIR of the app)")
+    parser.add_argument('--clear', action='store_true', help="remove every entry")
+    args = parser.parse_args()
+
+    store = SharedStore(args.directory)
+    for name, size in sorted(store.entries().items()):
+        print(f"{name:<40} {size / 2**20:9.1f} MB")
+    if args.clear:
+        shutil.rmtree(args.directory)
+        print(f"Removed {args.directory}")
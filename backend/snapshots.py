@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from genre_index import GenreIndex
+
+SNAPSHOT_FORMAT = 1
+
+
+def genre_column(domain):
+    return 'genres' if domain == 'book' else 'genre'
+
+
+def source_signature(path):
+    """Size and modification time of a source file, to detect stale snapshots."""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def code_dtype(n_categories):
+    """The integer type pandas holds the codes of n_categories categories in."""
+    return next(dtype for dtype in (np.int8, np.int16, np.int32, np.int64) if n_categories < np.iinfo(dtype).max)
+
+
+def write_snapshot(directory, domain, df, genre_index=None, source_path=None):
+    """Write a domain's catalog as a columnar snapshot under directory/domain.
+
+    Numeric columns are stored as typed .npy arrays, string columns as
+    dictionary codes (in the integer type pandas uses for categorical codes,
+    so they load without a copy) plus their distinct values, and the genre
+    column is stored pre-parsed as the GenreIndex bitmask words.
+    """
+    target = os.path.join(directory, domain)
+    tmp = target + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        entry = {'name': name}
+        if pd.api.types.is_bool_dtype(series.dtype) and not series.isna().any():
+            entry['kind'] = 'numeric'
+            values = series.to_numpy(dtype=bool)
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            entry['kind'] = 'numeric'
+            if series.isna().any() or not pd.api.types.is_float_dtype(series.dtype) and series.dtype.kind not in 'iu':
+                values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                values = series.to_numpy()
+        else:
+            entry['kind'] = 'string'
+            codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=True)
+            values = codes.astype(code_dtype(len(uniques)))
+            with open(os.path.join(tmp, f'{name}.values.json'), 'w', encoding='utf-8') as f:
+                json.dump([str(v) for v in uniques], f, ensure_ascii=False)
+        np.save(os.path.join(tmp, f'{name}.npy'), values)
+        columns.append(entry)
+
+    if genre_index is None:
+        genre_index = GenreIndex.from_series(df[genre_column(domain)])
+    np.save(os.path.join(tmp, 'genre_words.npy'), genre_index.words)
+
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'domain': domain,
+        'rows': len(df),
+        'columns': columns,
+        'genre_vocabulary': [str(g) for g in genre_index.vocabulary],
+        'source': source_signature(source_path),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def load_snapshot(directory, domain, source_path=None):
+    """Load a domain's snapshot as (df, genre_index), or (None, None).
+
+    Returns (None, None) when there is no usable snapshot, including when the
+    source CSV has changed since the snapshot was written, so callers can
+    fall back to parsing the CSV.
+    """
+    if not directory:
+        return None, None
+    target = os.path.join(directory, domain)
+    meta_path = os.path.join(target, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None, None
+
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != SNAPSHOT_FORMAT:
+            return None, None
+        current = source_signature(source_path)
+        if current is not None and meta.get('source') not in (None, current):
+            print(f"Snapshot for {domain} is older than {source_path}, ignoring it")
+            return None, None
+
+        # Every column stays backed by the mapped file: numeric columns are
+        # the arrays themselves, string columns categoricals over the codes
+        data = {}
+        for entry in meta['columns']:
+            name = entry['name']
+            # A plain ndarray view of the mapping, without np.memmap's subclass
+            values = np.asarray(np.load(os.path.join(target, f'{name}.npy'), mmap_mode='r'))
+            if entry['kind'] == 'string':
+                with open(os.path.join(target, f'{name}.values.json'), encoding='utf-8') as f:
+                    categories = pd.Index(json.load(f), dtype=object)
+                # Code -1 is a missing value
+                data[name] = pd.Categorical.from_codes(values, categories=categories, validate=False)
+            else:
+                data[name] = values
+        df = pd.DataFrame(data, copy=False)
+
+        words = np.load(os.path.join(target, 'genre_words.npy'), mmap_mode='r')
+        genre_index = GenreIndex(meta['genre_vocabulary'], words)
+        return df, genre_index
+    except Exception as e:
+        print(f"Error loading {domain} snapshot from {target}: {e}")
+        return None, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the processed CSV datasets into columnar snapshots.")
+    parser.add_argument('--domain', action='append', choices=['book', 'anime', 'movie'],
+                        help="domain to convert (repeatable, default: all)")
+    parser.add_argument('--out', help="snapshot directory (default: SNAPSHOT_DIR of the app)")
+    args = parser.parse_args()
+
+    # Only the dataset loaders are needed: keep the app from opening the model
+    # store, which would prune it and refit its models in the background
+    os.environ['MODEL_DIR'] = os.environ['SHARED_DIR'] = ''
+    os.environ['DATASET_PRELOAD'] = 'lazy'
+    import app as recommender
+    out = args.out or recommender.SNAPSHOT_DIR
+    # Read the CSVs, not an existing snapshot
+    recommender.SNAPSHOT_DIR = None
+
+    for domain in args.domain or ['book', 'anime', 'movie']:
+        catalog = recommender.get_catalog(domain)
+        df = catalog.df
+        if catalog.source not in ('csv', 'raw'):
+            print(f"Skipping {domain}: no processed dataset was found")
+            continue
+        source = os.path.join(os.path.dirname(os.path.abspath(recommender.__file__)), f"{domain}_processed.csv")
+        path = write_snapshot(out, domain, df, catalog.genre_index, source)
+        print(f"Wrote {domain} snapshot with {len(df)} records to {path}")
@@ -0,0 +1,170 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Genre vocabularies roughly ordered by how common each genre is in the real
+# catalogs; genre popularity falls off with rank like a Zipf distribution
+BOOK_GENRES = [
+    'Fiction', 'Romance', 'Fantasy', 'Young Adult', 'Contemporary', 'Nonfiction', 'Mystery',
+    'Historical Fiction', 'Classics', 'Science Fiction', 'Paranormal', 'Thriller', 'Adult',
+    'Humor', 'Historical', 'Childrens', 'Literature', 'History', 'Mystery Thriller', 'Adventure',
+    'Biography', 'Philosophy', 'Memoir', 'Urban Fantasy', 'Chick Lit', 'Horror', 'Contemporary Romance',
+    'Womens Fiction', 'Drama', 'Picture Books', 'Science', 'Psychology', 'Biography Memoir',
+    'Epic Fantasy', 'Dystopia', 'Literary Fiction', '20th Century', '21st Century', 'Family',
+    'Inspirational', 'War', 'Space Opera', 'Spy Thriller', 'Military Fiction', 'Sociology',
+    'Popular Science', 'Education', 'Reference', 'Autobiography', 'Comedy', 'Action', 'Criticism',
+    'Literary Criticism', '19th Century', 'Ancient', 'Ancient History', 'Science Fiction Fantasy',
+]
+ANIME_GENRES = [
+    'Comedy', 'Action', 'Fantasy', 'Adventure', 'Drama', 'Sci-Fi', 'Romance', 'Slice of Life',
+    'School', 'Shounen', 'Supernatural', 'Kids', 'Mystery', 'Magic', 'Mecha', 'Seinen', 'Music',
+    'Historical', 'Sports', 'Ecchi', 'Shoujo', 'Military', 'Super Power', 'Parody', 'Space',
+    'Psychological', 'Horror', 'Martial Arts', 'Demons', 'Harem', 'Police', 'Game', 'Samurai',
+    'Josei', 'Thriller', 'Isekai', 'Vampire', 'Tragedy', 'Family', 'Documentary', 'Educational',
+    'Medical', 'Philosophy',
+]
+MOVIE_GENRES = [
+    'Drama', 'Comedy', 'Documentary', 'Romance', 'Action', 'Crime', 'Thriller', 'Horror',
+    'Adventure', 'Family', 'Mystery', 'Biography', 'Fantasy', 'History', 'Animation', 'Sci-Fi',
+    'Music', 'Reality-TV', 'War', 'Musical', 'Sport', 'Western', 'Talk-Show', 'News', 'Game-Show',
+]
+# Mean number of extra genres per item and the most genres an item can have
+GENRE_COUNTS = {'book': (3.0, 10), 'anime': (2.0, 8), 'movie': (1.0, 3)}
+GENRES = {'book': BOOK_GENRES, 'anime': ANIME_GENRES, 'movie': MOVIE_GENRES}
+
+SYLLABLES = ['ka', 'ri', 'to', 'shi', 'mon', 'el', 'dar', 'ven', 'lo', 'an', 'tha', 'mi', 'ro',
+             'sa', 'nor', 'ith', 'u', 'gal', 'be', 'qu', 'ea', 'zen', 'or', 'ly']
+TITLE_WORDS = ['the', 'of', 'a', 'and', 'night', 'love', 'war', 'star', 'king', 'queen', 'house',
+               'city', 'last', 'first', 'shadow', 'fire', 'dark', 'life', 'death', 'world', 'girl',
+               'boy', 'secret', 'story', 'game', 'blood', 'heart', 'sea', 'road', 'summer']
+
+
+def zipf_weights(n, exponent=1.0):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_vocabulary(rng, size):
+    """Pseudo-words built from syllables, plus common English title words."""
+    lengths = rng.integers(1, 4, size)
+    syllables = rng.choice(SYLLABLES, (size, 3))
+    words = {''.join(row[:k]) for row, k in zip(syllables, lengths)}
+    return TITLE_WORDS + sorted(words - set(TITLE_WORDS))
+
+
+def make_titles(rng, n_rows):
+    vocabulary = np.array(make_vocabulary(rng, 4000), dtype=object)
+    word_ids = rng.choice(len(vocabulary), (n_rows, 5), p=zipf_weights(len(vocabulary), 0.9))
+    lengths = rng.integers(1, 6, n_rows)
+    words = vocabulary[word_ids]
+    return [' '.join(row[:k]).title() for row, k in zip(words, lengths)]
+
+
+def make_genres(rng, domain, n_rows, chunk=100000):
+    """Comma-separated genre lists drawn without replacement by Zipf popularity."""
+    vocabulary = np.array(GENRES[domain], dtype=object)
+    mean_extra, max_genres = GENRE_COUNTS[domain]
+    log_weights = np.log(zipf_weights(len(vocabulary))).astype(np.float32)
+    counts = np.minimum(1 + rng.poisson(mean_extra, n_rows), max_genres)
+
+    genres = []
+    for start in range(0, n_rows, chunk):
+        size = min(chunk, n_rows - start)
+        # Gumbel top-k samples each row's genres without replacement at once
+        keys = log_weights + rng.gumbel(size=(size, len(vocabulary))).astype(np.float32)
+        order = np.argsort(-keys, axis=1)[:, :max_genres]
+        names = vocabulary[order]
+        genres.extend(','.join(row[:k]) for row, k in zip(names, counts[start:start + size]))
+    return genres
+
+
+def recent_years(rng, n_rows, start, end):
+    """Years skewed towards the recent end of [start, end)."""
+    return (start + (end - start) * rng.beta(3.0, 1.2, n_rows)).astype(np.int64)
+
+
+def make_catalog(domain, n_rows, seed=0):
+    """A synthetic catalog with the columns the app holds for domain.
+
+    Titles use Zipf-distributed words (so substring lookups hit many rows),
+    vote counts are log-normal and genres follow the popularity of the real
+    catalogs, so filters select realistic shares of the rows.
+    """
+    rng = np.random.default_rng(seed)
+    titles = make_titles(rng, n_rows)
+    genres = make_genres(rng, domain, n_rows)
+    votes = rng.lognormal(6.0, 2.0, n_rows).astype(np.int64)
+
+    if domain == 'book':
+        authors = rng.choice(max(1, n_rows // 5), n_rows, p=zipf_weights(max(1, n_rows // 5), 0.8))
+        return pd.DataFrame({
+            'item_id': np.arange(1, n_rows + 1).astype(str),
+            'title': titles,
+            'author': [f"Author {a}" for a in authors],
+            'genres': genres,
+            'avg_rating': np.clip(rng.normal(3.9, 0.3, n_rows), 1, 5).round(2),
+            'num_votes': votes,
+            'domain': 'book',
+            'img': [f"https://images.example.com/books/{i}.jpg" for i in range(n_rows)],
+        })
+
+    if domain == 'anime':
+        studios = np.array([f"Studio {s}" for s in range(300)], dtype=object)
+        years = recent_years(rng, n_rows, 1960, 2025).astype(np.float64)
+        years[rng.random(n_rows) < 0.02] = np.nan
+        anime_ids = np.arange(1, n_rows + 1)
+        df = pd.DataFrame({
+            'anime_id': anime_ids,
+            'title': titles,
+            'studio': studios[rng.choice(len(studios), n_rows, p=zipf_weights(len(studios)))],
+            'genre': genres,
+            'avg_rating': np.clip(rng.normal(6.5, 0.9, n_rows), 1, 10).round(2),
+            'scored_by': votes,
+            'image_url': [f"https://images.example.com/anime/{i}.jpg" for i in range(n_rows)],
+            'aired_from_year': years,
+            'domain': 'anime',
+        })
+        # Columns load_anime_dataset derives from the processed CSV
+        df['num_votes'] = df['scored_by']
+        df['item_id'] = df['anime_id']
+        df['author'] = df['studio']
+        return df
+
+    title_types = rng.choice(['movie', 'tvSeries', 'tvMiniSeries'], n_rows, p=[0.7, 0.2, 0.1])
+    item_ids = [f"tt{i:07d}" for i in range(1, n_rows + 1)]
+    return pd.DataFrame({
+        'item_id': item_ids,
+        'title': titles,
+        'titleType': title_types,
+        'author': np.where(title_types == 'movie', 'Director', 'Creator'),
+        'genre': genres,
+        'year': recent_years(rng, n_rows, 1900, 2025),
+        'avg_rating': np.clip(rng.normal(6.2, 1.2, n_rows), 1, 10).round(1),
+        'num_votes': votes,
+        'domain': 'movie',
+        'img': [f"https://m.media-amazon.com/images/M/{i[2:]}._V1_SX300.jpg" for i in item_ids],
+    })
+
+
+def write_catalog(domain, n_rows, path, seed=0):
+    """Write a synthetic catalog as the domain's processed CSV."""
+    df = make_catalog(domain, n_rows, seed)
+    if domain == 'anime':
+        df = df.drop(columns=['num_votes', 'item_id', 'author'])
+    df.to_csv(path, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic processed catalogs.")
+    parser.add_argument('--domain', action='append', choices=['book', 'anime', 'movie'],
+                        help="domain to write (repeatable, default: all)")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out-dir', default='.')
+    args = parser.parse_args()
+
+    for domain in args.domain or ['book', 'anime', 'movie']:
+        path = write_catalog(domain, args.rows, f"{args.out_dir}/{domain}_processed.csv", args.seed)
+        print(f"Wrote {args.rows} synthetic {domain} records to {path}")
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the app off the datasets, stores and tables of the working tree
+os.environ['DATASET_PRELOAD'] = 'lazy'
+for name in ('MODEL_DIR', 'SHARED_DIR', 'SNAPSHOT_DIR', 'NEIGHBOR_DIR'):
+    os.environ[name] = ''
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+
+    import app
+    with TestClient(app.app) as client:
+        yield client
+
+
+@pytest.fixture
+def sample(monkeypatch):
+    """Install the built-in sample catalog of a domain, whatever data is on disk."""
+    import app
+
+    def install(domain):
+        with monkeypatch.context() as patch:
+            patch.setattr(os.path, 'exists', lambda path: False)
+            catalog = app.DATASET_LOADERS[domain]()
+        assert catalog.source == 'sample'
+        return app.install_catalog(catalog)
+    return install
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import NearestNeighbors
+
+import app
+from ann_index import IVFIndex, recall_at_k
+from synthetic import make_catalog
+
+
+@pytest.fixture(scope='module')
+def vectors():
+    return np.random.default_rng(0).normal(size=(3000, 16)).astype(np.float32)
+
+
+def test_probing_every_list_is_exact(vectors):
+    distances, indices = NearestNeighbors(metric='cosine').fit(vectors).kneighbors(vectors[:25], 10)
+    found_distances, found = IVFIndex(n_lists=32, n_probe=32).fit(vectors).kneighbors(vectors[:25], 10)
+    np.testing.assert_array_equal(found, indices)
+    np.testing.assert_allclose(found_distances, distances, atol=1e-5)
+
+
+def test_recall_grows_with_probes(vectors):
+    queries = np.arange(100)
+    index = IVFIndex(n_lists=32).fit(vectors)
+    recalls = [recall_at_k(IVFIndex.from_arrays(index.arrays(), n_probe=n), vectors, queries) for n in (1, 8, 32)]
+    assert recalls[0] <= recalls[1] <= recalls[2] == 1.0
+
+
+def test_remapped_index_drops_and_adds_vectors(vectors):
+    index = IVFIndex(n_lists=16, n_probe=16).fit(vectors[:2000])
+    remap = np.arange(2000)
+    remap[::2] = -1
+    remap[1::2] = np.arange(1000)
+    new_ids = np.arange(1000, 1500)
+    remapped = index.remapped(remap, new_ids, vectors[2000:2500])
+    expected = np.concatenate((vectors[1:2000:2], vectors[2000:2500]))
+    distances, indices = NearestNeighbors(metric='cosine').fit(expected).kneighbors(expected[:20], 5)
+    found_distances, found = remapped.kneighbors(expected[:20], 5)
+    np.testing.assert_array_equal(found, indices)
+    np.testing.assert_allclose(found_distances, distances, atol=1e-5)
+
+
+def test_ivf_backend_matches_the_exact_model(monkeypatch):
+    # Synthetic items share genres, so compare distances rather than tied ids
+    latent = app.fit_latent(make_catalog('anime', 3000), 'anime')
+    monkeypatch.setattr(app, 'ANN_LISTS', 16)
+    monkeypatch.setattr(app, 'ANN_PROBE', 16)
+    knn = app.fit_knn(latent, 'ivf')
+    assert isinstance(knn, IVFIndex)
+    queries = np.arange(0, len(latent), 100)
+    assert recall_at_k(knn, latent, queries, k=6) == 1.0
+    np.testing.assert_allclose(knn.kneighbors(latent[queries], 6)[0],
+                               app.fit_knn(latent, 'exact').kneighbors(latent[queries], 6)[0], atol=1e-5)
@@ -0,0 +1,45 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+import benchmark
+from synthetic import make_catalog, write_catalog
+
+
+@pytest.mark.parametrize('domain', ['book', 'anime', 'movie'])
+def test_synthetic_catalogs_have_the_app_columns(domain):
+    df = make_catalog(domain, 500, seed=3)
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    assert len(df) == 500 and df['item_id'].is_unique
+    assert {'item_id', 'title', 'author', genre_col, 'avg_rating', 'num_votes'} <= set(df.columns)
+    pd.testing.assert_frame_equal(df, make_catalog(domain, 500, seed=3))
+    catalog = app.set_dataset(domain, df)
+    latent, knn, positions = app.get_model(catalog, None, None, None)
+    assert len(positions) == len(latent) > 0
+
+
+def test_written_anime_catalog_holds_the_csv_columns(tmp_path):
+    df = pd.read_csv(write_catalog('anime', 100, tmp_path / 'anime_processed.csv'))
+    assert {'anime_id', 'scored_by', 'studio'} <= set(df.columns)
+    assert not {'item_id', 'num_votes', 'author'} & set(df.columns)
+
+
+def test_benchmark_report_and_comparison():
+    report = benchmark.run(['anime'], [300], repeat=2, endpoints=False)
+    stages = {row['stage'] for row in report['results']}
+    assert {'load_indexes', 'cached_model'} <= stages
+    assert all(row['median_ms'] >= 0 for row in report['results'])
+    assert benchmark.compare(report, report) == []
+
+    slower = copy.deepcopy(report)
+    for row in slower['results']:
+        row['median_ms'] = row['median_ms'] * 2 + 1
+    assert len(benchmark.compare(report, slower, threshold=1.5)) == len(report['results'])
+
+
+def test_summarize_reports_milliseconds():
+    timing = benchmark.summarize(np.array([0.001, 0.002, 0.003]))
+    assert timing['median_ms'] == pytest.approx(2.0)
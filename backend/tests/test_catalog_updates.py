@@ -0,0 +1,138 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import app
+from catalog_updates import LatentProjection
+from synthetic import make_catalog
+
+
+@pytest.fixture
+def catalog_df():
+    return make_catalog('anime', 2000, seed=1)
+
+
+@pytest.mark.parametrize('svd_mode', ['full', 'truncated'])
+def test_projection_reproduces_the_fitted_rows(catalog_df, svd_mode):
+    latent, projection = app.fit_latent(catalog_df, 'anime', svd_mode=svd_mode, return_projection=True)
+    np.testing.assert_allclose(projection.transform(catalog_df), latent, atol=1e-6)
+    restored = LatentProjection.from_arrays(projection.arrays())
+    np.testing.assert_allclose(restored.transform(catalog_df), latent, atol=1e-6)
+
+
+def test_upserts_are_folded_into_the_model(catalog_df):
+    catalog = app.set_dataset('anime', catalog_df)
+    latent, _, positions = app.get_model(catalog, None, None, None)
+
+    # A new item with the features of row 5, and row 7 removed
+    record = catalog_df.iloc[5].to_dict()
+    record.update(item_id=90001, anime_id=90001, title='Brand New Show')
+    summary = app.upsert_items('anime', [record])
+    assert summary['added'] == 1 and not summary['refit']
+    app.remove_items('anime', [catalog_df['item_id'].iloc[7]])
+
+    catalog = app.get_catalog('anime')
+    folded, knn, folded_positions = app.get_model(catalog, None, None, None)
+    new_row = len(catalog_df)
+    assert new_row in folded_positions and 7 not in folded_positions
+    np.testing.assert_allclose(folded[np.flatnonzero(folded_positions == new_row)[0]],
+                               latent[np.flatnonzero(positions == 5)[0]], atol=1e-6)
+    # The rows that did not change keep their fitted vectors
+    np.testing.assert_array_equal(folded[np.isin(folded_positions, positions)],
+                                  latent[np.isin(positions, folded_positions)])
+    assert len(knn.kneighbors(folded[:1], 5, return_distance=False)[0]) == 5
+    assert catalog.title_index.first_match('Brand New Show') == new_row
+
+
+def test_catalog_endpoints_need_the_admin_token(sample, client, monkeypatch):
+    sample('anime')
+    item = {'items': [{'item_id': 9, 'title': 'Cowboy Bebop', 'genre': 'Action,Sci-Fi'}]}
+    assert client.post('/catalog/anime/items', json=item).status_code == 403
+
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    headers = {'Authorization': 'Bearer secret'}
+    assert client.post('/catalog/anime/items', json=item, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    # Updates stay off until CATALOG_UPDATES is set
+    assert client.post('/catalog/anime/items', json=item, headers=headers).status_code == 403
+
+    monkeypatch.setattr(app, 'CATALOG_UPDATES', True)
+    response = client.post('/catalog/anime/items', json=item, headers=headers)
+    assert response.status_code == 200 and response.json()['added'] == 1
+    response = client.post('/recommendations/', json={'domain': 'anime', 'titles': ['Cowboy Bebop']})
+    assert response.status_code == 200
+    response = client.post('/catalog/anime/items/remove', json={'item_ids': [9]}, headers=headers)
+    assert response.json()['removed'] == 1
+
+
+def test_anime_upserts_keep_integer_ids(catalog_df):
+    app.set_dataset('anime', catalog_df)
+    record = catalog_df.iloc[5].to_dict()
+
+    with pytest.raises(ValueError):
+        app.upsert_items('anime', [{**record, 'item_id': f"n{i}", 'title': f"New {i}"} for i in range(40)])
+    with pytest.raises(ValueError):
+        app.upsert_items('anime', [{**record, 'item_id': 7}, {**record, 'item_id': 'x', 'title': 'X'}])
+    with pytest.raises(ValueError):
+        app.upsert_items('anime', [{**record, 'item_id': 7.5}])
+    assert len(app.get_catalog('anime')) == len(catalog_df)
+
+    # Ids given as strings or floats of integers replace the existing rows
+    summary = app.upsert_items('anime', [{**record, 'item_id': '7', 'title': 'Seven'},
+                                         {**record, 'item_id': 8.0, 'title': 'Eight'}])
+    assert summary['upserted'] == 2 and summary['added'] == 0
+    df = app.get_catalog('anime').df
+    assert len(df) == len(catalog_df) and df['item_id'].dtype == catalog_df['item_id'].dtype
+    assert df['title'].iloc[[6, 7]].tolist() == ['Seven', 'Eight']
+
+
+def test_invalid_ids_are_rejected_by_the_endpoint(client, monkeypatch):
+    app.set_dataset('anime', make_catalog('anime', 200))
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(app, 'CATALOG_UPDATES', True)
+    response = client.post('/catalog/anime/items', json={'items': [{'item_id': 'n0', 'title': 'New'}]},
+                           headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 400
+
+
+def test_updates_during_a_refit_are_not_blocked_and_carried_over(catalog_df, monkeypatch):
+    catalog = app.set_dataset('anime', catalog_df)
+    app.get_model(catalog, None, None, None)
+    building, release = threading.Event(), threading.Event()
+    warm_up_models = app.warm_up_models
+
+    def slow_warm_up(domain, catalog=None):
+        building.set()
+        release.wait(10)
+        warm_up_models(domain, catalog)
+
+    monkeypatch.setattr(app, 'warm_up_models', slow_warm_up)
+    monkeypatch.setattr(app, 'REFIT_DRIFT', 0.01)
+    ids = catalog_df['item_id']
+    record = catalog_df.iloc[5].to_dict()
+    # Removing 1% of the catalog starts a refit of the rest
+    assert app.remove_items('anime', ids.iloc[:20].tolist())['refit']
+    assert building.wait(10)
+
+    start = time.perf_counter()
+    app.upsert_items('anime', [{**record, 'item_id': 90001, 'anime_id': 90001, 'title': 'Brand New Show'},
+                               {**record, 'item_id': ids.iloc[30], 'title': 'Renamed Show'},
+                               {**record, 'item_id': ids.iloc[0], 'title': 'Back Again'}])
+    app.remove_items('anime', [ids.iloc[40]])
+    assert time.perf_counter() - start < 5
+    release.set()
+
+    deadline = time.monotonic() + 30
+    while app.get_catalog('anime').log is catalog.log or app.get_catalog('anime').active is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    refitted = app.get_catalog('anime')
+    df = refitted.df[refitted.active]
+    assert set(df['item_id']) == (set(ids) - set(ids.iloc[1:20]) - {ids.iloc[40]}) | {90001}
+    titles = dict(zip(df['item_id'], df['title']))
+    assert titles[90001] == 'Brand New Show' and titles[ids.iloc[30]] == 'Renamed Show'
+    assert titles[ids.iloc[0]] == 'Back Again'
+    # The rows removed before the refit are gone for good
+    assert len(refitted.df) == len(catalog_df) - 20 + 2
+    assert refitted.title_index.first_match('Brand New Show') is not None
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import app
+from synthetic import make_catalog
+
+
+@pytest.fixture
+def movies(monkeypatch):
+    monkeypatch.setattr(app, 'MODEL_MODE', 'global')
+    df = make_catalog('movie', 2000, seed=6)
+    app.set_dataset('movie', df)
+    return df
+
+
+def rows_recorded(stage, filter_label):
+    series = app.metrics.stage_rows._series.get((stage, 'movie', filter_label))
+    return (series[-2], series[-1]) if series else (0, 0)
+
+
+def test_filters_are_applied_as_a_mask(movies, client):
+    body = {'domain': 'movie', 'titles': [movies['title'].iloc[0]], 'genre': 'comedy', 'limit': 20}
+    response = client.post('/recommendations/', json=body)
+    items = response.json()['recommendations']
+    assert len(items) == 20 and all('Comedy' in item['genre'] for item in items)
+    assert movies['title'].iloc[0] not in [item['title'] for item in items]
+
+
+def test_unfiltered_requests_record_every_row_scanned(movies, client):
+    title = movies['title'].iloc[0]
+    before = rows_recorded('filter', '-/-/-')
+    assert client.post('/recommendations/', json={'domain': 'movie', 'titles': [title]}).status_code == 200
+    total, count = rows_recorded('filter', '-/-/-')
+    assert count == before[1] + 1 and total - before[0] == len(movies)
+
+    before = total, count
+    batch = {'requests': [{'domain': 'movie', 'titles': [t]} for t in movies['title'].iloc[1:4]]}
+    assert client.post('/recommendations/batch/', json=batch).status_code == 200
+    total, count = rows_recorded('filter', '-/-/-')
+    assert count > before[1] and (total - before[0]) == (count - before[1]) * len(movies)
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import app
+from pagination import CursorExpired, InvalidCursor, decode_cursor, encode_cursor
+from synthetic import make_catalog
+
+QUERY = ['anime', ('death note',), None, None, None]
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(40, 3, QUERY)
+    assert decode_cursor(cursor, 3, QUERY) == 40
+
+
+def test_cursor_expires_with_the_catalog_version():
+    cursor = encode_cursor(40, 3, QUERY)
+    with pytest.raises(CursorExpired):
+        decode_cursor(cursor, 4, QUERY)
+
+
+def test_cursor_is_tied_to_its_query():
+    cursor = encode_cursor(40, 3, QUERY)
+    with pytest.raises(InvalidCursor) as info:
+        decode_cursor(cursor, 3, QUERY[:1] + [('dune',)] + QUERY[2:])
+    assert not isinstance(info.value, CursorExpired)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', encode_cursor(-5, 3, QUERY)])
+def test_invalid_cursors(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 3, QUERY)
+
+
+@pytest.fixture
+def movies(client):
+    df = make_catalog('movie', 1000, seed=2)
+    app.set_dataset('movie', df)
+    return {'domain': 'movie', 'titles': [df['title'].iloc[0]]}
+
+
+def test_pages_follow_each_other_until_the_catalog_changes(movies, client):
+    whole = client.post('/recommendations/', json={**movies, 'limit': 30}).json()['recommendations']
+    pages, cursor = [], None
+    while len(pages) < 30:
+        body = {**movies, 'limit': 10, **({'cursor': cursor} if cursor else {})}
+        page = client.post('/recommendations/', json=body).json()
+        pages += page['recommendations']
+        cursor = page['next_cursor']
+    assert pages == whole and cursor
+
+    other = {**movies, 'titles': ['no such title'], 'cursor': cursor}
+    assert client.post('/recommendations/', json=other).status_code == 400
+    app.set_dataset('movie', make_catalog('movie', 1000, seed=2))
+    assert client.post('/recommendations/', json={**movies, 'cursor': cursor}).status_code == 410
+
+
+def test_ndjson_stream_matches_the_pages(movies, client, monkeypatch):
+    monkeypatch.setattr(app, 'RECOMMENDATIONS_STREAM_CHUNK', 7)
+    whole = client.post('/recommendations/', json={**movies, 'limit': 30}).json()
+    response = client.post('/recommendations/', json={**movies, 'limit': 30},
+                           headers={'Accept': 'application/x-ndjson'})
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[:-1] == whole['recommendations']
+    assert lines[-1] == {'next_cursor': whole['next_cursor']}
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from popularity import PopularityCube, ranked_rows
+
+SAMPLE_TITLES = {'book': 'The Great Gatsby', 'anime': 'Death Note', 'movie': 'The Godfather'}
+CELLS = [None, 0, 1, 2]
+
+
+def matcher(rows):
+    return lambda cell: np.ones(len(rows), dtype=bool) if cell is None else rows % 3 == cell
+
+
+def expected_cells(votes, active, depth):
+    rows = np.flatnonzero(active)
+    return {cell: ranked_rows(votes, rows[matcher(rows)(cell)])[:depth] for cell in CELLS}
+
+
+def test_cube_updates_match_a_rebuild():
+    rng = np.random.default_rng(0)
+    votes = rng.integers(0, 50, 5000).astype(np.float64)
+    active = np.ones(len(votes), dtype=bool)
+    cube = PopularityCube.build(votes, CELLS, matcher, depth=20, head=64)
+    for cell, rows in expected_cells(votes, active, 20).items():
+        np.testing.assert_array_equal(cube.cells[cell], rows)
+
+    # Raise some rows, remove others (including listed ones) and append new rows
+    top = cube.cells[None][:5]
+    votes = np.concatenate((votes, [60, 0, 45]))
+    active = np.concatenate((active, [True, True, True]))
+    changed = np.concatenate((rng.choice(5000, 30, replace=False), [5000, 5001, 5002]))
+    votes[changed[:30]] = rng.integers(0, 60, 30)
+    active[top] = False
+    cube = cube.updated(votes, np.concatenate((changed, top)), matcher, active)
+    for cell, rows in expected_cells(votes, active, 20).items():
+        np.testing.assert_array_equal(cube.cells[cell], rows)
+
+
+def test_popularity_votes_falls_back_to_scored_by():
+    assert list(app.popularity_votes(pd.DataFrame({'num_votes': [3, 1], 'scored_by': [1, 9]}))) == [3, 1]
+    assert list(app.popularity_votes(pd.DataFrame({'scored_by': [1, 9]}))) == [1, 9]
+    assert list(app.popularity_votes(pd.DataFrame({'title': ['a', 'b']}))) == [0, 0]
+
+
+@pytest.mark.parametrize('domain', ['book', 'anime', 'movie'])
+def test_sample_catalogs_serve_recommendations(domain, sample, client):
+    sample(domain)
+    assert client.get(f'/ready/{domain}').status_code == 200
+    response = client.post('/recommendations/', json={'domain': domain, 'titles': [SAMPLE_TITLES[domain]]})
+    assert response.status_code == 200
+    titles = [item['title'] for item in response.json()['recommendations']]
+    assert titles and SAMPLE_TITLES[domain] not in titles
+    moods = {'book': app.mood_to_book_genres, 'anime': app.mood_to_anime_genres, 'movie': app.mood_to_movie_genres}
+    for mood in moods[domain]:
+        response = client.post('/recommendations/', json={'domain': domain, 'titles': [SAMPLE_TITLES[domain]],
+                                                          'mood': mood})
+        assert response.status_code == 200
+    # Titles that match nothing get the most voted items
+    response = client.post('/recommendations/', json={'domain': domain, 'titles': ['qqqqqqqq']})
+    assert response.status_code == 200 and response.json()['recommendations']
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import app
+from synthetic import make_catalog
+
+
+def wait_for_reload(domain, timeout=30):
+    deadline = time.monotonic() + timeout
+    while app.app.reloads[domain]['status'] == 'reloading' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return app.app.reloads[domain]
+
+
+def test_reload_swaps_in_a_new_version(sample, client, monkeypatch):
+    serving = sample('movie')
+    release = threading.Event()
+
+    def load():
+        release.wait(10)
+        return app.build_catalog('movie', make_catalog('movie', 200), source='csv')
+
+    monkeypatch.setitem(app.DATASET_LOADERS, 'movie', load)
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    headers = {'Authorization': 'Bearer secret'}
+    assert client.post('/admin/reload/movie').status_code == 401
+
+    response = client.post('/admin/reload/movie', headers=headers)
+    assert response.status_code == 202 and response.json()['serving'] == serving.data_version
+    # The old version keeps serving while the new one loads, and reloads do not stack
+    assert client.post('/admin/reload/movie', headers=headers).status_code == 409
+    assert app.get_catalog('movie') is serving
+    release.set()
+
+    assert wait_for_reload('movie')['status'] == 'ready'
+    current = app.get_catalog('movie')
+    assert current.version > serving.version and len(current) == 200
+    assert client.get('/ready/movie').status_code == 200
+
+
+def test_failed_reload_keeps_serving(sample, client, monkeypatch):
+    serving = sample('book')
+
+    def load():
+        raise OSError("disk gone")
+
+    monkeypatch.setitem(app.DATASET_LOADERS, 'book', load)
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/reload/book', headers={'Authorization': 'Bearer secret'}).status_code == 202
+    status = wait_for_reload('book')
+    assert status['status'] == 'failed' and 'disk gone' in status['error']
+    assert app.get_catalog('book') is serving
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import app
+from result_cache import ResultCache
+from synthetic import make_catalog
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_and_evict():
+    clock = Clock()
+    cache = ResultCache(max_entries=2, ttl=10, clock=clock)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1
+    clock.now = 11
+    assert cache.get('a') is None and cache.get('c') is None
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['expirations'] == 2
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute('key', compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['value'] * 5
+    assert len(calls) == 1 and cache.stats()['coalesced'] == 4
+
+
+@pytest.fixture
+def movies(client):
+    df = make_catalog('movie', 500, seed=4)
+    app.set_dataset('movie', df)
+    return df['title'].iloc[:2].tolist()
+
+
+def test_get_responses_revalidate(movies, client):
+    params = {'title': movies, 'mood': 'light', 'limit': 5}
+    response = client.get('/recommendations/movie', params=params)
+    assert response.status_code == 200 and response.headers['cache-control'].startswith('public')
+    etag = response.headers['etag']
+    # Title order and case do not change the query
+    same = client.get('/recommendations/movie', params={**params, 'title': [t.upper() for t in movies[::-1]]},
+                      headers={'If-None-Match': etag})
+    assert same.status_code == 304 and same.headers['etag'] == etag and not same.content
+    post = client.post('/recommendations/', json={'domain': 'movie', 'titles': movies, 'mood': 'light', 'limit': 5})
+    assert post.json() == response.json()
+
+    app.upsert_items('movie', [{'item_id': 'tt9999999', 'title': 'Brand New Film', 'genre': 'Drama'}])
+    changed = client.get('/recommendations/movie', params=params, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['etag'] != etag
+
+
+def test_post_responses_are_private_and_never_304(movies, client):
+    body = {'domain': 'movie', 'titles': movies}
+    response = client.post('/recommendations/', json=body)
+    assert response.headers['cache-control'].startswith('private')
+    again = client.post('/recommendations/', json=body, headers={'If-None-Match': response.headers['etag']})
+    assert again.status_code == 200 and again.json() == response.json()
+
+
+def test_get_needs_titles_and_a_served_domain(client):
+    assert client.get('/recommendations/movie').status_code == 400
+    assert client.get('/recommendations/music', params={'title': 'x'}).status_code == 404
@@ -0,0 +1,97 @@
+import os
+import signal
+
+import numpy as np
+import pytest
+from sklearn.neighbors import NearestNeighbors
+
+import app
+import sharded_knn
+from ann_index import recall_at_k
+from sharded_knn import ShardedKNN
+from synthetic import make_catalog
+
+
+@pytest.fixture(scope='module')
+def vectors():
+    return np.random.default_rng(0).normal(size=(3000, 16)).astype(np.float32)
+
+
+@pytest.fixture(scope='module')
+def baseline(vectors):
+    return NearestNeighbors(metric='cosine').fit(vectors).kneighbors(vectors[:25], 10)
+
+
+def assert_same_neighbors(found, expected):
+    distances, indices = found
+    np.testing.assert_array_equal(indices, expected[1])
+    np.testing.assert_allclose(distances, expected[0], atol=1e-5)
+
+
+def test_sharded_matches_exact(vectors, baseline):
+    index = ShardedKNN(n_shards=3).fit(vectors)
+    assert_same_neighbors(index.kneighbors(vectors[:25], 10), baseline)
+    np.testing.assert_array_equal(index.kneighbors(vectors[:25], 10, return_distance=False), baseline[1])
+
+
+def test_sharded_backend_matches_the_exact_model(monkeypatch):
+    # Synthetic items share genres, so compare distances rather than tied ids
+    latent = app.fit_latent(make_catalog('anime', 3000), 'anime')
+    monkeypatch.setattr(app, 'KNN_SHARD_MIN_ROWS', 0)
+    monkeypatch.setattr(app, 'KNN_SHARDS', 2)
+    knn = app.fit_knn(latent, 'sharded')
+    assert isinstance(knn, ShardedKNN)
+    queries = np.arange(0, len(latent), 100)
+    assert recall_at_k(knn, latent, queries, k=6) == 1.0
+    np.testing.assert_allclose(knn.kneighbors(latent[queries], 6)[0],
+                               app.fit_knn(latent, 'exact').kneighbors(latent[queries], 6)[0], atol=1e-5)
+
+
+def test_sharded_falls_back_when_the_pool_breaks(vectors, baseline):
+    index = ShardedKNN(n_shards=2).fit(vectors)
+    pool = sharded_knn.shard_pool(2)
+    index.kneighbors(vectors[:1])
+    for process in list(pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    assert_same_neighbors(index.kneighbors(vectors[:25], 10), baseline)
+    # The broken pool was replaced
+    assert sharded_knn.shard_pool(2) is not pool
+    assert_same_neighbors(index.kneighbors(vectors[:25], 10), baseline)
+
+
+def test_sharded_falls_back_on_timeout(vectors, baseline):
+    index = ShardedKNN(n_shards=2, timeout=0).fit(vectors)
+    assert_same_neighbors(index.kneighbors(vectors[:25], 10), baseline)
+
+
+def test_shard_files_are_counted_and_deleted_with_their_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'KNN_BACKEND', 'sharded')
+    monkeypatch.setattr(app, 'KNN_SHARD_MIN_ROWS', 0)
+    monkeypatch.setattr(app, 'KNN_SHARDS', 2)
+    monkeypatch.setattr(app, 'KNN_SHARD_DIR', str(tmp_path))
+    df = make_catalog('anime', 2000)
+    catalog = app.set_dataset('anime', df)
+    latent, knn, _ = app.get_model(catalog, None, None, None)
+    assert isinstance(knn, ShardedKNN)
+    assert knn.nbytes == os.path.getsize(knn.path) >= latent.shape[0] * latent.shape[1] * 4
+    first = knn.path
+    del knn
+
+    record = df.iloc[5].to_dict()
+    for i in range(3):
+        app.upsert_items('anime', [{**record, 'item_id': 90000 + i, 'anime_id': 90000 + i, 'title': f"New {i}"}])
+        _, knn, _ = app.get_model(app.get_catalog('anime'), None, None, None)
+        assert len(knn.kneighbors(latent[:1], 5)[1][0]) == 5
+    # Only the file of the current model is left
+    assert os.listdir(tmp_path) == [os.path.basename(knn.path)] and knn.path != first
+
+
+def test_workers_unmap_deleted_shard_files(vectors, tmp_path):
+    old = ShardedKNN(n_shards=1, directory=str(tmp_path)).fit(vectors)
+    sharded_knn._vectors(old.path)
+    path = old.path
+    del old
+    assert not os.path.exists(path)
+    new = ShardedKNN(n_shards=1, directory=str(tmp_path)).fit(vectors)
+    sharded_knn._vectors(new.path)
+    assert path not in sharded_knn._mapped and new.path in sharded_knn._mapped
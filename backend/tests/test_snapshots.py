@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from genre_index import GenreIndex
+from snapshots import genre_column, load_snapshot, write_snapshot
+from synthetic import make_catalog
+
+
+def mapped(values):
+    """Whether an array is a view of a memory-mapped file."""
+    while isinstance(values, np.ndarray) and values.base is not None:
+        values = values.base
+    return type(values).__name__ == 'mmap'
+
+
+@pytest.mark.parametrize('domain', ['book', 'anime', 'movie'])
+def test_snapshot_round_trip_stays_mapped(domain, tmp_path):
+    df = make_catalog(domain, 2000)
+    df.loc[3, 'title'] = None
+    write_snapshot(tmp_path, domain, df)
+    loaded, genre_index = load_snapshot(tmp_path, domain)
+    assert list(loaded.columns) == list(df.columns)
+    for name in df.columns:
+        series = loaded[name]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            assert mapped(series.array.codes)
+            series = series.astype(object)
+        else:
+            assert mapped(series.to_numpy())
+        pd.testing.assert_series_equal(series, df[name], check_dtype=False)
+    np.testing.assert_array_equal(genre_index.words, GenreIndex.from_series(df[genre_column(domain)]).words)
+
+
+@pytest.mark.parametrize('domain', ['book', 'anime', 'movie'])
+def test_snapshot_catalogs_serve_like_the_frame(domain, tmp_path, client, monkeypatch):
+    df = make_catalog(domain, 2000, seed=5)
+    write_snapshot(tmp_path, domain, df)
+    titles = df['title'].iloc[[0, 1]].tolist()
+    body = {'domain': domain, 'titles': titles, 'limit': 20}
+
+    app.set_dataset(domain, df)
+    expected = client.post('/recommendations/', json=body).json()['recommendations']
+    monkeypatch.setattr(app, 'SNAPSHOT_DIR', str(tmp_path))
+    catalog = app.install_catalog(app.DATASET_LOADERS[domain]())
+    assert catalog.source == 'snapshot'
+    assert client.post('/recommendations/', json=body).json()['recommendations'] == expected
+
+    record = df.iloc[5].to_dict()
+    record.update(item_id=df['item_id'].iloc[9], title='Replaced Title')
+    app.upsert_items(domain, [record])
+    app.remove_items(domain, [df['item_id'].iloc[1]])
+    response = client.post('/recommendations/', json={**body, 'titles': ['Replaced Title']})
+    assert response.status_code == 200 and response.json()['recommendations']
@@ -0,0 +1,87 @@
+import numpy as np
+
+from title_index import OverlayTitleIndex, TitleIndex, substring_distance
+
+TITLES = ['Death Note', 'Fullmetal Alchemist', 'Attack on Titan', 'One Punch Man', 'My Hero Academia']
+
+
+def test_exact_and_prefix_lookups():
+    index = TitleIndex(TITLES + ['death note'])
+    assert index.exact('DEATH NOTE') == 0
+    assert index.exact('Death') is None
+    assert list(index.prefix('a')) == [2]
+    assert list(index.prefix('')) == sorted(range(6), key=lambda row: (TITLES + ['death note'])[row].lower())
+
+
+def test_first_match_agrees_with_a_substring_scan():
+    rng = np.random.default_rng(0)
+    words = ['the', 'man', 'one', 'note', 'attack', 'hero', 'a']
+    titles = [' '.join(rng.choice(words, rng.integers(1, 4))) for _ in range(300)] + [None]
+    index = TitleIndex(titles)
+    allowed = rng.random(len(titles)) < 0.5
+    for query in ['the', 'man one', 'a', 'ote', 'zzz', 'The Man', 'e n']:
+        expected = [row for row, title in enumerate(titles) if title and query.lower() in title]
+        assert index.first_match(query) == (expected[0] if expected else None)
+        expected = [row for row in expected if allowed[row]]
+        assert index.first_match(query, allowed) == (expected[0] if expected else None)
+
+
+def test_overlay_sees_changed_titles():
+    index = OverlayTitleIndex.with_changes(TitleIndex(TITLES), np.array([0, 5]), [None, 'Cowboy Bebop'], 6)
+    assert index.first_match('death note') is None
+    assert index.first_match('bebop') == 5
+    assert index.first_match('titan') == 2
+
+
+def reference_distance(pattern, text):
+    """Fewest edits turning pattern into some substring of text (plain DP)."""
+    row = [0] * (len(text) + 1)
+    for i, p in enumerate(pattern, 1):
+        previous, row = row, [i] + [0] * len(text)
+        for j, t in enumerate(text, 1):
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + (p != t))
+    return min(row)
+
+
+def test_substring_distance_matches_dp():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        pattern = ''.join(rng.choice(list('abcd'), rng.integers(1, 12)))
+        text = ''.join(rng.choice(list('abcd'), rng.integers(0, 30)))
+        assert substring_distance(pattern, text) == reference_distance(pattern, text)
+
+
+def test_substring_distance_long_pattern():
+    pattern = 'the lord of the rings the fellowship of the ring extended edition ' * 2
+    text = 'x' + pattern.replace('fellowship', 'felowship') + 'y'
+    assert substring_distance(pattern, text) == reference_distance(pattern, text) == 2
+
+
+def test_fuzzy_match_resolves_typos():
+    index = TitleIndex(TITLES)
+    assert index.first_match('Fulmetal Alchemist') is None
+    row, score = index.fuzzy_match('Fulmetal Alchemist')
+    assert row == 1 and 0.8 <= score < 1
+    assert index.fuzzy_match('atack on titan')[0] == 2
+    assert index.fuzzy_match('Cowboy Bebop') is None
+
+
+def test_fuzzy_match_respects_allowed_rows():
+    index = TitleIndex(TITLES)
+    allowed = np.ones(len(TITLES), dtype=bool)
+    allowed[0] = False
+    assert index.fuzzy_match('Deth Note', allowed) is None
+    assert index.fuzzy_match('Deth Note')[0] == 0
+
+
+def test_overlay_fuzzy_match_sees_changes():
+    index = OverlayTitleIndex.with_changes(TitleIndex(TITLES), np.array([0, 5]), [None, 'Cowboy Bebop'], 6)
+    assert index.fuzzy_match('Deth Note') is None
+    assert index.fuzzy_match('Cowboy Bebpo')[0] == 5
+
+
+def test_misspelled_titles_get_the_same_recommendations(sample, client):
+    sample('anime')
+    exact = client.post('/recommendations/', json={'domain': 'anime', 'titles': ['Death Note']}).json()
+    typo = client.post('/recommendations/', json={'domain': 'anime', 'titles': ['Deth Note']}).json()
+    assert typo['recommendations'] == exact['recommendations']
@@ -0,0 +1,346 @@
+import bisect
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def normalize_title(title):
+    """Normalize a user supplied title the way lookups compare them."""
+    return str(title).lower().strip()
+
+
+def substring_distance(pattern, text):
+    """Fewest edits turning pattern into some substring of text.
+
+    Myers' bit-parallel approximate matching: one column of the edit
+    distance matrix per character of text, held as bit vectors of pattern.
+    """
+    m = len(pattern)
+    if not m:
+        return 0
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    best = m
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+            if score < best:
+                best = score
+        # Matches may start anywhere in text, so row 0 stays at distance 0
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return best
+
+
+class TitleIndex:
+    """Lookup structures over a catalog's lowercased titles.
+
+    * an exact hash map from normalized title to its first row,
+    * the rows sorted by title, for prefix range queries,
+    * an inverted index from byte trigrams to the sorted rows containing them,
+      used to answer substring queries without scanning every title.
+
+    Titles are kept as one UTF-8 blob with row offsets; a substring of the
+    lowercased title is then a plain byte substring of its slice.
+    """
+
+    GRAM = 3
+    CHUNK = 256  # candidates verified per step of a substring lookup
+    FUZZY_POSTINGS = 20000  # trigram postings read per fuzzy lookup, rarest trigrams first
+    FUZZY_CANDIDATES = 32  # titles sharing the most trigrams that a fuzzy lookup scores
+    # What arrays() returns and from_arrays() takes
+    ARRAYS = ('valid', 'offsets', 'sorted_rows', 'gram_codes', 'gram_offsets', 'postings', 'blob')
+
+    def __init__(self, titles):
+        lowered = pd.Series(np.asarray(titles, dtype=object)).str.lower()
+        self.valid = lowered.notna().to_numpy()
+        lowered = lowered.tolist()
+        encoded = [t.encode('utf-8') if isinstance(t, str) else b'' for t in lowered]
+
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.blob = b''.join(encoded)
+
+        # Exact map keeps the first row of each title, like the original scan
+        self.exact_rows = {}
+        for row, (title, ok) in enumerate(zip(lowered, self.valid)):
+            if ok:
+                self.exact_rows.setdefault(title, row)
+
+        # Stable sort keeps rows with equal titles in ascending order
+        self.sorted_rows = np.array(
+            sorted(np.flatnonzero(self.valid), key=encoded.__getitem__), dtype=np.int64
+        )
+
+        self.gram_codes, self.gram_offsets, self.postings = self._build_grams(lengths)
+
+    def arrays(self):
+        """The index as arrays (and the title blob), for sharing between processes."""
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """An index over arrays from arrays(), e.g. memory-mapped ones.
+
+        It has no exact-title map, which would be a private copy of every
+        title; exact lookups binary search the sorted rows instead.
+        """
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        index.exact_rows = None
+        return index
+
+    def _build_grams(self, lengths):
+        data = np.frombuffer(self.blob, dtype=np.uint8).astype(np.int64)
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        if len(data) < self.GRAM:
+            return np.zeros(0, np.int64), np.zeros(1, np.int64), np.zeros(0, np.int32)
+
+        codes = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+        # Keep only windows that lie inside a single title
+        inside = rows[:-2] == rows[2:]
+        keys = np.sort((codes[inside] << 32) | rows[:-2][inside])
+        if not len(keys):
+            return np.zeros(0, np.int64), np.zeros(1, np.int64), np.zeros(0, np.int32)
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+
+        gram_of_key = keys >> 32
+        starts = np.flatnonzero(np.concatenate(([True], gram_of_key[1:] != gram_of_key[:-1])))
+        gram_codes = gram_of_key[starts]
+        gram_offsets = np.append(starts, len(keys)).astype(np.int64)
+        postings = (keys & 0xFFFFFFFF).astype(np.int32)
+        return gram_codes, gram_offsets, postings
+
+    def _posting(self, code):
+        i = np.searchsorted(self.gram_codes, code)
+        if i == len(self.gram_codes) or self.gram_codes[i] != code:
+            return None
+        return self.postings[self.gram_offsets[i]:self.gram_offsets[i + 1]]
+
+    def _contains(self, row, query):
+        return query in self.blob[self.offsets[row]:self.offsets[row + 1]]
+
+    def exact(self, title):
+        """Row of the first title equal to title (case-insensitive), or None."""
+        return self._exact_row(normalize_title(title))
+
+    def _exact_row(self, normalized):
+        if self.exact_rows is not None:
+            return self.exact_rows.get(normalized)
+        query = normalized.encode('utf-8')
+        key = lambda row: self.blob[self.offsets[row]:self.offsets[row + 1]]
+        # Equal titles are sorted by row, so the first of them is the first row
+        i = bisect.bisect_left(self.sorted_rows, query, key=key)
+        if i < len(self.sorted_rows) and key(self.sorted_rows[i]) == query:
+            return int(self.sorted_rows[i])
+        return None
+
+    def prefix(self, prefix):
+        """Rows whose title starts with prefix, ordered by title."""
+        query = normalize_title(prefix).encode('utf-8')
+        key = lambda row: self.blob[self.offsets[row]:self.offsets[row + 1]]
+        lo = bisect.bisect_left(self.sorted_rows, query, key=key)
+        # 0xFF never occurs in UTF-8, so it sorts after every extension of query
+        hi = bisect.bisect_left(self.sorted_rows, query + b'\xff', lo=lo, key=key)
+        return self.sorted_rows[lo:hi]
+
+    def first_match(self, title, allowed=None):
+        """Row of the first title containing title as a plain substring.
+
+        allowed, if given, is a boolean mask restricting which rows count.
+        Returns None when no allowed title contains the query.
+        """
+        normalized = normalize_title(title)
+        query = normalized.encode('utf-8')
+
+        # No match can come after the first exact one, so stop looking there
+        stop = len(self)
+        exact = self._exact_row(normalized)
+        if exact is not None and (allowed is None or allowed[exact]):
+            stop = exact
+
+        if len(query) < self.GRAM:
+            row = self._scan(query, allowed, stop)
+        else:
+            row = self._search_grams(query, allowed, stop)
+        return stop if row is None and stop < len(self) else row
+
+    def _scan(self, query, allowed, stop):
+        """Find short queries by searching the title blob in row order."""
+        if not query:
+            # An empty query is contained in every title
+            rows = np.flatnonzero(self.valid[:stop] if allowed is None else self.valid[:stop] & allowed[:stop])
+            return int(rows[0]) if len(rows) else None
+
+        start, end = 0, self.offsets[stop]
+        while True:
+            pos = self.blob.find(query, start, end)
+            if pos < 0:
+                return None
+            row = int(np.searchsorted(self.offsets, pos, side='right')) - 1
+            if allowed is not None and not allowed[row]:
+                start = self.offsets[row + 1]
+            elif pos + len(query) > self.offsets[row + 1]:
+                start = pos + 1  # match runs into the next title
+            else:
+                return row
+
+    def _search_grams(self, query, allowed, stop):
+        """Find long queries by intersecting trigram postings in row order."""
+        data = np.frombuffer(query, dtype=np.uint8).astype(np.int64)
+        codes = np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+        lists = []
+        for code in codes:
+            posting = self._posting(code)
+            if posting is None:
+                return None
+            lists.append(posting)
+        lists.sort(key=len)
+
+        rarest, others = lists[0], lists[1:]
+        rarest = rarest[:np.searchsorted(rarest, stop)]
+        for begin in range(0, len(rarest), self.CHUNK):
+            candidates = rarest[begin:begin + self.CHUNK]
+            if allowed is not None:
+                candidates = candidates[allowed[candidates]]
+            for posting in others:
+                if not len(candidates):
+                    break
+                idx = np.minimum(np.searchsorted(posting, candidates), len(posting) - 1)
+                candidates = candidates[posting[idx] == candidates]
+            for row in candidates:
+                if self._contains(row, query):
+                    return int(row)
+        return None
+
+    def fuzzy_match(self, title, allowed=None, threshold=0.8, deadline=None):
+        """(row, score) of the title containing title best up to typos, or None.
+
+        score is 1 - edits / len(title), for the fewest edits turning title
+        into a substring of the catalog title; the best score at or above
+        threshold wins, the first row on ties. Candidates are the titles
+        sharing the most of the query's trigrams, read rarest first. Past
+        deadline (a time.perf_counter() value) the best match so far is
+        returned.
+        """
+        query = normalize_title(title)
+        data = np.frombuffer(query.encode('utf-8'), dtype=np.uint8).astype(np.int64)
+        if len(data) < self.GRAM:
+            return None
+        codes = np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+        lists = sorted((p for p in map(self._posting, codes) if p is not None), key=len)
+        used, total = [], 0
+        for posting in lists:
+            if used and total + len(posting) > self.FUZZY_POSTINGS:
+                break
+            used.append(posting)
+            total += len(posting)
+        if not used:
+            return None
+
+        rows, counts = np.unique(np.concatenate(used), return_counts=True)
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, counts = rows[keep], counts[keep]
+        # Each edit breaks at most GRAM of the query's trigrams
+        max_edits = int((1 - threshold) * len(query))
+        keep = counts >= max(1, len(used) - self.GRAM * max_edits)
+        rows, counts = rows[keep], counts[keep]
+        order = np.lexsort((rows, -counts))[:self.FUZZY_CANDIDATES]
+
+        best = None
+        for row, count in zip(rows[order], counts[order]):
+            # Fewer shared trigrams bound the score; counts only decrease from here
+            if best is not None and 1 - -(-(len(used) - count) // self.GRAM) / len(query) < best[1]:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            text = self.blob[self.offsets[row]:self.offsets[row + 1]].decode('utf-8')
+            score = 1 - substring_distance(query, text) / len(query)
+            if score >= threshold and (best is None or score > best[1] or score == best[1] and row < best[0]):
+                best = (int(row), score)
+        return best
+
+    @property
+    def nbytes(self):
+        return (len(self.blob) + self.offsets.nbytes + self.sorted_rows.nbytes
+                + self.gram_codes.nbytes + self.gram_offsets.nbytes + self.postings.nbytes)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class OverlayTitleIndex:
+    """A TitleIndex with some rows replaced, removed or appended, without rebuilding it.
+
+    Changed rows are hidden from the base index and looked up in a small
+    TitleIndex over their new titles; removed rows have no title at all.
+    Lookups return the first matching row of either part, so answers are
+    the same as those of a TitleIndex rebuilt over the updated titles.
+    """
+
+    def __init__(self, base, changes, n_rows):
+        self.base = base
+        self.changes = changes  # row -> new title, or None once removed
+        self.n_rows = n_rows
+        self.stale = np.zeros(len(base), dtype=bool)
+        changed = np.fromiter(changes, dtype=np.int64, count=len(changes))
+        self.stale[changed[changed < len(base)]] = True
+        self.rows = np.array(sorted(row for row, title in changes.items() if title is not None), dtype=np.int64)
+        self.overlay = TitleIndex([changes[row] for row in self.rows])
+
+    @classmethod
+    def with_changes(cls, index, rows, titles, n_rows):
+        """index with rows set to titles (None removes a row), covering n_rows rows."""
+        if isinstance(index, cls):
+            base, changes = index.base, dict(index.changes)
+        else:
+            base, changes = index, {}
+        changes.update(zip((int(row) for row in rows), titles))
+        return cls(base, changes, n_rows)
+
+    def first_match(self, title, allowed=None):
+        """Row of the first title containing title, as TitleIndex.first_match."""
+        base_allowed = ~self.stale if allowed is None else ~self.stale & allowed[:len(self.base)]
+        row = self.base.first_match(title, base_allowed)
+        if len(self.rows):
+            found = self.overlay.first_match(title, None if allowed is None else allowed[self.rows])
+            if found is not None and (row is None or self.rows[found] < row):
+                row = int(self.rows[found])
+        return row
+
+    def fuzzy_match(self, title, allowed=None, threshold=0.8, deadline=None):
+        """(row, score) of the closest title up to typos, as TitleIndex.fuzzy_match."""
+        base_allowed = ~self.stale if allowed is None else ~self.stale & allowed[:len(self.base)]
+        best = self.base.fuzzy_match(title, base_allowed, threshold, deadline)
+        if len(self.rows):
+            found = self.overlay.fuzzy_match(title, None if allowed is None else allowed[self.rows],
+                                             threshold, deadline)
+            if found is not None:
+                found = (int(self.rows[found[0]]), found[1])
+                if best is None or found[1] > best[1] or found[1] == best[1] and found[0] < best[0]:
+                    best = found
+        return best
+
+    @property
+    def nbytes(self):
+        return self.base.nbytes + self.stale.nbytes + self.overlay.nbytes
+
+    def __len__(self):
+        return self.n_rows